@@ -0,0 +1,101 @@
+import os
+import glob
+import json
+from datetime import datetime
+from typing import List, Dict, Any
+
+from .core import PythonPromptPex
+from .utils.helpers import logger
+from .utils.llm_client import LLMClient
+from .utils.concurrency import map_ordered
+
+# Summary counters added up across prompts in the batch index
+SUMMARY_TOTALS = ("total_rules", "total_tests", "valid_tests", "test_results", "compliant_tests")
+
+
+def find_prompt_files(source: str) -> List[str]:
+    """Find the prompt files of a batch.
+    
+    Args:
+        source: Directory searched recursively for .prompty files, or a glob pattern
+    
+    Returns:
+        Sorted list of prompt file paths
+    """
+    if os.path.isdir(source):
+        pattern = os.path.join(source, "**", "*.prompty")
+    else:
+        pattern = source
+    return sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+
+
+def run_batch(prompt_files: List[str], output_dir: str, llm_client: LLMClient,
+              prompt_workers: int = 1, resume: bool = False, **options) -> Dict[str, Any]:
+    """Run PromptPex on many prompts, sharing one client and its request budget.
+    
+    Each prompt writes its results to ``<output_dir>/<relative path>/<name>.json``
+    (with its own promptpex_components folder) and an aggregated index is
+    written to ``<output_dir>/index.json``, along with the LLM call metrics of
+    the whole batch in ``<output_dir>/metrics.json``.
+    
+    Args:
+        prompt_files: Prompt files to process
+        output_dir: Directory receiving the per-prompt outputs and the index
+        llm_client: Client shared by all prompts
+        prompt_workers: Number of prompts processed concurrently
+        resume: Resume each prompt from the journal of a previous, interrupted batch
+        **options: Additional PythonPromptPex options (models_to_test, runs_per_test, ...)
+    
+    Returns:
+        The aggregated index
+    """
+    base_dir = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in prompt_files]) \
+        if prompt_files else ""
+    
+    def process(prompt_file: str) -> Dict[str, Any]:
+        relative = os.path.relpath(os.path.abspath(prompt_file), base_dir)
+        name = os.path.splitext(os.path.basename(relative))[0]
+        output_json = os.path.join(output_dir, os.path.splitext(relative)[0], f"{name}.json")
+        entry = {"prompt_file": prompt_file, "output_json": output_json}
+        try:
+            integrator = PythonPromptPex(llm_client=llm_client, **options)
+            results = integrator.run(prompt_file, output_json, resume=resume)
+            entry["status"] = results.get("status", "ok")
+            if results.get("reason"):
+                entry["reason"] = results["reason"]
+            entry["summary"] = results.get("summary", {})
+        except Exception as e:
+            logger.error(f"Error processing prompt {prompt_file}: {e}")
+            entry["status"] = "error"
+            entry["reason"] = str(e)
+        return entry
+    
+    logger.info(f"Running PromptPex on {len(prompt_files)} prompts")
+    entries = map_ordered(process, prompt_files, prompt_workers)
+    
+    totals = {"prompts": len(entries), "succeeded": 0, "failed": 0}
+    totals.update({key: 0 for key in SUMMARY_TOTALS})
+    for entry in entries:
+        if entry["status"] == "error":
+            totals["failed"] += 1
+            continue
+        totals["succeeded"] += 1
+        for key in SUMMARY_TOTALS:
+            totals[key] += entry["summary"].get(key, 0)
+    
+    index = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "totals": totals,
+        "prompts": entries
+    }
+    
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, "index.json")
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    logger.info(f"Batch index saved to {index_path}")
+    
+    with open(os.path.join(output_dir, "metrics.json"), 'w', encoding='utf-8') as f:
+        json.dump(llm_client.metrics.to_dict(), f, indent=2)
+    
+    return index
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from typing import Any, Dict, List
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from .batch import find_prompt_files, run_batch
+from .utils.file_utils import get_prompt_dir
+from .utils.mock_client import MockLLMClient
+
+DEFAULT_SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(get_prompt_dir())), "samples")
+
+
+def parse_int_list(value: str) -> List[int]:
+    """Parse a comma-separated list of integers."""
+    try:
+        return [int(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected comma-separated integers, got '{value}'")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process in megabytes, if known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(prompt_files: List[str], scenario: Dict[str, Any],
+                 mock_options: Dict[str, Any], pipeline_options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the full pipeline on every prompt with a mock client and measure it.
+    
+    Args:
+        prompt_files: Prompt files to process
+        scenario: Number of "rules", "models" and "runs" of the scenario
+        mock_options: MockLLMClient options (latency, error rates, ...)
+        pipeline_options: PythonPromptPex options shared by all scenarios
+    
+    Returns:
+        The scenario with its measurements
+    """
+    client = MockLLMClient(num_rules=scenario["rules"],
+                           max_concurrency=max(1, pipeline_options.get("max_concurrency", 1)),
+                           **mock_options)
+    models = [f"mock-{i}" for i in range(1, scenario["models"] + 1)]
+    
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        index = run_batch(prompt_files, output_dir, client, models_to_test=models,
+                          runs_per_test=scenario["runs"], **pipeline_options)
+        wall_time = time.perf_counter() - start
+    
+    totals = index["totals"]
+    return {
+        **scenario,
+        "prompts": totals["prompts"],
+        "failed": totals["failed"],
+        "tests": totals["total_tests"],
+        "test_results": totals["test_results"],
+        "llm_calls": client.calls,
+        "wall_time": round(wall_time, 3),
+        "calls_per_second": round(client.calls / wall_time, 1) if wall_time > 0 else None,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def _run_isolated(args) -> Dict[str, Any]:
+    logging.getLogger().setLevel(args[-1])
+    return run_scenario(*args[:-1])
+
+
+def main(argv=None):
+    """Entry point of ``python -m promptpex.benchmark``."""
+    parser = argparse.ArgumentParser(prog="python -m promptpex.benchmark",
+                                     description="Benchmark the PromptPex pipeline offline with a mock LLM backend.")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES_DIR, help="Directory searched recursively for .prompty files, or a glob pattern (default: the samples directory).")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N prompts.")
+    parser.add_argument("--rules", type=parse_int_list, default=[3, 10], help="Comma-separated numbers of rules extracted per prompt, one scenario each.")
+    parser.add_argument("--models", type=parse_int_list, default=[1, 3], help="Comma-separated numbers of models under test, one scenario each.")
+    parser.add_argument("--runs", type=parse_int_list, default=[1, 3], help="Comma-separated runs per test, one scenario each.")
+    parser.add_argument("--tests-per-rule", type=int, default=3, help="Number of tests generated per rule.")
+    parser.add_argument("--max-concurrency", type=int, default=1, help="Maximum number of in-flight requests when running tests.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker threads of the pipeline.")
+    parser.add_argument("--prompt-workers", type=int, default=1, help="Number of prompts processed concurrently.")
+    parser.add_argument("--judge-batch-size", type=int, default=1, help="Number of test outputs graded per compliance evaluation request.")
+    parser.add_argument("--validity-batch-size", type=int, default=1, help="Number of test inputs checked per test validity request.")
+    parser.add_argument("--early-stop-confidence", type=float, default=None, help="Stop running a test on a model once its compliance outcome is stable at this confidence.")
+    parser.add_argument("--near-duplicate-threshold", type=float, default=None, help="Drop rule tests whose input is a near-duplicate of another test's at this similarity.")
+    parser.add_argument("--generation-batch-size", type=int, default=1, help="Number of rules sent per test generation request.")
+    parser.add_argument("--stream-results", action="store_true", help="Stream test results to disk instead of keeping them in memory.")
+    parser.add_argument("--no-multi-sample", action="store_false", dest="multi_sample", help="Request the runs of a test one at a time instead of in one request (n > 1).")
+    parser.add_argument("--max-samples", type=int, default=None, help="Largest n accepted by the simulated deployments; larger multi-sample requests are rejected.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean simulated latency of an LLM request in seconds.")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Maximum random deviation from the mean latency in seconds.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a simulated 500 error.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Probability of a simulated 429 error.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated latency and errors.")
+    parser.add_argument("--in-process", action="store_true", help="Run all scenarios in this process instead of one fresh process each; peak RSS then only grows across scenarios.")
+    parser.add_argument("--output", default=None, help="Path to save the results as JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline logs.")
+    
+    args = parser.parse_args(argv)
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.getLogger().setLevel(log_level)
+    
+    prompt_files = find_prompt_files(args.samples)[:args.limit]
+    if not prompt_files:
+        print(f"No prompt files found in {args.samples}")
+        return
+    
+    mock_options = {
+        "latency": args.latency,
+        "latency_jitter": args.latency_jitter,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+        "max_samples": args.max_samples,
+        "seed": args.seed
+    }
+    pipeline_options = {
+        "tests_per_rule": args.tests_per_rule,
+        "max_concurrency": args.max_concurrency,
+        "workers": args.workers,
+        "prompt_workers": args.prompt_workers,
+        "judge_batch_size": args.judge_batch_size,
+        "validity_batch_size": args.validity_batch_size,
+        "generation_batch_size": args.generation_batch_size,
+        "stream_results": args.stream_results,
+        "multi_sample": args.multi_sample,
+        "early_stop_confidence": args.early_stop_confidence,
+        "near_duplicate_threshold": args.near_duplicate_threshold
+    }
+    scenarios = [{"rules": rules, "models": models, "runs": runs}
+                 for rules in args.rules for models in args.models for runs in args.runs]
+    
+    print(f"Benchmarking {len(scenarios)} scenarios on {len(prompt_files)} prompts")
+    header = f"{'rules':>5} {'models':>6} {'runs':>4} {'results':>8} {'calls':>7} {'wall s':>8} {'calls/s':>9} {'RSS MB':>7}"
+    print(header)
+    print("-" * len(header))
+    
+    results = []
+    for scenario in scenarios:
+        if args.in_process:
+            result = run_scenario(prompt_files, scenario, mock_options, pipeline_options)
+        else:
+            # A fresh process per scenario so its peak RSS is measured on its own
+            with multiprocessing.get_context().Pool(1) as pool:
+                result = pool.apply(_run_isolated, ((prompt_files, scenario, mock_options,
+                                                     pipeline_options, log_level),))
+        results.append(result)
+        print(f"{result['rules']:>5} {result['models']:>6} {result['runs']:>4} {result['test_results']:>8} "
+              f"{result['llm_calls']:>7} {result['wall_time']:>8} {result['calls_per_second']:>9} "
+              f"{result['peak_rss_mb']:>7}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "options": {**mock_options, **pipeline_options},
+                       "prompts": prompt_files, "scenarios": results}, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,277 @@
 import argparse
 import json
 import os
+import sys
 import logging
 
-from .core import PythonPromptPex
+from .core import PythonPromptPex, default_azure_config
+from .batch import find_prompt_files, run_batch
+from .utils.cache import ResponseCache, DEFAULT_CACHE_DIR
+from .utils.budget import RequestBudget
+from .utils.llm_client import AzureOpenAIClient, PlanningClient
+from .utils.planner import DEFAULT_PLAN_RULES, format_plan
+from .utils.rate_limit import RateLimiter, RetryPolicy
 
 logger = logging.getLogger(__name__)
 
+def parse_model_limits(value: str) -> dict:
+    """Parse a 'model=limit,model=limit' list into a dictionary."""
+    limits = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        model, sep, limit = item.partition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected model=limit, got '{item}'")
+        try:
+            limits[model.strip()] = int(limit)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid limit for model '{model.strip()}': '{limit}'")
+    return limits
+
+def parse_deployment_rate_limits(value: str) -> dict:
+    """Parse a 'model=rpm:tpm,...' list into a dictionary of (rpm, tpm) tuples."""
+    limits = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        model, sep, quota = item.partition('=')
+        rpm, _, tpm = quota.partition(':')
+        try:
+            if not sep:
+                raise ValueError()
+            limits[model.strip()] = (float(rpm) if rpm.strip() else None,
+                                     float(tpm) if tpm.strip() else None)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Expected model=rpm:tpm, got '{item}'")
+    return limits
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    """Add the options shared by single-prompt and batch runs."""
+    parser.add_argument("--models", help="Comma-separated list of Azure deployment names to test against (e.g., gpt-4o,gpt-35-turbo). Defaults to AZURE_OPENAI_DEPLOYMENT env var or 'gpt-4o'.", default=None)
+    parser.add_argument("--tests-per-rule", type=int, default=3, help="Number of tests to generate per rule.")
+    parser.add_argument("--runs-per-test", type=int, default=1, help="Number of times to run each test against each model.")
+    parser.add_argument("--no-generate-tests", action="store_false", dest="generate_tests", help="Disable test generation and execution.")
+    parser.add_argument("--max-concurrency", type=int, default=1, help="Maximum number of in-flight requests when running tests. Values above 1 run tests concurrently on the async client.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker threads used to run independent pipeline steps and per-rule generation and evaluation concurrently.")
+    parser.add_argument("--no-multi-sample", action="store_false", dest="multi_sample", help="Request the runs of a test one at a time instead of getting all --runs-per-test outputs in one request (n > 1).")
+    parser.add_argument("--early-stop-confidence", type=float, default=None, help="Stop running a test on a model once the majority compliance outcome of its runs is established at this confidence (e.g., 0.95). --runs-per-test is then the maximum number of runs, spent only on ambiguous tests.")
+    parser.add_argument("--near-duplicate-threshold", type=float, default=None, help="Drop rule tests whose input is a near-duplicate of another test's (estimated Jaccard similarity at least this, e.g., 0.8) before checking and running them. Dropped tests are listed in near_duplicates.csv.")
+    parser.add_argument("--no-dedup-tests", action="store_false", dest="dedup_test_inputs", help="Run every test separately, even when several tests share the same input.")
+    parser.add_argument("--judge-batch-size", type=int, default=1, help="Number of test outputs graded per compliance evaluation request. Values above 1 grade the outputs in batches once all tests ran, falling back to one request per output when a batch answer cannot be parsed.")
+    parser.add_argument("--judge-model", default=None, help="Azure deployment grading the compliance of test outputs. Defaults to AZURE_OPENAI_DEPLOYMENT env var or 'gpt-4o'.")
+    parser.add_argument("--validity-batch-size", type=int, default=1, help="Number of test inputs checked per test validity request against a single copy of the input specification.")
+    parser.add_argument("--generation-batch-size", type=int, default=1, help="Number of rules sent per test generation request, sharing a single copy of the prompt under test. Rules left without tests by a grouped answer are generated again one by one.")
+    parser.add_argument("--generation-token-budget", type=int, default=None, help="Group rules in test generation requests up to this estimated number of tokens (prompt and expected tests), at most --generation-batch-size rules when it is above 1.")
+    parser.add_argument("--model-concurrency", type=parse_model_limits, default=None, help="Comma-separated per-model limits on in-flight requests (e.g., gpt-4o=8,gpt-35-turbo=4).")
+    parser.add_argument("--rpm", type=float, default=None, help="Client-side requests per minute limit of each deployment.")
+    parser.add_argument("--tpm", type=float, default=None, help="Client-side tokens per minute limit of each deployment.")
+    parser.add_argument("--deployment-rate-limits", type=parse_deployment_rate_limits, default=None, help="Comma-separated per-deployment limits overriding --rpm/--tpm (e.g., gpt-4o=300:150000,gpt-35-turbo=:60000).")
+    parser.add_argument("--max-retries", type=int, default=5, help="Maximum number of retries of throttled (429) or transient errors, with exponential backoff.")
+    parser.add_argument("--max-requests", type=int, default=None, help="Hard limit on the LLM requests sent (retries included). When the budget runs short, tests are run fewer times, then fewer tests are run.")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Hard limit on the LLM tokens (prompt and completion) used. When the budget runs short, tests are run fewer times, then fewer tests are run.")
+    parser.add_argument("--stream-results", action="store_true", help="Stream test results to promptpex_components/test_results.jsonl and .csv as they complete instead of keeping them in memory and in the output JSON.")
+    parser.add_argument("--prometheus-metrics", action="store_true", help="Also export the LLM call metrics (latency, tokens, retries per model and step) in the Prometheus text format next to metrics.json.")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted run from its journal, skipping completed steps and test runs.")
+    add_cache_arguments(parser)
+
+def add_cache_arguments(parser: argparse.ArgumentParser):
+    """Add the options of the persistent LLM response cache."""
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Directory of the persistent LLM response cache (default: {DEFAULT_CACHE_DIR}).")
+    parser.add_argument("--no-cache", action="store_false", dest="use_cache", help="Disable the persistent LLM response cache.")
+    parser.add_argument("--cache-max-age-days", type=float, default=None, help="Evict cached responses older than this many days.")
+    parser.add_argument("--cache-max-size-mb", type=float, default=None, help="Evict least recently used cached responses above this size in megabytes.")
+
+def create_cache(args: argparse.Namespace):
+    """Create the response cache selected on the command line, if any."""
+    if not args.use_cache:
+        return None
+    return ResponseCache(
+        args.cache_dir,
+        max_age_seconds=args.cache_max_age_days * 86400 if args.cache_max_age_days else None,
+        max_size_bytes=int(args.cache_max_size_mb * 1024 * 1024) if args.cache_max_size_mb else None
+    )
+
+def create_rate_limiter(args: argparse.Namespace):
+    """Create the client-side rate limiter selected on the command line, if any.
+
+    The adaptive concurrency of each deployment may grow up to the largest
+    concurrency option of the command (e.g. --max-in-flight for batches).
+    """
+    if not (args.rpm or args.tpm or args.deployment_rate_limits):
+        return None
+    max_concurrency = max(getattr(args, option, 1) or 1 for option in
+                          ("max_concurrency", "workers", "prompt_workers", "max_in_flight"))
+    return RateLimiter(args.rpm, args.tpm, args.deployment_rate_limits, max_concurrency=max_concurrency)
+
+def create_budget(args: argparse.Namespace):
+    """Create the request and token budget selected on the command line, if any."""
+    if args.max_requests is None and args.max_tokens is None:
+        return None
+    return RequestBudget(args.max_requests, args.max_tokens)
+
+def print_budget(budget):
+    """Print the requests and tokens spent out of the budget."""
+    if budget is not None:
+        usage = budget.to_dict()
+        print(f"Budget: {usage['requests']} of {usage['max_requests'] or 'unlimited'} requests, "
+              f"{usage['tokens']} of {usage['max_tokens'] or 'unlimited'} tokens used, "
+              f"{usage['refused_requests']} requests refused")
+
+def pipeline_options(args: argparse.Namespace) -> dict:
+    """Collect the PythonPromptPex options selected on the command line."""
+    return {
+        "generate_tests": args.generate_tests,
+        "tests_per_rule": args.tests_per_rule,
+        "runs_per_test": args.runs_per_test,
+        "models_to_test": args.models.split(',') if args.models else None,
+        "max_concurrency": args.max_concurrency,
+        "workers": args.workers,
+        "judge_batch_size": args.judge_batch_size,
+        "judge_model": args.judge_model,
+        "validity_batch_size": args.validity_batch_size,
+        "generation_batch_size": args.generation_batch_size,
+        "generation_token_budget": args.generation_token_budget,
+        "stream_results": args.stream_results,
+        "prometheus_metrics": args.prometheus_metrics,
+        "dedup_test_inputs": args.dedup_test_inputs,
+        "multi_sample": args.multi_sample,
+        "early_stop_confidence": args.early_stop_confidence,
+        "near_duplicate_threshold": args.near_duplicate_threshold
+    }
+
+def print_cache_stats(cache):
+    """Print the response cache hit rate."""
+    if cache is not None:
+        print(f"Response cache: {cache.hits} hits, {cache.misses} misses ({cache.path})")
+
+def batch_main(argv):
+    """Entry point of the 'batch' subcommand."""
+    parser = argparse.ArgumentParser(prog="promptpex batch", description="Run PromptPex analysis on every prompt of a library.")
+    parser.add_argument("source", help="Directory searched recursively for .prompty files, or a glob pattern (e.g., 'samples/**/*.prompty').")
+    parser.add_argument("output_dir", help="Directory to save the per-prompt results and the aggregated index.json.")
+    parser.add_argument("--prompt-workers", type=int, default=4, help="Number of prompts processed concurrently.")
+    parser.add_argument("--max-in-flight", type=int, default=32, help="Global limit on in-flight requests shared by all prompts.")
+    add_common_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    prompt_files = find_prompt_files(args.source)
+    if not prompt_files:
+        print(f"\nNo prompt files found in {args.source}")
+        return
+
+    cache = create_cache(args)
+    budget = create_budget(args)
+    llm_client = AzureOpenAIClient(
+        default_azure_config(),
+        max_concurrency=max(args.max_concurrency, 1),
+        model_concurrency=args.model_concurrency,
+        cache=cache,
+        max_in_flight=args.max_in_flight,
+        rate_limiter=create_rate_limiter(args),
+        retry_policy=RetryPolicy(max_retries=args.max_retries),
+        budget=budget
+    )
+
+    index = run_batch(prompt_files, args.output_dir, llm_client,
+                      prompt_workers=args.prompt_workers, resume=args.resume,
+                      **pipeline_options(args))
+
+    print("\n--- PromptPex Batch Summary ---")
+    print(json.dumps(index["totals"], indent=2))
+    for entry in index["prompts"]:
+        if entry["status"] == "error":
+            print(f"Failed: {entry['prompt_file']}: {entry.get('reason')}")
+    print(f"\nIndex saved to: {os.path.join(args.output_dir, 'index.json')}")
+    print_cache_stats(cache)
+    print_budget(budget)
+
+def regrade_main(argv):
+    """Entry point of the 'regrade' subcommand."""
+    parser = argparse.ArgumentParser(prog="promptpex regrade", description="Grade the compliance of the test outputs of a previous run again, without running the tests again.")
+    parser.add_argument("results_json", help="Path to the output JSON results file of a previous run.")
+    parser.add_argument("output_json", nargs="?", default=None, help="Path to save the regraded results (default: overwrite results_json).")
+    parser.add_argument("--judge-model", default=None, help="Azure deployment grading the compliance of test outputs. Defaults to AZURE_OPENAI_DEPLOYMENT env var or 'gpt-4o'.")
+    parser.add_argument("--judge-batch-size", type=int, default=1, help="Number of test outputs graded per compliance evaluation request.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of compliance evaluation requests sent concurrently.")
+    parser.add_argument("--max-retries", type=int, default=5, help="Maximum number of retries of throttled (429) or transient errors, with exponential backoff.")
+    parser.add_argument("--stream-results", action="store_true", help="Write the regraded test results to promptpex_components/test_results.jsonl and .csv instead of the output JSON.")
+    parser.add_argument("--prometheus-metrics", action="store_true", help="Also export the LLM call metrics in the Prometheus text format next to metrics.json.")
+    add_cache_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    cache = create_cache(args)
+
+    integrator = PythonPromptPex(
+        workers=args.workers,
+        judge_batch_size=args.judge_batch_size,
+        judge_model=args.judge_model,
+        stream_results=args.stream_results,
+        prometheus_metrics=args.prometheus_metrics,
+        cache=cache,
+        retry_policy=RetryPolicy(max_retries=args.max_retries)
+    )
+
+    output_json = args.output_json or args.results_json
+    results = integrator.regrade(args.results_json, output_json)
+
+    if results.get("status") == "error":
+        print(f"\nPromptPex regrade failed: {results.get('reason')}")
+    else:
+        print("\n--- PromptPex Summary (regraded) ---")
+        print(json.dumps(results['summary'], indent=2))
+        print(f"\nRegraded results saved to: {output_json}")
+
+    print_cache_stats(cache)
+
 def main():
     """Main entry point for the PromptPex CLI."""
     logging.basicConfig(level=logging.INFO)
 
-    parser = argparse.ArgumentParser(description="Run PromptPex analysis on a prompt file.")
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "regrade":
+        regrade_main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="Run PromptPex analysis on a prompt file. Use 'batch' as the first argument to process a whole prompt library, or 'regrade' to grade the outputs of a previous run again.")
     parser.add_argument("prompt_file", help="Path to the .prompty file to analyze.")
     parser.add_argument("output_json", help="Path to save the main output JSON results file.")
-    parser.add_argument("--models", help="Comma-separated list of Azure deployment names to test against (e.g., gpt-4o,gpt-35-turbo). Defaults to AZURE_OPENAI_DEPLOYMENT env var or 'gpt-4o'.", default=None)
-    parser.add_argument("--tests-per-rule", type=int, default=3, help="Number of tests to generate per rule.")
-    parser.add_argument("--runs-per-test", type=int, default=1, help="Number of times to run each test against each model.")
-    parser.add_argument("--no-generate-tests", action="store_false", dest="generate_tests", help="Disable test generation and execution.")
+    parser.add_argument("--plan", action="store_true", help="Only print the estimated requests and tokens of each step of the run, and whether they fit in --max-requests/--max-tokens, without calling any model.")
+    parser.add_argument("--plan-rules", type=int, default=DEFAULT_PLAN_RULES, help=f"Number of output rules assumed by --plan (default: {DEFAULT_PLAN_RULES}).")
+    parser.add_argument("--incremental", metavar="PREVIOUS_JSON", default=None, help="Re-run incrementally against the results JSON of a previous run of the prompt: unchanged rules keep their tests and only added rules get new ones. Test results are kept only when the prompt is unchanged, so that only missing test runs (e.g., of newly added models) are run; after a prompt edit, all tests are run again.")
+    add_common_arguments(parser)
 
     args = parser.parse_args()
 
-    models_list = args.models.split(',') if args.models else None
+    budget = create_budget(args)
+
+    if args.plan:
+        # Planning sends no request, so no Azure OpenAI client is needed
+        planner = PythonPromptPex(llm_client=PlanningClient(default_azure_config(), budget=budget),
+                                  **pipeline_options(args))
+        try:
+            print(format_plan(planner.plan(args.prompt_file, num_rules=args.plan_rules)))
+        except FileNotFoundError:
+            print(f"\nPrompt file not found: {args.prompt_file}")
+        return
+
+    cache = create_cache(args)
 
     integrator = PythonPromptPex(
-        generate_tests=args.generate_tests,
-        tests_per_rule=args.tests_per_rule,
-        runs_per_test=args.runs_per_test,
-        models_to_test=models_list
+        model_concurrency=args.model_concurrency,
+        cache=cache,
+        rate_limiter=create_rate_limiter(args),
+        retry_policy=RetryPolicy(max_retries=args.max_retries),
+        budget=budget,
+        **pipeline_options(args)
     )
 
-    results = integrator.run(args.prompt_file, args.output_json)
+    results = integrator.run(args.prompt_file, args.output_json, resume=args.resume,
+                             previous_results=args.incremental)
 
     if results and results.get("status") != "error" and "summary" in results:
         print("\n--- PromptPex Summary ---")
@@ -43,5 +284,8 @@ def main():
     else:
         print("\nPromptPex run finished.")
 
+    print_cache_stats(cache)
+    print_budget(budget)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
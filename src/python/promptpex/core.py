@@ -1,19 +1,54 @@
 import os
 import json
-import csv
-import io
-from typing import List, Dict, Any, Optional
+import asyncio
+import threading
+from itertools import zip_longest
+from typing import Callable, List, Dict, Any, Iterable, Optional, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
 
 from .utils.helpers import hash_string, logger
-from .utils.llm_client import AzureOpenAIClient
-from .utils.file_utils import parse_prompty_file, get_prompt_dir, read_prompt_file
+from .utils.llm_client import AzureOpenAIClient, LLMClient
+from .utils.cache import ResponseCache
+from .utils.rate_limit import RateLimiter, RetryPolicy, estimate_tokens
+from .utils.file_utils import get_prompt_dir, read_prompt_file
+from .utils.concurrency import map_ordered
+from .utils.scheduler import PipelineStep, StepScheduler
+from .utils.journal import RunJournal
+from .utils.result_sink import ResultSink, TEST_RESULTS_CSV_HEADER, format_test_result_row
+from .utils.summary import SummaryAggregator
+from .utils.metrics import metric_scope
+from .utils.templates import get_template_registry
+from .utils.parsers import ParseStats, parse_rule_id, parse_test_cases
+from .utils.report import write_html_report
+from .utils.budget import BudgetExceededError, RequestBudget
+from .utils.stopping import min_stable_runs, outcome_stable
+from .utils.near_duplicates import find_near_duplicates
+from .utils.incremental import PreviousRun, diff_rules, load_results
+from .utils.planner import (DEFAULT_PLAN_RULES, ESTIMATED_TOKENS, PLAN_STEPS, StepPlan, count_tokens,
+                            placeholder_text, plan_totals, tokenizer_name)
 
 load_dotenv()
 
 PROMPT_DIR = get_prompt_dir()
 
+# Templates used by the pipeline, checked when it is created
+PIPELINE_TEMPLATES = (
+    "generate_intent", "generate_input_spec", "generate_output_rules", "generate_inverse_rules",
+    "generate_tests", "generation/generate_baseline_tests", "evals/eval_rule_grounded",
+    "evals/eval_test_validity", "evals/eval_test_validity_batch", "evals/eval_test_result",
+    "evals/eval_test_result_batch"
+)
+
+
+def default_azure_config() -> Dict[str, str]:
+    """Read the Azure OpenAI configuration from the environment."""
+    return {
+        "azure_endpoint": os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+        "azure_deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION", "2025-03-01-preview")
+    }
+
 
 class PythonPromptPex:
     def __init__(self, 
@@ -21,7 +56,26 @@ class PythonPromptPex:
                  generate_tests: bool = True,
                  tests_per_rule: int = 3,
                  runs_per_test: int = 1,
-                 models_to_test: Optional[List[str]] = None):
+                 models_to_test: Optional[List[str]] = None,
+                 max_concurrency: int = 1,
+                 model_concurrency: Optional[Dict[str, int]] = None,
+                 workers: int = 1,
+                 judge_batch_size: int = 1,
+                 judge_model: Optional[str] = None,
+                 validity_batch_size: int = 1,
+                 generation_batch_size: int = 1,
+                 generation_token_budget: Optional[int] = None,
+                 stream_results: bool = False,
+                 prometheus_metrics: bool = False,
+                 dedup_test_inputs: bool = True,
+                 multi_sample: bool = True,
+                 early_stop_confidence: Optional[float] = None,
+                 near_duplicate_threshold: Optional[float] = None,
+                 cache: Optional[ResponseCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 budget: Optional[RequestBudget] = None,
+                 llm_client: Optional[LLMClient] = None):
         """Initialize the PromptPEX integrator with configuration.
         
         Args:
@@ -30,36 +84,124 @@ class PythonPromptPex:
             tests_per_rule: Number of tests to generate per rule
             runs_per_test: Number of times to run each test
             models_to_test: List of Azure deployment names to test against
+            max_concurrency: Maximum number of in-flight requests when running tests;
+                values above 1 run the test matrix on the async client
+            model_concurrency: Optional per-deployment limits on in-flight requests
+            workers: Number of worker threads for independent pipeline steps and for
+                per-rule generation and evaluation
+            judge_batch_size: Number of test outputs graded per compliance evaluation
+                request; values above 1 grade the outputs in batches after all tests ran
+            judge_model: Deployment grading the compliance of test outputs; defaults
+                to the configured deployment
+            validity_batch_size: Number of test inputs checked per test validity request
+            generation_batch_size: Number of rules sent per test generation request;
+                rules and inverse rules are generated in separate requests
+            generation_token_budget: Optional limit on the estimated tokens of a test
+                generation request (prompt and expected tests); rules are grouped until
+                the limit, at most ``generation_batch_size`` of them when it is above 1
+            stream_results: Stream test results to JSONL/CSV files as they complete
+                instead of keeping them in memory and in the output JSON
+            prometheus_metrics: Also export the LLM call metrics in the Prometheus
+                text format (metrics.prom)
+            dedup_test_inputs: Run identical test inputs (up to whitespace) once per
+                model and run, sharing the output between the tests using them
+            multi_sample: Get the outputs of all the runs of a test in one request
+                (n = runs_per_test) instead of one request per run; deployments not
+                supporting it are sent one request per run
+            early_stop_confidence: Stop running a test on a model once the majority
+                compliance outcome of its runs is established at this confidence (e.g.
+                0.95); ``runs_per_test`` is then the maximum number of runs, reached
+                only by ambiguous tests, and outputs are graded one by one as they
+                are collected
+            near_duplicate_threshold: Drop the rule tests whose input is a near-duplicate
+                of another test's (estimated Jaccard similarity of their character
+                shingles at least this, e.g. 0.8) before checking and running them,
+                keeping the first test of each cluster and of each rule
+            cache: Optional persistent cache of LLM responses
+            rate_limiter: Optional per-deployment requests/min and tokens/min limits
+            retry_policy: Optional retry policy for throttled and transient errors
+            budget: Optional hard limits on the requests and tokens of the run; when
+                they run short, tests are run fewer times, then fewer tests are run
+            llm_client: Optional client to reuse, e.g. one shared by all prompts of a
+                batch or an offline MockLLMClient; when given, its own concurrency,
+                cache and budget settings apply
         """
         self.generate_tests = generate_tests
         self.tests_per_rule = tests_per_rule
         self.runs_per_test = runs_per_test
         self.models_to_test = models_to_test or []
+        self.max_concurrency = max_concurrency
+        self.workers = workers
+        self.judge_batch_size = max(1, judge_batch_size)
+        self.judge_model = judge_model
+        self.validity_batch_size = max(1, validity_batch_size)
+        self.generation_batch_size = max(1, generation_batch_size)
+        self.generation_token_budget = generation_token_budget
+        self.stream_results = stream_results
+        self.prometheus_metrics = prometheus_metrics
+        self.dedup_test_inputs = dedup_test_inputs
+        self.multi_sample = multi_sample
+        self.early_stop_confidence = early_stop_confidence
+        self.near_duplicate_threshold = near_duplicate_threshold
 
         if azure_config is None:
-            azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "")
-            azure_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
-            api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2025-03-01-preview")
-            self.azure_config = {
-                "azure_endpoint": azure_endpoint,
-                "azure_deployment": azure_deployment,
-                "api_version": api_version
-            }
+            self.azure_config = llm_client.azure_config if llm_client else default_azure_config()
         else:
             self.azure_config = azure_config
 
         if not self.models_to_test:
             self.models_to_test = [self.azure_config["azure_deployment"]]
 
-        self.llm_client = AzureOpenAIClient(self.azure_config)
+        self.llm_client = llm_client or AzureOpenAIClient(self.azure_config,
+                                                          max_concurrency=max_concurrency,
+                                                          model_concurrency=model_concurrency,
+                                                          cache=cache,
+                                                          rate_limiter=rate_limiter,
+                                                          retry_policy=retry_policy,
+                                                          budget=budget)
+        self.templates = get_template_registry(PROMPT_DIR, required=PIPELINE_TEMPLATES)
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.journal: Optional[RunJournal] = None
+        self._completed_results: Dict[str, Dict[str, Any]] = {}
+        self.result_sink: Optional[ResultSink] = None
+        self.summary_aggregator: Optional[SummaryAggregator] = None
+        self._expected_results = 0
+        self._put_outputs: Dict[Tuple[Any, str], Dict[int, Dict[str, Any]]] = {}
+        self._shared_inputs: Dict[str, int] = {}
+        self._open_pairs: Dict[Tuple[str, str], int] = {}
+        self._dedup_stats = {}
+        self._budget_stats = {}
+        # Refusals are counted from the grading worker threads
+        self._budget_stats_lock = threading.Lock()
+        self._early_stop_stats = {}
+        self._runs = runs_per_test
+        self._previous_run: Optional[PreviousRun] = None
+        self.parse_stats = ParseStats()
 
-    def run(self, prompt_file_path: str, output_json_path: str) -> Dict[str, Any]:
+    def run(self, prompt_file_path: str, output_json_path: str, 
+            resume: bool = False, previous_results: Optional[str] = None) -> Dict[str, Any]:
         """Run the full PromptPEX pipeline.
         
+        Every completed step and test result is appended to a journal next to
+        the output JSON (``<output>.journal.jsonl``) as the run progresses. With
+        ``stream_results``, test results are written to
+        ``promptpex_components/test_results.jsonl`` instead of the output JSON.
+        
         Args:
             prompt_file_path: Path to the prompt file to test (PUT - Prompt Under Test)
             output_json_path: Path to save the main JSON results
+            resume: Reuse the steps and test results journaled by a previous,
+                interrupted run with the same output path
+            previous_results: Path to the JSON results of a previous run of the prompt
+                to re-run incrementally: rules are compared by their ``hash_string``
+                id, the unchanged rules keep their inverse rule and tests, and only the
+                added rules get new ones. Baseline tests are kept, and validity checks
+                too while the input specification is the same. Groundedness and test
+                results depend on the prompt text, so they are only kept when the
+                prompt is unchanged; then only the missing (test, model, run)
+                combinations, e.g. of newly added models, are run, and the intent,
+                input specification and rules are kept as well. Reused items are
+                marked with ``reused_from``.
             
         Returns:
             Dictionary with results
@@ -78,44 +220,361 @@ class PythonPromptPex:
         except Exception as e:
             logger.error(f"Error reading prompt file {prompt_file_path}: {e}")
             return {"status": "error", "reason": f"Error reading prompt file: {e}"}
+        
+        self._previous_run = None
+        if previous_results:
+            try:
+                self._previous_run = PreviousRun.load(previous_results)
+            except Exception as e:
+                logger.error(f"Error reading previous results {previous_results}: {e}")
+                return {"status": "error", "reason": f"Error reading previous results: {e}"}
 
         context = self._create_context_obj(prompt_content, prompt_file_path)
+        self.summary_aggregator = SummaryAggregator(self.models_to_test)
+        self.parse_stats = ParseStats()
+        
+        prompt_hash = hash_string(prompt_content)
+        self.journal = RunJournal(f"{os.path.splitext(output_json_path)[0]}.journal.jsonl")
+        previous = self.journal.load(prompt_hash) if resume else None
+        self._completed_results = {}
+        if previous:
+            context["name"] = previous["name"]
+            context.update(previous["steps"])
+            for key, value in previous["steps"].items():
+                self.summary_aggregator.add_step(key, value)
+            self._completed_results = {
+                result_id: result for result_id, result in previous["test_results"].items()
+                if "error" not in result
+            }
+            logger.info(f"Resuming {context['name']}: {len(previous['steps'])} steps and "
+                        f"{len(self._completed_results)} test results already completed")
+        self.journal.start(context["name"], prompt_hash, append=bool(previous))
+        
+        completed_steps = set(previous["steps"]) if previous else set()
+        prompt_changed = bool(self._previous_run) and self._previous_run.prompt_changed(prompt_content)
+        if self._previous_run and not prompt_changed:
+            # An unchanged prompt keeps the steps that only depend on the prompt
+            for key in ("intent", "input_spec", "rules"):
+                if key not in completed_steps and self._previous_run.context.get(key):
+                    context[key] = self._previous_run.context[key]
+                    self._complete_step(key, context[key])
+                    completed_steps.add(key)
 
-        logger.info("Step 1: Generating prompt intent (PUTI)")
-        context["intent"] = self._extract_intent(prompt_content)
+        self.result_sink = None
+        if self.stream_results:
+            self.result_sink = ResultSink(os.path.join(os.path.dirname(output_json_path), 
+                                                       "promptpex_components"))
+            self.result_sink.open()
+            context["test_results_file"] = os.path.join("promptpex_components", "test_results.jsonl")
+        
+        filter_inputs = ["test_filter"] if self.near_duplicate_threshold else []
+        steps = [
+            PipelineStep("intent", "Step 1: Generating prompt intent (PUTI)", ["prompt"],
+                         lambda ctx: self._extract_intent(ctx["prompt"])),
+            PipelineStep("input_spec", "Step 2: Generating input specification (IS)", ["prompt"],
+                         lambda ctx: self._generate_input_specification(ctx["prompt"])),
+            PipelineStep("rules", "Step 3: Extracting output rules (OR)", ["prompt"],
+                         lambda ctx: self._extract_output_rules(ctx["prompt"])),
+            PipelineStep("inverse_rules", "Step 4: Generating inverse output rules (IOR)", 
+                         ["rules", "prompt"],
+                         lambda ctx: self._generate_inverse_rules(ctx["rules"], ctx["prompt"])),
+            PipelineStep("rule_evaluations", "Step 5: Evaluating rule groundedness (ORG)", 
+                         ["rules", "prompt"],
+                         lambda ctx: self._evaluate_rules_groundedness(ctx["rules"], ctx["prompt"])),
+            PipelineStep("tests", "Step 6: Generating prompt tests (PPT)", 
+                         ["prompt", "input_spec", "rules", "inverse_rules"],
+                         lambda ctx: self._generate_tests(ctx["prompt"], ctx["input_spec"], 
+                                                          ctx["rules"], ctx["inverse_rules"])),
+            PipelineStep("baseline_tests", "Step 7: Generating baseline tests (BT)", ["prompt"],
+                         lambda ctx: self._generate_baseline_tests(ctx["prompt"])),
+            PipelineStep("test_validity", "Step 8: Evaluating test validity (TV)", 
+                         ["tests", "baseline_tests", "input_spec"] + filter_inputs,
+                         lambda ctx: self._evaluate_test_validity(self._selected_tests(ctx) + ctx["baseline_tests"], 
+                                                                  ctx["input_spec"])),
+            PipelineStep("test_results", "Step 9: Running tests and checking compliance (TO & TNC)", 
+                         ["prompt", "tests", "baseline_tests"] + filter_inputs,
+                         lambda ctx: self._run_tests(ctx["prompt"], self._selected_tests(ctx) + ctx["baseline_tests"])),
+        ]
+        
+        # Near-duplicate rule tests are filtered out locally before Steps 8 and 9
+        if self.near_duplicate_threshold:
+            steps.insert(6, PipelineStep("test_filter", "Step 6b: Filtering near-duplicate tests (NDT)", ["tests"],
+                                         lambda ctx: self._filter_near_duplicates(ctx["tests"])))
+        
+        if self._previous_run:
+            # Only the added rules get new inverse rules and tests; groundedness is
+            # evaluated again for all rules of a changed prompt
+            incremental = {
+                "inverse_rules": lambda ctx: self._reuse_inverse_rules(ctx["rules"], ctx["prompt"]),
+                "tests": lambda ctx: self._reuse_tests(ctx["prompt"], ctx["input_spec"], 
+                                                       ctx["rules"], ctx["inverse_rules"]),
+                "baseline_tests": lambda ctx: self._reuse_baseline_tests(ctx["prompt"]),
+                "test_validity": lambda ctx: self._reuse_test_validity(self._selected_tests(ctx) + ctx["baseline_tests"], 
+                                                                       ctx["input_spec"]),
+            }
+            if not prompt_changed:
+                incremental["rule_evaluations"] = lambda ctx: self._reuse_rule_evaluations(ctx["rules"], ctx["prompt"])
+            steps = [PipelineStep(step.key, step.label, step.inputs, incremental.get(step.key, step.func)) 
+                     for step in steps]
+        
+        steps = [step for step in steps if step.key not in completed_steps]
+        
+        # Independent steps (e.g. intent, input spec, rules and baseline tests) run concurrently
+        try:
+            # LLM call metrics are labelled with the run, and with the step by the scheduler
+            with metric_scope(run=context["name"]):
+                context["step_timings"] = StepScheduler(steps, self.workers, 
+                                                        on_complete=self._complete_step).run(context)
+        finally:
+            self.journal.close()
+            if self.result_sink:
+                self.result_sink.close()
+        
+        context["test_dedup"] = self._dedup_stats
+        if self._early_stop_stats:
+            context["early_stopping"] = self._early_stop_stats
+        if self.llm_client.budget and self.llm_client.budget.limited:
+            context["budget"] = {**self.llm_client.budget.to_dict(), **self._budget_stats}
+        if self.parse_stats.responses:
+            context["test_parsing"] = self.parse_stats.to_dict()
+        if self._previous_run:
+            context["incremental"] = self._incremental_stats(context)
+        
+        context["summary"] = self.summary_aggregator.summary()
+        
+        self._save_results(context, output_json_path)
         
-        logger.info("Step 2: Generating input specification (IS)")
-        context["input_spec"] = self._generate_input_specification(prompt_content)
+        return context
+    
+    def progress(self) -> Dict[str, Any]:
+        """Get a live snapshot of the summary of the current run.
         
-        logger.info("Step 3: Extracting output rules (OR)")
-        context["rules"] = self._extract_output_rules(prompt_content)
+        Safe to call from another thread while the pipeline runs, e.g. to feed a
+        progress dashboard. Besides the summary counters, the snapshot has the
+        compliance per rule ("rule_results") and per run ("run_results").
+        """
+        if self.summary_aggregator is None:
+            return {}
+        return self.summary_aggregator.snapshot()
+    
+    def regrade(self, results_json_path: str, output_json_path: Optional[str] = None) -> Dict[str, Any]:
+        """Grade the compliance (TNC) of the outputs of a previous run again.
         
-        logger.info("Step 4: Generating inverse output rules (IOR)")
-        context["inverse_rules"] = self._generate_inverse_rules(context["rules"], prompt_content)
+        The collected outputs (TO) are reused as they are, so only the judge is
+        called, e.g. to compare judge models or evaluator prompts without
+        running the prompt under test again.
         
-        logger.info("Step 5: Evaluating rule groundedness (ORG)")
-        context["rule_evaluations"] = self._evaluate_rules_groundedness(context["rules"], prompt_content)
+        Args:
+            results_json_path: Path to the JSON results of a previous run
+            output_json_path: Path to save the regraded results; defaults to
+                overwriting the previous results
         
-        logger.info("Step 6: Generating prompt tests (PPT)")
-        context["tests"] = self._generate_tests(prompt_content, context["input_spec"], 
-                                               context["rules"], context["inverse_rules"])
+        Returns:
+            Dictionary with the regraded results
+        """
+        output_json_path = output_json_path or results_json_path
+        try:
+            context, results = load_results(results_json_path)
+        except Exception as e:
+            logger.error(f"Error reading results {results_json_path}: {e}")
+            return {"status": "error", "reason": f"Error reading results: {e}"}
         
-        logger.info("Step 7: Generating baseline tests (BT)")
-        context["baseline_tests"] = self._generate_baseline_tests(prompt_content)
+        # Grading failures are retried; runs whose output could not be collected are not
+        for result in results:
+            for key in ("complianceText", "compliance", "compliance_matched"):
+                result.pop(key, None)
+            if result.get("output") != "ERROR":
+                result.pop("error", None)
         
-        logger.info("Step 8: Evaluating test validity (TV)")
-        context["test_validity"] = self._evaluate_test_validity(context["tests"] + context["baseline_tests"], 
-                                                             context["input_spec"])
+        logger.info(f"Regrading {sum(1 for r in results if r.get('rule'))} test outputs of "
+                    f"{context['name']} with {self.judge_model or 'the default deployment'}")
+        with metric_scope(run=context["name"]):
+            self._grade_results(context["prompt"], results)
         
-        logger.info("Step 9: Running tests and checking compliance (TO & TNC)")
-        context["test_results"] = self._run_tests(prompt_content, context["tests"] + context["baseline_tests"])
+        self.result_sink = None
+        context.pop("test_results_file", None)
+        if self.stream_results:
+            self.result_sink = ResultSink(os.path.join(os.path.dirname(output_json_path), 
+                                                       "promptpex_components"))
+            self.result_sink.open()
+            try:
+                for result in results:
+                    self.result_sink.write(result)
+            finally:
+                self.result_sink.close()
+            context["test_results_file"] = os.path.join("promptpex_components", "test_results.jsonl")
+            context["test_results"] = []
+        else:
+            context["test_results"] = results
         
-        context["summary"] = self._generate_summary(context)
+        context["regraded"] = {
+            "judge_model": self.judge_model,
+            "judge_batch_size": self.judge_batch_size,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.summary_aggregator = SummaryAggregator.from_context(context, results, self.models_to_test)
+        context["summary"] = self.summary_aggregator.summary()
         
         self._save_results(context, output_json_path)
         
         return context
     
+    def plan(self, prompt_file_path: str, num_rules: int = DEFAULT_PLAN_RULES) -> Dict[str, Any]:
+        """Estimate the requests and tokens of a run, per step, without calling any model.
+        
+        The prompts are rendered from the actual templates and prompt under test,
+        and counted with the models' tokenizer when tiktoken is installed. Rules,
+        tests and answers are not known before the run and are assumed to have
+        typical sizes (``planner.ESTIMATED_TOKENS``). Cached responses are not
+        deducted.
+        
+        Args:
+            prompt_file_path: Path to the prompt file to test (PUT - Prompt Under Test)
+            num_rules: Number of output rules assumed to be extracted
+        
+        Returns:
+            Plan with the requests and tokens of every step, their total, the
+            assumptions made and, with a client budget, how the run would fit in it
+        
+        Raises:
+            FileNotFoundError: If the prompt file doesn't exist
+        """
+        prompt = read_prompt_file(prompt_file_path)
+        steps = {key: StepPlan() for key in PLAN_STEPS}
+        rule = placeholder_text(ESTIMATED_TOKENS["rule"])
+        rules = [rule] * num_rules
+        input_spec = "\n".join([rule] * 5)
+        num_tests = 2 * num_rules * self.tests_per_rule + self.tests_per_rule
+        
+        steps["intent"].add(self._template_tokens("generate_intent", {"prompt": prompt}), 
+                            ESTIMATED_TOKENS["rule"])
+        steps["input_spec"].add(self._template_tokens("generate_input_spec", {"context": prompt}),
+                                count_tokens(input_spec))
+        steps["rules"].add(self._template_tokens("generate_output_rules", 
+                                                 {"instructions": "", "num_rules": 0, "input_data": prompt}),
+                           num_rules * ESTIMATED_TOKENS["rule"])
+        steps["inverse_rules"].add(self._template_tokens("generate_inverse_rules", 
+                                                         {"instructions": "", "rule": "\n".join(rules)}),
+                                   num_rules * ESTIMATED_TOKENS["rule"])
+        steps["rule_evaluations"].add(self._template_tokens("evals/eval_rule_grounded", 
+                                                            {"rule": rule, "description": prompt}),
+                                      ESTIMATED_TOKENS["evaluation"], num_rules)
+        
+        template = self.templates.get("generate_tests")
+        values = {"input_spec": input_spec, "context": prompt, "num": self.tests_per_rule, "num_rules": 1}
+        jobs = [(rule_id, rule, inverse) for inverse in (False, True) for rule_id in range(1, num_rules + 1)]
+        for group in self._group_rules(jobs, template.system.render(values)):
+            system_prompt, user_prompt = self._generation_prompts(template, values, group)
+            steps["tests"].add(count_tokens(system_prompt + user_prompt), 
+                               len(group) * self.tests_per_rule * ESTIMATED_TOKENS["test"])
+        steps["baseline_tests"].add(self._template_tokens("generation/generate_baseline_tests", 
+                                                          {"num": self.tests_per_rule, "prompt": prompt}),
+                                    self.tests_per_rule * ESTIMATED_TOKENS["test_input"])
+        
+        test_input = placeholder_text(ESTIMATED_TOKENS["test_input"])
+        if self.validity_batch_size > 1:
+            for start in range(0, num_tests, self.validity_batch_size):
+                size = min(self.validity_batch_size, num_tests - start)
+                tests_json = json.dumps([{"id": index, "input": test_input} for index in range(size)], indent=2)
+                steps["test_validity"].add(self._template_tokens("evals/eval_test_validity_batch", 
+                                                                 {"input_spec": input_spec, "tests": tests_json}),
+                                           size * ESTIMATED_TOKENS["evaluation"])
+        else:
+            steps["test_validity"].add(self._template_tokens("evals/eval_test_validity", 
+                                                             {"input_spec": input_spec, "test": test_input}),
+                                       ESTIMATED_TOKENS["evaluation"], num_tests)
+        
+        # Distinct inputs, rule tests first, then the baseline tests
+        rule_tests = num_tests - self.tests_per_rule
+        tests = [{"testinput": f"{test_input} {index}", "rule": rule if index < rule_tests else ""}
+                 for index in range(num_tests)]
+        outputs, compliance = self._plan_test_runs(prompt, tests, self.runs_per_test)
+        steps["test_results"], steps["test_compliance"] = outputs, compliance
+        
+        steps = {key: step.to_dict() for key, step in steps.items()}
+        plan = {
+            "prompt_file": prompt_file_path,
+            "tokenizer": tokenizer_name(),
+            "assumptions": {
+                "rules": num_rules,
+                "inverse_rules": num_rules,
+                "tests": num_tests,
+                "models": len(self.models_to_test),
+                "runs_per_test": self.runs_per_test,
+                "output_tokens": ESTIMATED_TOKENS["output"]
+            },
+            "steps": steps,
+            "total": plan_totals(steps)
+        }
+        
+        budget = self.llm_client.budget
+        if budget and budget.limited:
+            # Test runs get whatever the earlier steps leave
+            before = plan_totals({key: step for key, step in steps.items() 
+                                  if key not in ("test_results", "test_compliance")})
+            remaining = {
+                "requests": None if budget.max_requests is None else max(0, budget.max_requests - before["requests"]),
+                "tokens": None if budget.max_tokens is None else max(0, budget.max_tokens - before["total_tokens"])
+            }
+            selected, runs = self._fit_test_runs(prompt, tests, remaining)
+            plan["budget"] = {
+                "max_requests": budget.max_requests,
+                "max_tokens": budget.max_tokens,
+                "fits": runs == self.runs_per_test and len(selected) == len(tests),
+                "runs_per_test": runs,
+                "tests": len(selected),
+                "planned_tests": len(tests)
+            }
+        return plan
+    
+    def _complete_step(self, key: str, value: Any):
+        """Add a completed step to the summary and journal it."""
+        self.summary_aggregator.add_step(key, value)
+        self._record_step(key, value)
+    
+    def _record_step(self, key: str, value: Any):
+        """Journal a completed step so a resumed run can skip it."""
+        # Test results are journaled one by one as they complete; empty values
+        # usually mean the step failed, so it is retried on resume
+        if key != "test_results" and value:
+            self.journal.record_step(key, value)
+    
+    def _record_test_result(self, result: Dict[str, Any]):
+        """Journal a completed test result."""
+        if self.journal:
+            self.journal.record_test_result(result)
+    
+    def _complete_result(self, result: Dict[str, Any], new: bool = True) -> Optional[Dict[str, Any]]:
+        """Journal a finished test result, add it to the summary and stream it to the result sink, if any.
+        
+        Returns:
+            The result to keep in memory, or None if it was streamed
+        """
+        if new:
+            self._record_test_result(result)
+        if self.summary_aggregator:
+            self.summary_aggregator.add_test_result(result)
+            self._log_progress()
+        if self.result_sink:
+            self.result_sink.write(result)
+            return None
+        return result
+    
+    def _log_progress(self):
+        """Log the progress of the test runs about every 10%."""
+        done = self.summary_aggregator.test_results
+        step = max(1, self._expected_results // 10)
+        if self._expected_results and (done % step == 0 or done == self._expected_results):
+            logger.info(f"Test runs: {done}/{self._expected_results} "
+                        f"({round(done / self._expected_results * 100)}%), "
+                        f"{self.summary_aggregator.compliant_tests} compliant")
+    
+    def _iter_test_results(self, context: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        """Iterate the test results, reading them back from the sink when streamed."""
+        if self.result_sink:
+            return iter(self.result_sink)
+        return context.get("test_results", [])
+    
     def _create_context_obj(self, prompt_content: str, prompt_file_path: str) -> Dict[str, Any]:
         """Create the context object with proper naming for components."""
         prompt_name = os.path.splitext(os.path.basename(prompt_file_path))[0]
@@ -132,24 +591,48 @@ class PythonPromptPex:
             "baseline_tests": [],
             "test_validity": [],
             "test_results": [],
+            "step_timings": {},
+            "test_dedup": {},
+            "test_parsing": {},
+            "early_stopping": {},
+            "test_filter": {},
+            "incremental": {},
+            "budget": {},
             "summary": {}
         }
         return context
     
+    def _call_template(self, name: str, values: Dict[str, Any], 
+                       model: Optional[str] = None) -> str:
+        """Render a prompt template and return the content of the model's answer.
+        
+        The temperature and max_tokens of the template frontmatter, if any, are
+        used for the call.
+        
+        Args:
+            name: Name of the template, relative to the prompts directory (e.g. "evals/eval_test_result")
+            values: Values of the template placeholders
+            model: Model to use, defaults to the one in azure_config
+        """
+        template = self.templates.get(name)
+        system_prompt, user_prompt = template.render(values)
+        response = self.llm_client.call_openai(system_prompt, user_prompt, model=model, 
+                                               **template.parameters)
+        return response["choices"][0]["message"]["content"]
+    
+    async def _call_template_async(self, name: str, values: Dict[str, Any], 
+                                   model: Optional[str] = None) -> str:
+        """Async counterpart of ``_call_template``."""
+        template = self.templates.get(name)
+        system_prompt, user_prompt = template.render(values)
+        response = await self.llm_client.call_openai_async(system_prompt, user_prompt, model=model,
+                                                           **template.parameters)
+        return response["choices"][0]["message"]["content"]
+    
     def _extract_intent(self, prompt: str) -> str:
         """Extract the intent from the prompt (PUTI)."""
-        prompt_path = os.path.join(PROMPT_DIR, "generate_intent.prompty")
-        
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            user_prompt = user_prompt_template.replace("{{ prompt }}", prompt)
-            
-            response = self.llm_client.call_openai(system_prompt, user_prompt)
-            
-            intent = response["choices"][0]["message"]["content"].strip()
+            intent = self._call_template("generate_intent", {"prompt": prompt}).strip()
             return intent
             
         except Exception as e:
@@ -158,18 +641,8 @@ class PythonPromptPex:
     
     def _generate_input_specification(self, prompt: str) -> Dict[str, Any]:
         """Generate input specification from prompt (IS)."""
-        prompt_path = os.path.join(PROMPT_DIR, "generate_input_spec.prompty")
-        
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            user_prompt = user_prompt_template.replace("{{context}}", prompt)
-            
-            response = self.llm_client.call_openai(system_prompt, user_prompt)
-            
-            content = response["choices"][0]["message"]["content"].strip()
+            content = self._call_template("generate_input_spec", {"context": prompt}).strip()
             
             rules = [rule.strip() for rule in content.split("\n") if rule.strip()]
             
@@ -186,20 +659,9 @@ class PythonPromptPex:
     
     def _extract_output_rules(self, prompt: str) -> List[str]:
         """Extract output rules from prompt (OR)."""
-        prompt_path = os.path.join(PROMPT_DIR, "generate_output_rules.prompty")
-        
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            system_prompt = system_prompt.replace("{{instructions}}", "")
-            system_prompt = system_prompt.replace("{{num_rules}}", "0")
-            user_prompt = user_prompt_template.replace("{{input_data}}", prompt)
-            
-            response = self.llm_client.call_openai(system_prompt, user_prompt)
-            
-            content = response["choices"][0]["message"]["content"]
+            content = self._call_template("generate_output_rules", 
+                                          {"instructions": "", "num_rules": 0, "input_data": prompt})
             rules = [rule.strip() for rule in content.split("\n") if rule.strip()]
             
             return rules
@@ -213,19 +675,9 @@ class PythonPromptPex:
         if not rules:
             return []
             
-        prompt_path = os.path.join(PROMPT_DIR, "generate_inverse_rules.prompty")
-        
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            system_prompt = system_prompt.replace("{{instructions}}", "")
-            user_prompt = user_prompt_template.replace("{{rule}}", "\n".join(rules))
-            
-            response = self.llm_client.call_openai(system_prompt, user_prompt)
-            
-            content = response["choices"][0]["message"]["content"]
+            content = self._call_template("generate_inverse_rules", 
+                                          {"instructions": "", "rule": "\n".join(rules)})
             inverse_rules = [rule.strip() for rule in content.split("\n") if rule.strip()]
             
             return inverse_rules
@@ -239,36 +691,24 @@ class PythonPromptPex:
         if not rules:
             return []
             
-        prompt_path = os.path.join(PROMPT_DIR, "eval_rule_grounded.prompty")
-        
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            evaluations = []
+            promptid = hash_string(prompt)
             
-            for rule_id, rule in enumerate(rules, 1):
-                user_prompt = user_prompt_template.replace("{{ rule }}", rule)
-                user_prompt = user_prompt.replace("{{ description }}", prompt)
-                
-                response = self.llm_client.call_openai(system_prompt, user_prompt)
-                
-                content = response["choices"][0]["message"]["content"].strip()
-                
-                rule_hash = hash_string(rule)
-                promptid = hash_string(prompt)
+            def evaluate_rule(item) -> Dict[str, Any]:
+                rule_id, rule = item
+                content = self._call_template("evals/eval_rule_grounded", 
+                                              {"rule": rule, "description": prompt}).strip()
                 
-                evaluation = {
-                    "id": rule_hash,
+                return {
+                    "id": hash_string(rule),
                     "promptid": promptid,
                     "ruleid": rule_id,
                     "rule": rule,
                     "groundedText": content,
                     "grounded": "ok" if content.upper() == "OK" else "err"
                 }
-                
-                evaluations.append(evaluation)
+            
+            evaluations = map_ordered(evaluate_rule, enumerate(rules, 1), self.workers)
             
             return evaluations
             
@@ -277,72 +717,143 @@ class PythonPromptPex:
             return []
     
     def _generate_tests(self, prompt: str, input_spec: Dict[str, Any], 
-                       rules: List[str], inverse_rules: List[str]) -> List[Dict[str, Any]]:
-        """Generate test cases based on rules and input specification (PPT)."""
+                       rules: List[str], inverse_rules: List[str],
+                       skip: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Generate test cases based on rules and input specification (PPT).
+        
+        Rules are sent in groups (see ``_group_rules``), numbered in the user
+        prompt, and the tests are attributed back to their rule from the ruleid
+        column of the answer. Rules a grouped answer left without tests are
+        generated again one by one. Rules whose (ruleid, inverse) pair is in
+        ``skip`` get no tests, e.g. when their tests are reused.
+        """
         if not rules:
             return []
             
-        prompt_path = os.path.join(PROMPT_DIR, "generate_tests.prompty")
-        
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            all_tests = []
+            template = self.templates.get("generate_tests")
+            values = {
+                "input_spec": "\n".join(input_spec.get("input_constraints", [])),
+                "context": prompt,
+                "num": self.tests_per_rule,
+                "num_rules": 1
+            }
             
-            for rule_id, rule in enumerate(rules, 1):
-                user_prompt = "List of Rules:\n{}".format(rule)
-                
-                input_spec_text = "\n".join(input_spec.get("input_constraints", []))
-                
-                current_system = system_prompt.replace("{{input_spec}}", input_spec_text)
-                current_system = current_system.replace("{{context}}", prompt)
-                current_system = current_system.replace("{{num}}", str(self.tests_per_rule))
-                current_system = current_system.replace("{{rule}}", rule)
-                current_system = current_system.replace("{{num_rules}}", "1")
+            def generate_group_tests(group) -> List[Dict[str, Any]]:
+                current_system, user_prompt = self._generation_prompts(template, values, group)
                 
-                response = self.llm_client.call_openai(current_system, user_prompt)
+                try:
+                    response = self.llm_client.call_openai(current_system, user_prompt, **template.parameters)
+                except BudgetExceededError as e:
+                    # Keep the tests of the other rules
+                    logger.warning(f"Skipping test generation for rules "
+                                   f"{', '.join(str(job[0]) for job in group)}: {e}")
+                    return []
                 
                 content = response["choices"][0]["message"]["content"].strip()
-                tests = self._parse_csv_tests(content, rule_id, rule, is_inverse=False)
-                all_tests.extend(tests)
-                
-            for rule_id, rule in enumerate(inverse_rules, 1):
-                user_prompt = "List of Rules:\n{}".format(rule)
+                tests = self._parse_csv_tests(content, group)
                 
-                input_spec_text = "\n".join(input_spec.get("input_constraints", []))
-                
-                current_system = system_prompt.replace("{{input_spec}}", input_spec_text)
-                current_system = current_system.replace("{{context}}", prompt)
-                current_system = current_system.replace("{{num}}", str(self.tests_per_rule))
-                current_system = current_system.replace("{{rule}}", rule)
-                current_system = current_system.replace("{{num_rules}}", "1")
-                
-                response = self.llm_client.call_openai(current_system, user_prompt)
-                
-                content = response["choices"][0]["message"]["content"].strip()
-                tests = self._parse_csv_tests(content, rule_id, rule, is_inverse=True)
+                if len(group) > 1:
+                    positions = {(rule_id, is_inverse): position 
+                                 for position, (rule_id, _, is_inverse) in enumerate(group)}
+                    covered = {(test["ruleid"], test["inverse"]) for test in tests}
+                    missing = [job for job in group if (job[0], job[2]) not in covered]
+                    if missing:
+                        logger.warning(f"No tests generated for {len(missing)} of {len(group)} "
+                                       f"grouped rules, generating them one by one")
+                        for job in missing:
+                            tests.extend(generate_group_tests([job]))
+                    tests.sort(key=lambda test: positions[(test["ruleid"], test["inverse"])])
+                return tests
+            
+            # Rules first, then inverse rules, so tests keep the order the CSV writers expect
+            jobs = [(rule_id, rule, False) for rule_id, rule in enumerate(rules, 1)]
+            jobs += [(rule_id, rule, True) for rule_id, rule in enumerate(inverse_rules, 1)]
+            if skip:
+                jobs = [job for job in jobs if (job[0], job[2]) not in skip]
+            groups = self._group_rules(jobs, template.system.render(values))
+            
+            all_tests = []
+            for tests in map_ordered(generate_group_tests, groups, self.workers):
                 all_tests.extend(tests)
                 
+            if len(groups) < len(jobs):
+                logger.info(f"Generated {len(all_tests)} tests for {len(jobs)} rules "
+                            f"in {len(groups)} grouped requests")
             return all_tests
             
         except Exception as e:
             logger.error(f"Error generating tests: {e}")
             return []
     
-    def _parse_csv_tests(self, csv_content: str, rule_id: int, rule: str, 
-                        is_inverse: bool = False) -> List[Dict[str, Any]]:
-        """Parse CSV test cases from response."""
+    def _generation_prompts(self, template: Any, values: Dict[str, Any], group: List[tuple]) -> Tuple[str, str]:
+        """Build the system and user prompts generating the tests of a group of rules."""
+        if len(group) == 1:
+            user_prompt = "List of Rules:\n{}".format(group[0][1])
+        else:
+            user_prompt = "List of Rules:\n" + "\n".join(
+                f"{index}. {rule}" for index, (_, rule, _) in enumerate(group, 1))
+        
+        system_prompt = template.system.render({**values, "num_rules": len(group),
+                                                "rule": "\n".join(rule for _, rule, _ in group)})
+        return system_prompt, user_prompt
+    
+    def _group_rules(self, jobs: List[tuple], system_prompt: str) -> List[List[tuple]]:
+        """Split the (ruleid, rule, inverse) jobs into the groups sent per generation request.
+        
+        Groups hold up to ``generation_batch_size`` consecutive rules of the same
+        kind. With a ``generation_token_budget``, a group also ends before its
+        estimated request size (system prompt, rules and expected tests) would
+        exceed the budget; the size is not capped when the batch size is 1.
+        """
+        budget = self.generation_token_budget
+        limit = self.generation_batch_size
+        if budget and limit == 1:
+            limit = len(jobs)
+        
+        groups, group, tokens = [], [], 0
+        base_tokens = estimate_tokens(system_prompt)
+        for job in jobs:
+            cost = estimate_tokens(job[1]) + self.tests_per_rule * ESTIMATED_TOKENS["test"]
+            if group and (len(group) >= limit or group[-1][2] != job[2] 
+                          or (budget and base_tokens + tokens + cost > budget)):
+                groups.append(group)
+                group, tokens = [], 0
+            group.append(job)
+            tokens += cost
+        if group:
+            groups.append(group)
+        return groups
+    
+    def _parse_csv_tests(self, csv_content: str, rules: List[tuple]) -> List[Dict[str, Any]]:
+        """Parse CSV test cases from response.
+        
+        Valid rows are kept even when the answer is fenced, mixed with prose or
+        partly malformed; JSON lines are accepted too. The parse yield is
+        accounted in ``parse_stats``.
+        
+        Args:
+            csv_content: Answer of the model
+            rules: The (ruleid, rule, inverse) jobs of the request, numbered from 1
+                in its prompt; rows whose ruleid is not one of these numbers are
+                attributed by their position, ``tests_per_rule`` rows per rule
+        """
         try:
-            lines = csv_content.split('\n')
-            if len(lines) > 1:
-                csv_content = '\n'.join(lines)
+            parsed = parse_test_cases(csv_content)
+            self.parse_stats.add(parsed)
+            rule_ids = ", ".join(str(rule_id) for rule_id, _, _ in rules)
+            if parsed.dropped or not parsed.rows:
+                logger.warning(f"Parsed {len(parsed.rows)} tests for rule {rule_ids}, "
+                               f"dropped {parsed.dropped} malformed rows")
             
             tests = []
-            csv_reader = csv.DictReader(io.StringIO(csv_content))
-            
-            for row in csv_reader:
+            unattributed = 0
+            for position, row in enumerate(parsed.rows):
+                index = parse_rule_id(row.get("ruleid")) if len(rules) > 1 else 1
+                if index is None or not 1 <= index <= len(rules):
+                    index = min(position // max(1, self.tests_per_rule), len(rules) - 1) + 1
+                    unattributed += 1
+                rule_id, rule, is_inverse = rules[index - 1]
                 test = {
                     "ruleid": rule_id,
                     "rule": rule,
@@ -353,26 +864,67 @@ class PythonPromptPex:
                 }
                 tests.append(test)
             
+            if unattributed:
+                logger.warning(f"Attributed {unattributed} tests without a valid ruleid to "
+                               f"rules {rule_ids} by their position")
             return tests
         except Exception as e:
             logger.error(f"Error parsing CSV test cases: {e}")
             return []
     
+    def _filter_near_duplicates(self, tests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Find the rule tests whose input is a near-duplicate of an earlier test's (NDT).
+        
+        Tests are compared by MinHash signatures of their input, indexed with
+        locality-sensitive hashing, so this takes seconds even for tens of
+        thousands of tests. The first test of each (rule, inverse) pair is always
+        kept so that no rule is left untested.
+        
+        Returns:
+            Report with the dropped tests, each with the index, rule and input of the
+            test it duplicates and their estimated similarity
+        """
+        try:
+            first_tests = {}
+            for index, test in enumerate(tests):
+                first_tests.setdefault((test.get("ruleid"), test.get("inverse", False)), index)
+            duplicates = find_near_duplicates([test["testinput"] for test in tests], 
+                                              self.near_duplicate_threshold,
+                                              protected=set(first_tests.values()))
+            
+            dropped = []
+            for index, (kept, similarity) in sorted(duplicates.items()):
+                dropped.append({
+                    "index": index,
+                    "ruleid": tests[index].get("ruleid"),
+                    "inverse": tests[index].get("inverse", False),
+                    "testinput": tests[index]["testinput"],
+                    "duplicate_of": kept,
+                    "duplicate_ruleid": tests[kept].get("ruleid"),
+                    "duplicate_testinput": tests[kept]["testinput"],
+                    "similarity": similarity
+                })
+            logger.info(f"Dropped {len(dropped)} of {len(tests)} tests as near-duplicates")
+            return {
+                "threshold": self.near_duplicate_threshold,
+                "tests": len(tests),
+                "kept": len(tests) - len(dropped),
+                "dropped": dropped
+            }
+        except Exception as e:
+            logger.error(f"Error filtering near-duplicate tests: {e}")
+            return {}
+    
+    def _selected_tests(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Rule tests to check and run: the generated tests without the near-duplicates dropped."""
+        dropped = {item["index"] for item in context.get("test_filter", {}).get("dropped", [])}
+        return [test for index, test in enumerate(context["tests"]) if index not in dropped]
+    
     def _generate_baseline_tests(self, prompt: str) -> List[Dict[str, Any]]:
         """Generate baseline test cases without using rules (BT)."""
-        prompt_path = os.path.join(PROMPT_DIR, "generate_baseline_tests.prompty")
-        
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            system_prompt = system_prompt.replace("{{num}}", str(self.tests_per_rule))
-            user_prompt = user_prompt_template.replace("{{prompt}}", prompt)
-            
-            response = self.llm_client.call_openai(system_prompt, user_prompt)
-            
-            content = response["choices"][0]["message"]["content"].strip()
+            content = self._call_template("generation/generate_baseline_tests", 
+                                          {"num": self.tests_per_rule, "prompt": prompt}).strip()
             
             test_contents = content.split("===")
             tests = []
@@ -394,29 +946,37 @@ class PythonPromptPex:
     
     def _evaluate_test_validity(self, tests: List[Dict[str, Any]], 
                               input_spec: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Evaluate if test inputs comply with input specification (TV)."""
-        prompt_path = os.path.join(PROMPT_DIR, "eval_test_validity.prompty")
+        """Evaluate if test inputs comply with input specification (TV).
         
+        Identical test inputs are evaluated once. With ``validity_batch_size`` above 1,
+        the inputs are checked in batches against a single copy of the input specification.
+        """
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
             evaluations = []
             input_spec_text = "\n".join(input_spec.get("input_constraints", []))
             
+            unique_inputs = {}
             for test in tests:
-                current_user_prompt = user_prompt_template.replace("{{test}}", test["testinput"])
-                current_system_prompt = system_prompt.replace("{{input_spec}}", input_spec_text)
-                
-                response = self.llm_client.call_openai(current_system_prompt, current_user_prompt)
-                
-                content = response["choices"][0]["message"]["content"].strip()
+                unique_inputs.setdefault(hash_string(test["testinput"]), test["testinput"])
+            if len(unique_inputs) < len(tests):
+                logger.info(f"Evaluating validity of {len(unique_inputs)} unique inputs "
+                            f"out of {len(tests)} tests")
+            
+            if self.validity_batch_size > 1:
+                validity_texts = self._evaluate_validity_batched(unique_inputs, input_spec_text)
+            else:
+                validity_texts = {
+                    test_hash: self._evaluate_validity(test_input, input_spec_text)
+                    for test_hash, test_input in unique_inputs.items()
+                }
+            
+            for test in tests:
+                test_hash = hash_string(test["testinput"])
+                content = validity_texts[test_hash]
                 
                 lines = content.strip().split("\n")
                 decision = lines[-1].strip().upper() if lines else "ERR"
                 
-                test_hash = hash_string(test["testinput"])
                 evaluation = {
                     "id": test_hash,
                     "test": test["testinput"],
@@ -432,137 +992,766 @@ class PythonPromptPex:
             logger.error(f"Error evaluating test validity: {e}")
             return []
     
+    def _evaluate_validity(self, test_input: str, input_spec_text: str) -> str:
+        """Check a single test input and return the evaluator's answer."""
+        return self._call_template("evals/eval_test_validity", 
+                                   {"input_spec": input_spec_text, "test": test_input}).strip()
+    
+    def _evaluate_validity_batched(self, inputs: Dict[str, str], input_spec_text: str) -> Dict[str, str]:
+        """Check test inputs ``validity_batch_size`` at a time.
+        
+        Inputs missing from a batch answer are checked one by one with the
+        single-input evaluator.
+        
+        Args:
+            inputs: Test inputs keyed by their hash
+            input_spec_text: Input specification the inputs are checked against
+        
+        Returns:
+            Evaluator answers keyed by input hash, formatted like the single-input answers
+        """
+        items = list(inputs.items())
+        batches = [items[i:i + self.validity_batch_size] 
+                   for i in range(0, len(items), self.validity_batch_size)]
+        
+        def check_batch(batch) -> Dict[str, str]:
+            tests_json = json.dumps([{"id": index, "input": test_input} 
+                                     for index, (_, test_input) in enumerate(batch)],
+                                    ensure_ascii=False, indent=2)
+            try:
+                content = self._call_template("evals/eval_test_validity_batch", 
+                                              {"input_spec": input_spec_text, "tests": tests_json})
+                decisions = self._parse_batch_decisions(content, "test validity")
+            except Exception as e:
+                logger.warning(f"Batched test validity evaluation failed, checking inputs one by one: {e}")
+                decisions = {}
+            
+            texts = {}
+            for index, (test_hash, test_input) in enumerate(batch):
+                texts[test_hash] = decisions.get(index)
+                if texts[test_hash] is None:
+                    texts[test_hash] = self._evaluate_validity(test_input, input_spec_text)
+            return texts
+        
+        validity_texts = {}
+        for texts in map_ordered(check_batch, batches, self.workers):
+            validity_texts.update(texts)
+        logger.info(f"Checked {len(items)} inputs in {len(batches)} batched requests")
+        return validity_texts
+    
+    def _reuse_inverse_rules(self, rules: List[str], prompt: str) -> List[str]:
+        """Generate the inverse rules of the added rules, reusing those of the unchanged rules (IOR)."""
+        previous_rules = self._previous_run.context.get("rules", [])
+        previous_inverse = self._previous_run.context.get("inverse_rules", [])
+        unchanged = diff_rules(previous_rules, rules)["unchanged"]
+        # Inverse rules are matched to their rule by position
+        if len(previous_inverse) != len(previous_rules):
+            unchanged = {}
+        
+        added = [rule for rule_id, rule in enumerate(rules, 1) if rule_id not in unchanged]
+        generated = self._generate_inverse_rules(added, prompt)
+        if len(generated) != len(added):
+            logger.warning(f"Generated {len(generated)} inverse rules for {len(added)} added rules, "
+                           f"generating the inverse rules of all rules again")
+            return self._generate_inverse_rules(rules, prompt)
+        
+        generated = iter(generated)
+        return [previous_inverse[unchanged[rule_id] - 1] if rule_id in unchanged else next(generated)
+                for rule_id in range(1, len(rules) + 1)]
+    
+    def _reuse_rule_evaluations(self, rules: List[str], prompt: str) -> List[Dict[str, Any]]:
+        """Evaluate the groundedness of the added rules, reusing that of the unchanged rules (ORG)."""
+        previous = self._previous_run
+        previous_evaluations = {evaluation.get("ruleid"): evaluation 
+                                for evaluation in previous.context.get("rule_evaluations", [])}
+        unchanged = {rule_id: previous_id 
+                     for rule_id, previous_id in diff_rules(previous.context.get("rules", []), rules)["unchanged"].items()
+                     if previous_id in previous_evaluations}
+        
+        added = [rule for rule_id, rule in enumerate(rules, 1) if rule_id not in unchanged]
+        evaluated = {evaluation["id"]: evaluation for evaluation in self._evaluate_rules_groundedness(added, prompt)}
+        
+        evaluations = []
+        for rule_id, rule in enumerate(rules, 1):
+            if rule_id in unchanged:
+                evaluations.append({**previous_evaluations[unchanged[rule_id]], "ruleid": rule_id,
+                                    "reused_from": previous.provenance(ruleid=unchanged[rule_id])})
+            elif hash_string(rule) in evaluated:
+                evaluations.append({**evaluated[hash_string(rule)], "ruleid": rule_id})
+        return evaluations
+    
+    def _reuse_tests(self, prompt: str, input_spec: Dict[str, Any], 
+                     rules: List[str], inverse_rules: List[str]) -> List[Dict[str, Any]]:
+        """Generate the tests of the added rules, reusing those of the unchanged rules (PPT).
+        
+        The tests of an inverse rule are reused when its rule is unchanged and
+        its text is the same as in the previous run.
+        """
+        previous = self._previous_run
+        previous_inverse = previous.context.get("inverse_rules", [])
+        rule_ids = {}
+        for rule_id, previous_id in diff_rules(previous.context.get("rules", []), rules)["unchanged"].items():
+            rule_ids[(previous_id, False)] = rule_id
+            if (rule_id <= len(inverse_rules) and previous_id <= len(previous_inverse)
+                    and inverse_rules[rule_id - 1] == previous_inverse[previous_id - 1]):
+                rule_ids[(previous_id, True)] = rule_id
+        
+        reused = []
+        for test in previous.context.get("tests", []):
+            rule_id = rule_ids.get((test.get("ruleid"), test.get("inverse", False)))
+            if rule_id is not None:
+                reused.append({**test, "ruleid": rule_id, "reused_from": previous.provenance(ruleid=test["ruleid"])})
+        
+        skip = {(test["ruleid"], test.get("inverse", False)) for test in reused}
+        generated = self._generate_tests(prompt, input_spec, rules, inverse_rules, skip)
+        logger.info(f"Reused {len(reused)} tests of {len(skip)} unchanged rules, "
+                    f"generated {len(generated)} tests")
+        # Rules first, then inverse rules, as when all tests are generated
+        return sorted(reused + generated, key=lambda test: (test.get("inverse", False), test["ruleid"]))
+    
+    def _reuse_baseline_tests(self, prompt: str) -> List[Dict[str, Any]]:
+        """Reuse the baseline tests of the previous run, or generate them if it has none (BT)."""
+        tests = [{**test, "reused_from": self._previous_run.provenance()} 
+                 for test in self._previous_run.context.get("baseline_tests", [])]
+        return tests or self._generate_baseline_tests(prompt)
+    
+    def _reuse_test_validity(self, tests: List[Dict[str, Any]], 
+                             input_spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Evaluate the validity of the new tests, reusing that of the reused tests (TV).
+        
+        Validity is only reused when the input specification is the same as in
+        the previous run.
+        """
+        if input_spec != self._previous_run.context.get("input_spec"):
+            return self._evaluate_test_validity(tests, input_spec)
+        previous = {evaluation["id"]: evaluation 
+                    for evaluation in self._previous_run.context.get("test_validity", [])}
+        new_tests = [test for test in tests 
+                     if not (test.get("reused_from") and hash_string(test["testinput"]) in previous)]
+        evaluated = {evaluation["id"]: evaluation 
+                     for evaluation in self._evaluate_test_validity(new_tests, input_spec)}
+        
+        evaluations = []
+        for test in tests:
+            test_hash = hash_string(test["testinput"])
+            if test.get("reused_from") and test_hash in previous:
+                evaluations.append({**previous[test_hash], "reused_from": self._previous_run.provenance()})
+            elif test_hash in evaluated:
+                evaluations.append(evaluated[test_hash])
+        return evaluations
+    
+    def _reuse_results(self, tests: List[Dict[str, Any]]):
+        """Add the results of the reused tests in the previous run to the completed results.
+        
+        Results are matched by the ruleid and input of the test in the previous
+        run, for each model and run; the (test, model, run) combinations without
+        a result, e.g. of newly added models, are run as usual. Only called when
+        the prompt is unchanged, since outputs of another prompt would be stale.
+        """
+        previous = self._previous_run
+        for test in tests:
+            if not test.get("reused_from"):
+                continue
+            previous_test = dict(test)
+            if "ruleid" in test["reused_from"]:
+                previous_test["ruleid"] = test["reused_from"]["ruleid"]
+            for model in self.models_to_test:
+                for run in range(self.runs_per_test):
+                    result_id = self._test_result_id(test, model, run)
+                    result = previous.results.get(self._test_result_id(previous_test, model, run))
+                    if result is not None and result_id not in self._completed_results:
+                        self._completed_results[result_id] = {
+                            **result, "id": result_id, "ruleid": test.get("ruleid"),
+                            "reused_from": previous.provenance(id=result["id"])
+                        }
+    
+    def _incremental_stats(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Describe what an incremental run reused from the previous run."""
+        previous = self._previous_run
+        previous_rules = previous.context.get("rules", [])
+        rules = diff_rules(previous_rules, context["rules"])
+        results = reused_results = 0
+        for result in self._iter_test_results(context):
+            results += 1
+            reused_results += bool(result.get("reused_from"))
+        reused_tests = sum(1 for test in context["tests"] if test.get("reused_from"))
+        return {
+            "previous_results": previous.path,
+            "previous_run": previous.name,
+            "prompt_changed": previous.prompt_changed(context["prompt"]),
+            "unchanged_rules": sorted(rules["unchanged"]),
+            "added_rules": rules["added"],
+            "removed_rules": [previous_rules[rule_id - 1] for rule_id in rules["removed"]],
+            "reused_tests": reused_tests,
+            "generated_tests": len(context["tests"]) - reused_tests,
+            "reused_results": reused_results,
+            "new_results": results - reused_results
+        }
+    
     def _run_tests(self, prompt: str, tests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Run tests against models and evaluate compliance (TO & TNC)."""
-        prompt_path = os.path.join(PROMPT_DIR, "eval_test_result.prompty")
+        """Run tests against models and evaluate compliance (TO & TNC).
+        
+        Outputs are collected (TO) and graded (TNC) in two phases: with single-output
+        grading, each output is graded as soon as it is collected; with batched
+        grading, once all outputs are collected. Stored results can be graded
+        again on their own with ``regrade``.
         
+        With ``early_stop_confidence``, the runs of a (test, model) pair are done
+        in rounds (see ``_run_rounds``) and stop once its compliance outcome is
+        stable; outputs are then graded as they are collected.
+        """
         try:
-            prompt_content = read_prompt_file(prompt_path)
-                
-            system_prompt, user_prompt_template = parse_prompty_file(prompt_content)
-            
-            results = []
-            
-            for test in tests:
-                for model in self.models_to_test:
-                    for run in range(self.runs_per_test):
-                        test_result = self._run_single_test(prompt, test, model, run, 
-                                                          system_prompt, user_prompt_template)
-                        results.append(test_result)
+            # Batched grading runs once all outputs are collected, so results are
+            # journaled and streamed after being graded
+            judge = self.judge_batch_size == 1 or bool(self.early_stop_confidence)
+            if self._previous_run and not self._previous_run.prompt_changed(prompt):
+                self._reuse_results(tests)
+            tests = self._fit_budget(prompt, tests)
+            self._expected_results = len(tests) * len(self.models_to_test) * self._runs
+            self._prepare_dedup(tests)
+            self._prepare_early_stop(tests)
+            
+            if self.max_concurrency > 1:
+                results = asyncio.run(self._run_tests_async(prompt, tests, judge))
+            else:
+                results = []
+            
+                for test in tests:
+                    for model in self.models_to_test:
+                        outcomes = []
+                        for runs in self._run_rounds():
+                            for run in runs:
+                                test_result = self._completed_results.get(self._test_result_id(test, model, run))
+                                new = test_result is None
+                                if new:
+                                    test_result = self._run_single_test(prompt, test, model, run, judge)
+                                    if test_result is None:
+                                        continue
+                                outcomes.append(test_result.get("compliance"))
+                                if judge:
+                                    test_result = self._complete_result(test_result, new)
+                                if test_result is not None:
+                                    results.append(test_result)
+                            if self._outcome_stable(test, outcomes):
+                                break
+                        self._count_runs(outcomes)
+                        self._release_outputs(test, model)
+            
+            if not judge:
+                new_results = [r for r in results if r["id"] not in self._completed_results]
+                self._grade_results(prompt, new_results)
+                results = [self._complete_result(r, r["id"] not in self._completed_results) 
+                           for r in results]
                         
-            return results
+            return [r for r in results if r is not None]
             
         except Exception as e:
             logger.error(f"Error running tests: {e}")
             return []
     
+    async def _run_tests_async(self, prompt: str, tests: List[Dict[str, Any]],
+                               judge: bool = True) -> List[Dict[str, Any]]:
+        """Run the (test, model, run) matrix concurrently on the async client.
+        
+        Results are returned in the same order as the sequential runner; the
+        number of in-flight requests is bounded by the client's limits. The
+        rounds of runs of a (test, model) pair run one after the other.
+        """
+        async def run_test(test: Dict[str, Any], model: str, run: int):
+            result = self._completed_results.get(self._test_result_id(test, model, run))
+            new = result is None
+            if new:
+                result = await self._run_single_test_async(prompt, test, model, run, judge)
+            return result, new
+        
+        async def run_pair(test: Dict[str, Any], model: str) -> List[Optional[Dict[str, Any]]]:
+            results, outcomes = [], []
+            for runs in self._run_rounds():
+                for result, new in await asyncio.gather(*[run_test(test, model, run) for run in runs]):
+                    if result is None:
+                        continue
+                    outcomes.append(result.get("compliance"))
+                    results.append(self._complete_result(result, new) if judge else result)
+                if self._outcome_stable(test, outcomes):
+                    break
+            self._count_runs(outcomes)
+            self._release_outputs(test, model)
+            return results
+        
+        async with self.llm_client.async_session():
+            tasks = [
+                run_pair(test, model)
+                for test in tests
+                for model in self.models_to_test
+            ]
+            return [result for results in await asyncio.gather(*tasks) 
+                    for result in results if result is not None]
+    
+    def _fit_budget(self, prompt: str, tests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Choose the tests to run, and how many times (``_runs``), within the remaining budget.
+        
+        Runs per test are reduced first; if a single run of every test does not
+        fit either, tests are dropped, keeping as many tests of every rule (and
+        of the baseline) as possible.
+        """
+        self._runs = self.runs_per_test
+        self._budget_stats = {}
+        budget = self.llm_client.budget
+        if not budget or not budget.limited or not tests:
+            return tests
+        
+        remaining = budget.remaining()
+        selected, runs = self._fit_test_runs(prompt, tests, remaining)
+        self._runs = runs
+        self._budget_stats = {"runs_per_test": runs, "tests_run": len(selected), 
+                              "planned_tests": len(tests), "skipped_runs": 0, "ungraded_runs": 0}
+        if runs < self.runs_per_test or len(selected) < len(tests):
+            logger.warning(f"Budget left ({remaining['requests']} requests, {remaining['tokens']} tokens) "
+                           f"allows {len(selected)} of {len(tests)} tests with {runs} of "
+                           f"{self.runs_per_test} runs each")
+        return selected
+    
+    def _fit_test_runs(self, prompt: str, tests: List[Dict[str, Any]], 
+                       remaining: Dict[str, Optional[int]]) -> Tuple[List[Dict[str, Any]], int]:
+        """Find the most runs per test, then the most tests, whose planned cost fits in ``remaining``."""
+        def fits(subset: List[Dict[str, Any]], runs: int) -> bool:
+            outputs, compliance = self._plan_test_runs(prompt, subset, runs)
+            requests = outputs.requests + compliance.requests
+            tokens = sum(step.prompt_tokens + step.completion_tokens for step in (outputs, compliance))
+            return ((remaining["requests"] is None or requests <= remaining["requests"]) 
+                    and (remaining["tokens"] is None or tokens <= remaining["tokens"]))
+        
+        for runs in range(self.runs_per_test, 0, -1):
+            if fits(tests, runs):
+                return tests, runs
+        
+        # Interleave the tests of the rules so every prefix covers as many rules as possible
+        groups: Dict[Any, List[int]] = {}
+        for index, test in enumerate(tests):
+            key = (test.get("ruleid"), test.get("inverse", False), test.get("baseline", False))
+            groups.setdefault(key, []).append(index)
+        order = [index for indices in zip_longest(*groups.values()) for index in indices if index is not None]
+        
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits([tests[index] for index in sorted(order[:middle])], 1):
+                low = middle
+            else:
+                high = middle - 1
+        return [tests[index] for index in sorted(order[:low])], 1
+    
+    def _plan_test_runs(self, prompt: str, tests: List[Dict[str, Any]], 
+                        runs: int) -> Tuple[StepPlan, StepPlan]:
+        """Plan the requests and tokens of running tests ``runs`` times on every model, and of grading them.
+        
+        Returns:
+            Tuple of the plans of the output collection and of the compliance grading
+        """
+        outputs, compliance = StepPlan(), StepPlan()
+        models = len(self.models_to_test)
+        prompt_tokens = count_tokens(prompt)
+        
+        inputs = {}
+        for test in tests:
+            key = self._test_input_key(test["testinput"]) if self.dedup_test_inputs else id(test)
+            inputs.setdefault(key, test["testinput"])
+        requests_per_input = 1 if self.multi_sample else runs
+        samples = runs // requests_per_input
+        for test_input in inputs.values():
+            outputs.add(prompt_tokens + count_tokens(test_input), samples * ESTIMATED_TOKENS["output"],
+                        requests_per_input * models)
+        
+        graded = sum(1 for test in tests if test.get("rule")) * models * runs
+        output = placeholder_text(ESTIMATED_TOKENS["output"])
+        if self.judge_batch_size > 1:
+            full_batches, rest = divmod(graded, self.judge_batch_size)
+            for size, count in ((self.judge_batch_size, full_batches), (rest, 1)):
+                if size and count:
+                    batch = json.dumps([{"id": index, "output": output} for index in range(size)], indent=2)
+                    compliance.add(self._template_tokens("evals/eval_test_result_batch", 
+                                                         {"system": prompt, "results": batch}),
+                                   size * ESTIMATED_TOKENS["evaluation"], count)
+        elif graded:
+            compliance.add(self._template_tokens("evals/eval_test_result", {"system": prompt, "result": output}),
+                           ESTIMATED_TOKENS["evaluation"], graded)
+        return outputs, compliance
+    
+    def _count_budget_refusal(self, key: str):
+        """Count a test run ("skipped_runs") or a grading ("ungraded_runs") refused by the budget."""
+        with self._budget_stats_lock:
+            self._budget_stats[key] = self._budget_stats.get(key, 0) + 1
+    
+    def _template_tokens(self, name: str, values: Dict[str, Any]) -> int:
+        """Count the tokens of the prompts of a template rendered with ``values``."""
+        system_prompt, user_prompt = self.templates.get(name).render(values)
+        return count_tokens(system_prompt + user_prompt)
+    
+    def _prepare_early_stop(self, tests: List[Dict[str, Any]]):
+        """Reset the count of runs spent, see ``_count_runs``."""
+        self._early_stop_stats = {}
+        if self.early_stop_confidence:
+            self._early_stop_stats = {
+                "confidence": self.early_stop_confidence,
+                "max_runs": self._runs,
+                "planned_runs": len(tests) * len(self.models_to_test) * self._runs,
+                "runs": 0,
+                "stopped_early": 0
+            }
+    
+    def _run_rounds(self) -> List[range]:
+        """Rounds of runs of a (test, model) pair, checked for a stable outcome after each one.
+        
+        Without early stopping, all runs form a single round. With it, the first
+        round has the fewest runs whose unanimous outcome is stable, and the
+        next rounds add one run at a time up to ``runs_per_test``.
+        """
+        if not self.early_stop_confidence:
+            return [range(self._runs)]
+        first_round = min_stable_runs(self.early_stop_confidence, self._runs)
+        return [range(first_round)] + [range(run, run + 1) for run in range(first_round, self._runs)]
+    
+    def _outcome_stable(self, test: Dict[str, Any], outcomes: List[Optional[str]]) -> bool:
+        """Whether the runs of a test on a model can stop, given the compliance of the runs so far.
+        
+        Tests whose outputs are not graded (baseline tests) stop after the first
+        round; failed runs have no outcome and do not count.
+        """
+        if not self.early_stop_confidence:
+            return False
+        if not test.get("rule"):
+            return True
+        graded = [outcome for outcome in outcomes if outcome is not None]
+        return outcome_stable(graded.count("ok"), len(graded), self.early_stop_confidence)
+    
+    def _count_runs(self, outcomes: List[Optional[str]]):
+        """Count the runs spent on a (test, model) pair with early stopping."""
+        if self._early_stop_stats:
+            self._early_stop_stats["runs"] += len(outcomes)
+            self._early_stop_stats["stopped_early"] += len(outcomes) < self._runs
+    
     def _run_single_test(self, prompt: str, test: Dict[str, Any], model: str, run_id: int,
-                       eval_system_prompt: str, eval_user_prompt_template: str) -> Dict[str, Any]:
-        """Run a single test against a model (TO) and check compliance (TNC)."""
+                       judge: bool = True) -> Dict[str, Any]:
+        """Run a single test against a model (TO) and check compliance (TNC).
+        
+        With ``judge`` False only the output is collected, for batched grading.
+        Runs refused by the budget are skipped and return None; outputs whose
+        grading is refused are kept ungraded.
+        """
         try:
-            test_input = test["testinput"]
-            response = self.llm_client.call_openai(prompt, test_input, model=model)
-            model_output = response["choices"][0]["message"]["content"]
-            
-            rule_part = test.get('ruleid', 'baseline')
-            test_input_hash = hash_string(test_input)
-            test_id = f"{rule_part}-{test_input_hash}-{model}-{run_id}"
-            result = {
-                "id": test_id,
-                "ruleid": test.get('ruleid'),
-                "rule": test.get('rule', ""),
-                "inverse": test.get('inverse', False),
-                "baseline": test.get('baseline', False),
-                "model": model,
-                "input": test_input,
-                "output": model_output
-            }
+            model_output = self._get_output(prompt, test, model, run_id)
             
-            if test.get('rule'):
-                current_system_prompt = eval_system_prompt.replace("{{ system }}", prompt)
-                current_user_prompt = eval_user_prompt_template.replace("{{ result }}", model_output)
-                
-                eval_response = self.llm_client.call_openai(current_system_prompt, current_user_prompt)
-                eval_content = eval_response["choices"][0]["message"]["content"].strip()
-                
-                lines = eval_content.strip().split("\n")
-                decision = lines[-1].strip().upper() if lines else "ERR"
-                
-                expected_compliance = "err" if test.get('inverse', False) else "ok"
-                actual_compliance = "ok" if decision == "OK" else "err"
+            result = self._create_test_result(test, model, run_id, model_output)
+            
+            if judge and test.get('rule'):
+                try:
+                    eval_content = self._judge_output(prompt, model_output)
+                except BudgetExceededError:
+                    # Keep the output, left ungraded; ``regrade`` can grade it later
+                    self._count_budget_refusal("ungraded_runs")
+                    return result
+                self._apply_compliance(result, test, eval_content)
+            
+            return result
+            
+        except BudgetExceededError:
+            self._count_budget_refusal("skipped_runs")
+            return None
+        except Exception as e:
+            logger.error(f"Error running test {test.get('testinput', '')[:30]} on model {model}: {e}")
+            return self._create_error_result(test, model, run_id, e)
+    
+    async def _run_single_test_async(self, prompt: str, test: Dict[str, Any], model: str, 
+                                     run_id: int, judge: bool = True) -> Dict[str, Any]:
+        """Async counterpart of ``_run_single_test``."""
+        try:
+            model_output = await self._get_output_async(prompt, test, model, run_id)
+            
+            result = self._create_test_result(test, model, run_id, model_output)
+            
+            if judge and test.get('rule'):
+                try:
+                    with metric_scope(step="test_compliance"):
+                        eval_content = await self._call_template_async(
+                            "evals/eval_test_result", {"system": prompt, "result": model_output},
+                            model=self.judge_model)
+                except BudgetExceededError:
+                    self._count_budget_refusal("ungraded_runs")
+                    return result
                 
-                result["complianceText"] = eval_content
-                result["compliance"] = actual_compliance
-                result["compliance_matched"] = actual_compliance == expected_compliance
+                self._apply_compliance(result, test, eval_content.strip())
             
             return result
             
+        except BudgetExceededError:
+            self._count_budget_refusal("skipped_runs")
+            return None
         except Exception as e:
             logger.error(f"Error running test {test.get('testinput', '')[:30]} on model {model}: {e}")
-            rule_part = test.get('ruleid', 'baseline')
-            test_input_hash = hash_string(test.get('testinput', ''))
-            test_id = f"{rule_part}-{test_input_hash}-{model}-{run_id}"
-            return {
-                "id": test_id,
-                "ruleid": test.get('ruleid'),
-                "rule": test.get('rule', ""),
-                "inverse": test.get('inverse', False),
-                "baseline": test.get('baseline', False),
-                "model": model,
-                "input": test.get('testinput', ""),
-                "output": "ERROR",
-                "error": str(e)
-            }
+            return self._create_error_result(test, model, run_id, e)
+    
+    def _test_input_key(self, test_input: str) -> str:
+        """Deduplication key of a test input: hash of its whitespace-normalized text."""
+        return hash_string(" ".join(test_input.split()), 16)
+    
+    def _prepare_dedup(self, tests: List[Dict[str, Any]]):
+        """Find the test inputs shared by several tests, whose outputs are reused."""
+        self._put_outputs = {}
+        self._shared_inputs = {}
+        self._open_pairs = {}
+        if not self.dedup_test_inputs:
+            self._dedup_stats = {}
+            return
+        
+        counts: Dict[str, int] = {}
+        for test in tests:
+            key = self._test_input_key(test.get("testinput", ""))
+            counts[key] = counts.get(key, 0) + 1
+        self._shared_inputs = {key: count for key, count in counts.items() if count > 1}
+        self._dedup_stats = {"test_inputs": len(tests), "unique_inputs": len(counts), "saved_calls": 0}
+        if self._shared_inputs:
+            logger.info(f"Running {len(counts)} unique inputs for {len(tests)} tests")
+    
+    def _output_request(self, test: Dict[str, Any], model: str, run_id: int):
+        """Locate the output of a test run among the samples of the request producing it.
+        
+        With ``multi_sample``, one request returns the outputs of all the runs of
+        a test; with deduplication, that request is shared by the tests with the
+        same input.
+        
+        Returns:
+            Tuple of the key of the request (None when no other run uses it), the
+            first run it produces and its number of samples; the key is (owner,
+            model, first run), the owner being the shared input or the test
+        """
+        if self.early_stop_confidence:
+            # The first round is requested at once, later rounds are single runs
+            first_round = len(self._run_rounds()[0])
+            first_run, samples = (0, first_round) if self.multi_sample and run_id < first_round else (run_id, 1)
+        else:
+            samples_per_request = self._runs if self.multi_sample else 1
+            first_run = run_id - run_id % samples_per_request
+            samples = min(samples_per_request, self._runs - first_run)
+        input_key = self._test_input_key(test["testinput"])
+        if samples == 1 and input_key not in self._shared_inputs:
+            return None, first_run, samples
+        owner = input_key if input_key in self._shared_inputs else id(test)
+        return (owner, model, first_run), first_run, samples
+    
+    def _claim_output(self, key: Any, test: Dict[str, Any], samples: int, 
+                      start: Callable[[], Any]) -> Any:
+        """Get the pending or completed request of a test run, starting it with ``start`` if needed.
+        
+        Requests are forgotten once every run using them claimed their output,
+        or once the runs of every test using them are done (see ``_release_outputs``).
+        Each test reusing a request started by another test saves one request.
+        """
+        requests = self._put_outputs.setdefault(key[:2], {})
+        entry = requests.get(key[2])
+        if entry is None:
+            users = samples * self._shared_inputs.get(key[0], 1)
+            entry = requests[key[2]] = {"response": start(), "tests": {id(test)}, "pending": users}
+        elif id(test) not in entry["tests"]:
+            entry["tests"].add(id(test))
+            self._dedup_stats["saved_calls"] += 1
+        entry["pending"] -= 1
+        if entry["pending"] <= 0:
+            del requests[key[2]]
+        return entry["response"]
+    
+    def _release_outputs(self, test: Dict[str, Any], model: str):
+        """Forget the requests of a (test, model) pair once every pair sharing its input is done.
+        
+        Runs skipped by early stopping or reused from a previous run never claim
+        their output, so the requests they would have shared are dropped here.
+        """
+        input_key = self._test_input_key(test["testinput"])
+        if input_key in self._shared_inputs:
+            pair = (input_key, model)
+            self._open_pairs[pair] = self._open_pairs.get(pair, self._shared_inputs[input_key]) - 1
+            if self._open_pairs[pair] > 0:
+                return
+            del self._open_pairs[pair]
+            self._put_outputs.pop(pair, None)
+        else:
+            self._put_outputs.pop((id(test), model), None)
+        
+    def _get_output(self, prompt: str, test: Dict[str, Any], model: str, run_id: int) -> str:
+        """Run a test against a model (TO), reusing the output of an identical input."""
+        key, first_run, samples = self._output_request(test, model, run_id)
+    
+        def start():
+            return self.llm_client.call_openai(prompt, test["testinput"], model=model,
+                                               sample=first_run, n=samples)
+        
+        response = start() if key is None else self._claim_output(key, test, samples, start)
+        return response["choices"][run_id - first_run]["message"]["content"]
+    
+    async def _get_output_async(self, prompt: str, test: Dict[str, Any], model: str, run_id: int) -> str:
+        """Async counterpart of ``_get_output``; concurrent runs sharing a request await the same one."""
+        key, first_run, samples = self._output_request(test, model, run_id)
+        
+        def start():
+            return asyncio.ensure_future(self.llm_client.call_openai_async(
+                prompt, test["testinput"], model=model, sample=first_run, n=samples))
+        
+        response = await (start() if key is None else self._claim_output(key, test, samples, start))
+        return response["choices"][run_id - first_run]["message"]["content"]
+    
+    def _grade_results(self, prompt: str, results: List[Dict[str, Any]]):
+        """Grade the compliance (TNC) of collected test outputs, updating the results in place.
+        
+        Only rule tests whose output was collected are graded. A result whose
+        grading fails gets an "error"; one whose grading is refused by the budget
+        is left ungraded.
+        """
+        if self.judge_batch_size > 1:
+            self._judge_results_batched(prompt, results)
+            return
+        
+        def grade(result: Dict[str, Any]):
+            try:
+                eval_content = self._judge_output(prompt, result["output"])
+                self._apply_compliance(result, result, eval_content)
+            except BudgetExceededError:
+                self._count_budget_refusal("ungraded_runs")
+            except Exception as e:
+                logger.error(f"Error checking compliance of test {result['id']}: {e}")
+                result["error"] = str(e)
+        
+        map_ordered(grade, [r for r in results if r.get("rule") and "error" not in r], self.workers)
     
-    def _generate_summary(self, context: Dict[str, Any]) -> Dict[str, Any]:
-        rules = context.get("rules", [])
-        rule_evaluations = context.get("rule_evaluations", [])
-        test_results = context.get("test_results", [])
-        tests = context.get("tests", [])
-        baseline_tests = context.get("baseline_tests", [])
-        test_validity = context.get("test_validity", [])
-        
-        grounded_rules = sum(1 for r in rule_evaluations if r.get("grounded") == "ok")
-        valid_tests = sum(1 for t in test_validity if t.get("validity") == "ok")
-        rule_test_results = [r for r in test_results if "compliance" in r]
-        compliant_tests = sum(1 for r in rule_test_results if r.get("compliance") == "ok")
-        
-        model_results = {}
-        for result in test_results:
-            model = result.get("model", "unknown")
-            if model not in model_results:
-                model_results[model] = {"total": 0, "ok": 0}
-            
-            if "compliance" in result:
-                model_results[model]["total"] += 1
-                if result.get("compliance") == "ok":
-                    model_results[model]["ok"] += 1
-        
-        grounded_percentage = round((grounded_rules / len(rules) * 100) if rules else 0, 1)
-        valid_percentage = round((valid_tests / len(test_validity) * 100) if test_validity else 0, 1)
-        compliant_percentage = round((compliant_tests / len(rule_test_results) * 100) 
-                                   if rule_test_results else 0, 1)
-        
-        summary = {
-            "total_rules": len(rules),
-            "inverse_rules": len(context.get("inverse_rules", [])),
-            "grounded_rules": grounded_rules,
-            "grounded_percentage": grounded_percentage,
-            
-            "total_tests": len(tests) + len(baseline_tests),
-            "rule_tests": len(tests),
-            "baseline_tests": len(baseline_tests),
-            "valid_tests": valid_tests,
-            "valid_percentage": valid_percentage,
-            
-            "test_results": len(test_results),
-            "compliant_tests": compliant_tests,
-            "compliant_percentage": compliant_percentage,
-            
-            "model_results": model_results
+    def _judge_output(self, prompt: str, model_output: str) -> str:
+        """Grade the compliance of a single output and return the evaluator's answer."""
+        with metric_scope(step="test_compliance"):
+            eval_content = self._call_template("evals/eval_test_result", 
+                                               {"system": prompt, "result": model_output},
+                                               model=self.judge_model)
+        return eval_content.strip()
+        
+    def _judge_results_batched(self, prompt: str, results: List[Dict[str, Any]]):
+        """Grade the compliance of rule test outputs, ``judge_batch_size`` outputs per request.
+        
+        Outputs missing from a batch answer that cannot be parsed are graded one
+        by one with the single-output evaluator.
+        """
+        to_grade = [r for r in results if r.get("rule") and "error" not in r]
+        if not to_grade:
+            return
+        
+        template = self.templates.get("evals/eval_test_result_batch")
+        batch_system_prompt = template.system.render({"system": prompt})
+        
+        batches = [to_grade[i:i + self.judge_batch_size] 
+                   for i in range(0, len(to_grade), self.judge_batch_size)]
+        
+        def grade_batch(batch: List[Dict[str, Any]]):
+            items = [{"id": index, "output": result["output"]} for index, result in enumerate(batch)]
+            try:
+                user_prompt = template.user.render(
+                    {"results": json.dumps(items, ensure_ascii=False, indent=2)})
+                with metric_scope(step="test_compliance"):
+                    response = self.llm_client.call_openai(batch_system_prompt, user_prompt,
+                                                           model=self.judge_model, **template.parameters)
+                decisions = self._parse_batch_decisions(response["choices"][0]["message"]["content"],
+                                                        "compliance")
+            except BudgetExceededError:
+                for _ in batch:
+                    self._count_budget_refusal("ungraded_runs")
+                return
+            except Exception as e:
+                logger.warning(f"Batched compliance evaluation failed, grading outputs one by one: {e}")
+                decisions = {}
+            
+            for index, result in enumerate(batch):
+                eval_content = decisions.get(index)
+                try:
+                    if eval_content is None:
+                        eval_content = self._judge_output(prompt, result["output"])
+                    self._apply_compliance(result, result, eval_content)
+                except BudgetExceededError:
+                    self._count_budget_refusal("ungraded_runs")
+                except Exception as e:
+                    logger.error(f"Error checking compliance of test {result['id']}: {e}")
+                    result["error"] = str(e)
+        
+        map_ordered(grade_batch, batches, self.workers)
+        logger.info(f"Graded {len(to_grade)} outputs in {len(batches)} batched requests")
+    
+    def _parse_batch_decisions(self, content: str, evaluation: str) -> Dict[int, str]:
+        """Parse a batched evaluation answer into evaluator answers keyed by item id.
+        
+        Each answer is formatted like the single-item evaluators': the reasoning
+        followed by the OK/ERR decision on the last line. Items with a missing or
+        unknown decision are left out.
+        
+        Args:
+            content: JSON array answered by the evaluator
+            evaluation: Name of the evaluation, for log messages
+        """
+        start, end = content.find("["), content.rfind("]")
+        if start < 0 or end < start:
+            logger.warning(f"No JSON array in batched {evaluation} evaluation")
+            return {}
+        
+        try:
+            items = json.loads(content[start:end + 1])
+        except json.JSONDecodeError as e:
+            logger.warning(f"Invalid JSON in batched {evaluation} evaluation: {e}")
+            return {}
+        
+        decisions = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            decision = str(item.get("decision", "")).strip().upper()
+            try:
+                index = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            if decision in ("OK", "ERR"):
+                decisions[index] = f"{str(item.get('reasoning', '')).strip()}\n{decision}".strip()
+        return decisions
+    
+    def _test_result_id(self, test: Dict[str, Any], model: str, run_id: int) -> str:
+        """Identify a test run as ruleid-hash-model-run."""
+        rule_part = test.get('ruleid', 'baseline')
+        test_input_hash = hash_string(test.get('testinput', ''))
+        return f"{rule_part}-{test_input_hash}-{model}-{run_id}"
+    
+    def _create_test_result(self, test: Dict[str, Any], model: str, run_id: int,
+                            model_output: str) -> Dict[str, Any]:
+        """Create the result record for a test run."""
+        return {
+            "id": self._test_result_id(test, model, run_id),
+            "ruleid": test.get('ruleid'),
+            "rule": test.get('rule', ""),
+            "inverse": test.get('inverse', False),
+            "baseline": test.get('baseline', False),
+            "model": model,
+            "input": test.get('testinput', ""),
+            "output": model_output
         }
+    
+    def _create_error_result(self, test: Dict[str, Any], model: str, run_id: int,
+                             error: Exception) -> Dict[str, Any]:
+        """Create the result record for a test run that failed."""
+        result = self._create_test_result(test, model, run_id, "ERROR")
+        result["error"] = str(error)
+        return result
+    
+    def _apply_compliance(self, result: Dict[str, Any], test: Dict[str, Any], 
+                          eval_content: str):
+        """Record the compliance decision of the evaluator on a test result."""
+        lines = eval_content.strip().split("\n")
+        decision = lines[-1].strip().upper() if lines else "ERR"
+        
+        expected_compliance = "err" if test.get('inverse', False) else "ok"
+        actual_compliance = "ok" if decision == "OK" else "err"
         
-        return summary
+        result["complianceText"] = eval_content
+        result["compliance"] = actual_compliance
+        result["compliance_matched"] = actual_compliance == expected_compliance
     
     def _save_results(self, context: Dict[str, Any], output_json_path: str):
         """Save results to files."""
@@ -624,18 +1813,21 @@ class PythonPromptPex:
                 validity_status = validity.get("validity", "")
                 f.write(f"{testid},\"{test}\",{validity_status}\n")
                 
-        with open(os.path.join(base_dir, "test_results.csv"), 'w', encoding='utf-8') as f:
-            f.write("id,ruleid,rule,inverse,model,input,output,compliance\n")
-            for result in context["test_results"]:
-                result_id = result.get("id", "")
-                ruleid = result.get("ruleid", "")
-                rule = result.get("rule", "").replace(",", "\\,").replace("\n", "\\n").replace("\"", "\"\"")
-                inverse = "TRUE" if result.get("inverse", False) else "FALSE"
-                model = result.get("model", "")
-                input_text = result.get("input", "").replace(",", "\\,").replace("\n", "\\n").replace("\"", "\"\"")
-                output_text = result.get("output", "").replace(",", "\\,").replace("\n", "\\n").replace("\"", "\"\"")
-                compliance = result.get("compliance", "")
-                f.write(f"{result_id},{ruleid},\"{rule}\",{inverse},{model},\"{input_text}\",\"{output_text}\",{compliance}\n")
+        if context.get("test_filter"):
+            with open(os.path.join(base_dir, "near_duplicates.csv"), 'w', encoding='utf-8') as f:
+                f.write("testid,ruleid,inverse,testinput,duplicate_of,duplicate_ruleid,similarity\n")
+                for item in context["test_filter"]["dropped"]:
+                    inverse = "TRUE" if item["inverse"] else "FALSE"
+                    testinput = item["testinput"].replace(",", "\\,").replace("\n", "\\n").replace("\"", "\"\"")
+                    f.write(f"{item['index']},{item['ruleid']},{inverse},\"{testinput}\",{item['duplicate_of']},"
+                            f"{item['duplicate_ruleid']},{item['similarity']}\n")
+        
+        # Streamed results already have their CSV written by the sink
+        if self.result_sink is None:
+            with open(os.path.join(base_dir, "test_results.csv"), 'w', encoding='utf-8') as f:
+                f.write(TEST_RESULTS_CSV_HEADER)
+                for result in context["test_results"]:
+                    f.write(format_test_result_row(result))
                 
         with open(os.path.join(base_dir, "summary.md"), 'w', encoding='utf-8') as f:
             summary = context["summary"]
@@ -666,11 +1858,49 @@ class PythonPromptPex:
             f.write(f"- Total tests: {summary['total_tests']}\n")
             f.write(f"- Rule-based tests: {summary['rule_tests']}\n")
             f.write(f"- Baseline tests: {summary['baseline_tests']}\n")
-            f.write(f"- Valid tests: {summary['valid_tests']} ({summary['valid_percentage']}%)\n\n")
+            f.write(f"- Valid tests: {summary['valid_tests']} ({summary['valid_percentage']}%)\n")
+            if context.get("test_filter"):
+                test_filter = context["test_filter"]
+                f.write(f"- Near-duplicate tests dropped: {len(test_filter['dropped'])} of {test_filter['tests']} "
+                        f"rule tests (similarity of at least {test_filter['threshold']})\n")
+            f.write("\n")
             
             f.write(f"## Test Results\n")
             f.write(f"- Total test runs: {summary['test_results']}\n")
-            f.write(f"- Compliant outputs: {summary['compliant_tests']} ({summary['compliant_percentage']}%)\n\n")
+            f.write(f"- Compliant outputs: {summary['compliant_tests']} ({summary['compliant_percentage']}%)\n")
+            if context.get("test_dedup"):
+                dedup = context["test_dedup"]
+                f.write(f"- Unique test inputs: {dedup['unique_inputs']} of {dedup['test_inputs']} "
+                        f"({dedup['saved_calls']} requests saved by deduplication)\n")
+            if context.get("test_parsing"):
+                parsing = context["test_parsing"]
+                f.write(f"- Test parse yield: {parsing['yield_percentage']}% ({parsing['rows']} rows parsed, "
+                        f"{parsing['recovered_rows']} repaired, {parsing['dropped_rows']} dropped, "
+                        f"{parsing['empty_responses']} of {parsing['responses']} answers without tests)\n")
+            if context.get("early_stopping"):
+                stopping = context["early_stopping"]
+                f.write(f"- Runs spent with early stopping: {stopping['runs']} of {stopping['planned_runs']} "
+                        f"({stopping['stopped_early']} test/model pairs stable before "
+                        f"{stopping['max_runs']} runs at {stopping['confidence']:.0%} confidence)\n")
+            if context.get("incremental"):
+                incremental = context["incremental"]
+                f.write(f"- Incremental re-run of {incremental['previous_run']}: "
+                        f"{len(incremental['unchanged_rules'])} of {summary['total_rules']} rules unchanged "
+                        f"({len(incremental['added_rules'])} added, {len(incremental['removed_rules'])} removed), "
+                        f"{incremental['reused_tests']} tests and {incremental['reused_results']} test runs reused"
+                        f"{' (prompt changed, so all tests were run again)' if incremental['prompt_changed'] else ''}\n")
+            if context.get("budget"):
+                budget = context["budget"]
+                f.write(f"- Budget: {budget['requests']} of {budget['max_requests'] or 'unlimited'} requests, "
+                        f"{budget['tokens']} of {budget['max_tokens'] or 'unlimited'} tokens used\n")
+                if budget.get("planned_tests") and (budget["tests_run"] < budget["planned_tests"] 
+                                                    or budget["runs_per_test"] < self.runs_per_test
+                                                    or budget["skipped_runs"] or budget["ungraded_runs"]):
+                    f.write(f"- Reduced by the budget to {budget['tests_run']} of {budget['planned_tests']} "
+                            f"tests, run {budget['runs_per_test']} of {self.runs_per_test} times each "
+                            f"({budget['skipped_runs']} test runs refused, {budget['ungraded_runs']} "
+                            f"outputs left ungraded)\n")
+            f.write("\n")
             
             if "model_results" in summary:
                 f.write(f"### Model-specific Results\n")
@@ -678,6 +1908,8 @@ class PythonPromptPex:
                     percentage = round((stats["ok"] / stats["total"] * 100) if stats["total"] else 0, 1)
                     f.write(f"- {model}: {stats['ok']}/{stats['total']} ({percentage}%) compliant\n")
         
+        self._save_metrics(context, base_dir)
+        
         logger.info(f"Component files saved to {base_dir}")
         
         html_report_path = os.path.join(base_dir, "report.html")
@@ -686,248 +1918,32 @@ class PythonPromptPex:
         except Exception as e:
             logger.error(f"Error generating HTML report to {html_report_path}: {e}")
     
-    def _generate_html_report(self, context: Dict[str, Any], output_path: str):
-        """Generate an HTML report from the test results."""
-        summary = context["summary"]
-        
-        html = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>PromptPEX Report</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; }}
-        h1, h2, h3, h4 {{ color: #333; margin-top: 30px; }}
-        .container {{ max-width: 1200px; margin: 0 auto; }}
-        .card {{ background: #fff; border-radius: 8px; padding: 20px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-        .stats {{ display: flex; flex-wrap: wrap; gap: 20px; }}
-        .stat-card {{ background: #f9f9f9; border-radius: 8px; padding: 15px; flex: 1; min-width: 200px; }}
-        .progress-bar {{ height: 10px; background: #e0e0e0; border-radius: 5px; overflow: hidden; margin-top: 5px; }}
-        .progress {{ height: 100%; background: #4CAF50; }}
-        table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-        th, td {{ border: 1px solid #ddd; padding: 12px; text-align: left; }}
-        th {{ background-color: #f2f2f2; }}
-        tr:nth-child(even) {{ background-color: #f9f9f9; }}
-        .model-chart {{ height: 250px; margin-top: 30px; }}
-        pre {{ background: #f5f5f5; padding: 15px; border-radius: 5px; overflow: auto; }}
-        .tab {{ overflow: hidden; border: 1px solid #ccc; background-color: #f1f1f1; }}
-        .tab button {{ background-color: inherit; float: left; border: none; outline: none; cursor: pointer; padding: 14px 16px; }}
-        .tab button:hover {{ background-color: #ddd; }}
-        .tab button.active {{ background-color: #ccc; }}
-        .tabcontent {{ display: none; padding: 6px 12px; border: 1px solid #ccc; border-top: none; }}
-        .show {{ display: block; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>PromptPEX Test Results</h1>
-        
-        <div class="card">
-            <h2>Summary</h2>
-            <div class="stats">
-                <div class="stat-card">
-                    <h3>Rules</h3>
-                    <p>{summary['total_rules']} total rules ({summary['grounded_rules']} grounded)</p>
-                    <div class="progress-bar">
-                        <div class="progress" style="width: {summary['grounded_percentage']}%;"></div>
-                    </div>
-                    <small>{summary['grounded_percentage']}% grounded</small>
-                </div>
-                
-                <div class="stat-card">
-                    <h3>Tests</h3>
-                    <p>{summary['total_tests']} total tests ({summary['valid_tests']} valid)</p>
-                    <div class="progress-bar">
-                        <div class="progress" style="width: {summary['valid_percentage']}%;"></div>
-                    </div>
-                    <small>{summary['valid_percentage']}% valid</small>
-                </div>
-                
-                <div class="stat-card">
-                    <h3>Test Results</h3>
-                    <p>{summary['test_results']} test runs ({summary['compliant_tests']} compliant)</p>
-                    <div class="progress-bar">
-                        <div class="progress" style="width: {summary['compliant_percentage']}%;"></div>
-                    </div>
-                    <small>{summary['compliant_percentage']}% compliant</small>
-                </div>
-            </div>
-        </div>
-        
-        <div class="card">
-            <h2>Model Results</h2>
-            <table>
-                <tr>
-                    <th>Model</th>
-                    <th>Compliant</th>
-                    <th>Total</th>
-                    <th>Compliance Rate</th>
-                </tr>
-                """
-                
-        for model, stats in summary.get("model_results", {}).items():
-            percentage = round((stats["ok"] / stats["total"] * 100) if stats["total"] else 0, 1)
-            html += f"""
-                <tr>
-                    <td>{model}</td>
-                    <td>{stats['ok']}</td>
-                    <td>{stats['total']}</td>
-                    <td>{percentage}%</td>
-                </tr>"""
-                
-        html += """
-            </table>
-        </div>
-        
-        <div class="card">
-            <div class="tab">
-                <button class="tablinks active" onclick="openTab(event, 'Rules')">Rules</button>
-                <button class="tablinks" onclick="openTab(event, 'Tests')">Tests</button>
-                <button class="tablinks" onclick="openTab(event, 'Results')">Results</button>
-            </div>
-            
-            <div id="Rules" class="tabcontent show">
-                <h3>Output Rules</h3>
-                <table>
-                    <tr>
-                        <th>#</th>
-                        <th>Rule</th>
-                        <th>Grounded</th>
-                    </tr>
-        """
-        
-        for i, rule in enumerate(context.get("rules", []), 1):
-            grounded = "Unknown"
-            for eval in context.get("rule_evaluations", []):
-                if eval.get("ruleid") == i:
-                    grounded = "Yes" if eval.get("grounded") == "ok" else "No"
-                    
-            html += f"""
-                    <tr>
-                        <td>{i}</td>
-                        <td>{rule}</td>
-                        <td>{grounded}</td>
-                    </tr>"""
-        
-        html += """
-                </table>
-                
-                <h3>Inverse Rules</h3>
-                <table>
-                    <tr>
-                        <th>#</th>
-                        <th>Inverse Rule</th>
-                    </tr>
-        """
-        
-        for i, rule in enumerate(context.get("inverse_rules", []), 1):
-            html += f"""
-                    <tr>
-                        <td>{i}</td>
-                        <td>{rule}</td>
-                    </tr>"""
-                    
-        html += """
-                </table>
-            </div>
-            
-            <div id="Tests" class="tabcontent">
-                <h3>Rule-Based Tests</h3>
-                <table>
-                    <tr>
-                        <th>Rule ID</th>
-                        <th>Inverse</th>
-                        <th>Test Input</th>
-                        <th>Expected Output</th>
-                    </tr>
-        """
-        
-        for test in context.get("tests", []):
-            inverse = "Yes" if test.get("inverse", False) else "No"
-            html += f"""
-                    <tr>
-                        <td>{test.get('ruleid', '')}</td>
-                        <td>{inverse}</td>
-                        <td>{test.get('testinput', '')[:100]}...</td>
-                        <td>{test.get('expectedoutput', '')[:100]}...</td>
-                    </tr>"""
-                    
-        html += """
-                </table>
-                
-                <h3>Baseline Tests</h3>
-                <table>
-                    <tr>
-                        <th>#</th>
-                        <th>Test Input</th>
-                    </tr>
-        """
+    def _save_metrics(self, context: Dict[str, Any], base_dir: str):
+        """Save the LLM call metrics of the run to metrics.json (and metrics.prom)."""
+        metrics = getattr(self.llm_client, "metrics", None)
+        if metrics is None:
+            return
         
-        for i, test in enumerate(context.get("baseline_tests", []), 1):
-            html += f"""
-                    <tr>
-                        <td>{i}</td>
-                        <td>{test.get('testinput', '')[:150]}...</td>
-                    </tr>"""
-                    
-        html += """
-                </table>
-            </div>
-            
-            <div id="Results" class="tabcontent">
-                <h3>Test Results</h3>
-                <p>Showing up to 50 most recent results</p>
-                <table>
-                    <tr>
-                        <th>Rule ID</th>
-                        <th>Model</th>
-                        <th>Input (excerpt)</th>
-                        <th>Output (excerpt)</th>
-                        <th>Compliance</th>
-                    </tr>
-        """
+        try:
+            report = {"run": context["name"], "step_timings": context.get("step_timings", {})}
+            report.update(metrics.to_dict(run=context["name"]))
+            with open(os.path.join(base_dir, "metrics.json"), 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            
+            if self.prometheus_metrics:
+                with open(os.path.join(base_dir, "metrics.prom"), 'w', encoding='utf-8') as f:
+                    f.write(metrics.to_prometheus(run=context["name"]))
+        except Exception as e:
+            logger.error(f"Error saving metrics to {base_dir}: {e}")
+    
+    def _generate_html_report(self, context: Dict[str, Any], output_path: str):
+        """Generate an HTML report from the test results.
         
-        for result in context.get("test_results", [])[:50]:
-            compliance = result.get('compliance', '')
-            compliance_display = "✓" if compliance == "ok" else "✗" if compliance == "err" else "-"
-            html += f"""
-                    <tr>
-                        <td>{result.get('ruleid', 'baseline')}</td>
-                        <td>{result.get('model', '')}</td>
-                        <td>{result.get('input', '')[:80]}...</td>
-                        <td>{result.get('output', '')[:80]}...</td>
-                        <td>{compliance_display}</td>
-                    </tr>"""
-                    
-        html += """
-                </table>
-            </div>
-        </div>
-    </div>
-    
-    <script>
-    function openTab(evt, tabName) {
-        var i, tabcontent, tablinks;
-        tabcontent = document.getElementsByClassName("tabcontent");
-        for (i = 0; i < tabcontent.length; i++) {
-            tabcontent[i].style.display = "none";
-        }
-        tablinks = document.getElementsByClassName("tablinks");
-        for (i = 0; i < tablinks.length; i++) {
-            tablinks[i].className = tablinks[i].className.replace(" active", "");
-        }
-        document.getElementById(tabName).style.display = "block";
-        evt.currentTarget.className += " active";
-    }
-    </script>
-</body>
-</html>
+        The report is written section by section and embeds every test result,
+        read back one at a time when they were streamed to disk.
         """
-        
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(html)
-            logger.info(f"HTML report saved to {output_path}")
+            count = write_html_report(context, self._iter_test_results(context), output_path)
+            logger.info(f"HTML report with {count} test results saved to {output_path}")
         except Exception as e:
             logger.error(f"Error writing HTML report to {output_path}: {e}")
\ No newline at end of file
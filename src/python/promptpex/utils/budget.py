@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Dict, Optional
+
+
+class BudgetExceededError(Exception):
+    """Raised when a request is refused because the run budget is spent."""
+
+
+class RequestBudget:
+    """Thread-safe hard limits on the requests and tokens spent by a client.
+
+    Every request attempt (retries included) is counted before it is sent.
+    The tokens a request may use (its prompt and up to ``max_tokens`` per
+    sample) are reserved up front and settled with the usage reported by the
+    API, so concurrent requests can never overshoot the token limit. Cached
+    responses cost nothing.
+    """
+
+    def __init__(self, max_requests: Optional[int] = None, max_tokens: Optional[int] = None):
+        """Initialize the budget.
+
+        Args:
+            max_requests: Maximum number of requests sent, or None for no limit
+            max_tokens: Maximum number of tokens (prompt and completion), or None for no limit
+        """
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.requests = 0
+        self.tokens = 0
+        self.refused = 0
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        """Whether any limit is set."""
+        return self.max_requests is not None or self.max_tokens is not None
+
+    def reserve(self, estimated_tokens: int):
+        """Count a request about to be sent and reserve the tokens it may use.
+
+        Raises:
+            BudgetExceededError: If the request or its tokens do not fit in the budget
+        """
+        with self._lock:
+            if self.max_requests is not None and self.requests >= self.max_requests:
+                self.refused += 1
+                raise BudgetExceededError(f"Request budget of {self.max_requests} requests spent")
+            if self.max_tokens is not None and self.tokens + self._reserved + estimated_tokens > self.max_tokens:
+                self.refused += 1
+                raise BudgetExceededError(f"Token budget of {self.max_tokens} tokens spent "
+                                          f"({self.tokens} used, {self._reserved} reserved)")
+            self.requests += 1
+            self._reserved += estimated_tokens
+
+    def settle(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """Replace the reservation of a finished request by the tokens it used.
+
+        Requests that failed, or whose usage is unknown, are charged nothing
+        and their whole reservation, respectively.
+        """
+        with self._lock:
+            self._reserved -= estimated_tokens
+            self.tokens += estimated_tokens if used_tokens is None else used_tokens
+
+    def remaining(self) -> Dict[str, Optional[int]]:
+        """Requests and tokens left, None for the unlimited ones."""
+        with self._lock:
+            return {
+                "requests": None if self.max_requests is None else max(0, self.max_requests - self.requests),
+                "tokens": None if self.max_tokens is None else max(0, self.max_tokens - self.tokens - self._reserved)
+            }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Export the limits and the spent requests and tokens."""
+        with self._lock:
+            return {
+                "max_requests": self.max_requests,
+                "max_tokens": self.max_tokens,
+                "requests": self.requests,
+                "tokens": self.tokens,
+                "refused_requests": self.refused
+            }
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "promptpex")
+
+
+class ResponseCache:
+    """Persistent, content-addressed cache of LLM responses backed by SQLite.
+    
+    The database runs in WAL mode so several threads and processes can read
+    and write the same cache concurrently. Each thread uses its own connection.
+    """
+    
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_age_seconds: Optional[float] = None,
+                 max_size_bytes: Optional[int] = None,
+                 prune_interval: int = 500):
+        """Open (or create) the cache.
+        
+        Args:
+            cache_dir: Directory holding the cache database
+            max_age_seconds: Entries older than this are evicted; None keeps them forever
+            max_size_bytes: Least recently used entries are evicted above this size;
+                None means unbounded
+            prune_interval: Number of writes between eviction passes
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "responses.sqlite")
+        self.max_age_seconds = max_age_seconds
+        self.max_size_bytes = max_size_bytes
+        self.prune_interval = max(1, prune_interval)
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        conn.commit()
+        self.prune()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str,
+                 temperature: float, max_tokens: int, sample: int = 0, n: int = 1) -> str:
+        """Compute the cache key of a request.
+        
+        Args:
+            model: Deployment name
+            system_prompt: System prompt
+            user_prompt: User prompt
+            temperature: Sampling temperature
+            max_tokens: Completion token limit
+            sample: Index of the sample when the same request is repeated on purpose
+            n: Number of samples generated by the request
+        
+        Returns:
+            Hex digest identifying the request
+        """
+        key = [model, system_prompt, user_prompt, temperature, max_tokens, sample]
+        if n != 1:
+            # Keys of single-sample requests are left as they were
+            key.append(n)
+        payload = json.dumps(key, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a response, or return None when missing or expired."""
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?",
+                               (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.max_age_seconds is not None
+                               and now - row[1] > self.max_age_seconds):
+                self._count(hit=False)
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._count(hit=True)
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading response cache {self.path}: {e}")
+            self._count(hit=False)
+            return None
+    
+    def _count(self, hit: bool):
+        """Update the hit/miss counters."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store a response."""
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode("utf-8")), now, now)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing response cache {self.path}: {e}")
+            return
+        
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % self.prune_interval == 0
+        if should_prune:
+            self.prune()
+    
+    def prune(self):
+        """Evict expired entries, then least recently used entries above the size limit."""
+        try:
+            conn = self._connection()
+            if self.max_age_seconds is not None:
+                conn.execute("DELETE FROM responses WHERE created_at < ?",
+                             (time.time() - self.max_age_seconds,))
+            if self.max_size_bytes is not None:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_size_bytes:
+                    excess = total - self.max_size_bytes
+                    evicted = 0
+                    keys = []
+                    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                        if evicted >= excess:
+                            break
+                        keys.append((key,))
+                        evicted += size
+                    conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Error pruning response cache {self.path}: {e}")
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_ordered(func: Callable[[T], R], items: Iterable[T], max_workers: int = 1) -> List[R]:
+    """Apply a function to each item on a bounded thread pool.
+    
+    Args:
+        func: Function to apply, typically one that issues an LLM call
+        items: Items to process
+        max_workers: Maximum number of worker threads; 1 runs sequentially
+    
+    Returns:
+        Results in the same order as the input items
+    
+    Raises:
+        Exception: The first exception raised by func, in input order
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        # Each item runs in a copy of the caller's context so context variables
+        # (e.g. metric labels) carry over to the worker threads
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+class SharedLimit:
+    """Limit on concurrent operations shared by threads and event loops.
+    
+    Used as a context manager from threads and as an async context manager
+    from coroutines, so the same budget applies to every caller in the process.
+    """
+    
+    def __init__(self, limit: int):
+        """Initialize the limit.
+        
+        Args:
+            limit: Maximum number of concurrent holders
+        """
+        self.limit = max(1, limit)
+        self._semaphore = threading.BoundedSemaphore(self.limit)
+    
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+    
+    async def __aenter__(self):
+        # Waiting happens off the event loop so other coroutines keep running
+        if not self._semaphore.acquire(blocking=False):
+            acquiring = asyncio.ensure_future(asyncio.to_thread(self._semaphore.acquire))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The waiting thread still gets the permit: give it back once it does
+                acquiring.add_done_callback(lambda _: self._semaphore.release())
+                raise
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
@@ -0,0 +1,114 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+_shared_providers: Dict[str, "CachedTokenProvider"] = {}
+_shared_lock = threading.Lock()
+
+
+class CachedTokenProvider:
+    """Bearer token provider that caches tokens and refreshes them before they expire.
+    
+    Instances are callables returning the token string, as expected by the
+    ``azure_ad_token_provider`` argument of the OpenAI clients. Any object with
+    a ``get_token(scope)`` method returning ``.token`` and ``.expires_on``
+    (seconds since the epoch) can be used as the credential.
+    """
+    
+    def __init__(self, credential: Optional[Any] = None,
+                 scope: str = COGNITIVE_SERVICES_SCOPE,
+                 refresh_margin: float = 300):
+        """Initialize the provider.
+        
+        Args:
+            credential: Credential to get tokens from; defaults to a
+                DefaultAzureCredential created on first use
+            scope: Scope of the requested tokens
+            refresh_margin: Refresh tokens this many seconds before they expire
+        """
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self._credential = credential
+        self._token = None
+        self._lock = threading.Lock()
+    
+    def _get_credential(self) -> Any:
+        if self._credential is None:
+            from azure.identity import DefaultAzureCredential
+            self._credential = DefaultAzureCredential()  # CodeQL [SM05139] This is non-production testing code which is not deployed.
+        return self._credential
+    
+    def _remaining(self, token) -> float:
+        return token.expires_on - time.time() if token else 0.0
+    
+    def __call__(self) -> str:
+        """Get a valid token, refreshing it if it is about to expire."""
+        token = self._token
+        remaining = self._remaining(token)
+        if remaining > self.refresh_margin:
+            return token.token
+        
+        if remaining > 0:
+            # Still valid: one caller refreshes while the others keep using it
+            if not self._lock.acquire(blocking=False):
+                return token.token
+        else:
+            self._lock.acquire()
+        
+        try:
+            token = self._token
+            if self._remaining(token) > self.refresh_margin:
+                return token.token
+            try:
+                self._token = self._get_credential().get_token(self.scope)
+                logger.info(f"Acquired token for {self.scope}, valid for "
+                            f"{int(self._remaining(self._token))}s")
+            except Exception as e:
+                if self._remaining(token) > 0:
+                    logger.warning(f"Token refresh failed, using the current token until it expires: {e}")
+                    return token.token
+                raise
+            return self._token.token
+        finally:
+            self._lock.release()
+    
+    async def get_async(self) -> str:
+        """Get a valid token from a coroutine, refreshing it on a worker thread.
+        
+        The credential is synchronous, so refreshing from the event loop would
+        stall every other request of the loop until the token arrives.
+        """
+        token = self._token
+        if self._remaining(token) > self.refresh_margin:
+            return token.token
+        return await asyncio.to_thread(self)
+
+
+def get_token_provider(scope: str = COGNITIVE_SERVICES_SCOPE) -> CachedTokenProvider:
+    """Get the process-wide token provider of a scope.
+    
+    All clients share it, so the credential chain is probed and each token
+    is acquired only once per process.
+    """
+    with _shared_lock:
+        provider = _shared_providers.get(scope)
+        if provider is None:
+            provider = CachedTokenProvider(scope=scope)
+            _shared_providers[scope] = provider
+        return provider
+
+
+def async_token_provider(provider: Callable[[], str]) -> Callable[[], Awaitable[str]]:
+    """Adapt a token provider to the async OpenAI client without blocking its event loop."""
+    if isinstance(provider, CachedTokenProvider):
+        return provider.get_async
+    
+    async def get_token() -> str:
+        return await asyncio.to_thread(provider)
+    return get_token
@@ -0,0 +1,84 @@
+import os
+import json
+from typing import Any, Dict, List, Tuple
+
+from .helpers import hash_string
+from .result_sink import ResultSink
+
+
+def load_results(results_json_path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Load the context and the test results of a previous run.
+
+    Test results streamed to a JSONL file (``test_results_file``) are read
+    back from it.
+
+    Returns:
+        Tuple of the context and the list of test results
+    """
+    with open(results_json_path, 'r', encoding='utf-8') as f:
+        context = json.load(f)
+
+    if context.get("test_results_file"):
+        results_dir, results_file = os.path.split(os.path.join(
+            os.path.dirname(results_json_path), context["test_results_file"]))
+        results = list(ResultSink(results_dir, os.path.splitext(results_file)[0]))
+    else:
+        results = context.get("test_results", [])
+    return context, results
+
+
+def diff_rules(previous_rules: List[str], rules: List[str]) -> Dict[str, Any]:
+    """Compare two lists of output rules by their ``hash_string`` id.
+
+    Returns:
+        Dictionary with the previous ruleid of each unchanged rule keyed by its
+        new ruleid ("unchanged"), the ruleids of the added rules ("added") and
+        the previous ruleids of the removed rules ("removed")
+    """
+    previous_ids = {}
+    for rule_id, rule in enumerate(previous_rules, 1):
+        previous_ids.setdefault(hash_string(rule), rule_id)
+
+    unchanged = {}
+    added = []
+    for rule_id, rule in enumerate(rules, 1):
+        previous_id = previous_ids.get(hash_string(rule))
+        if previous_id is None or previous_id in unchanged.values():
+            added.append(rule_id)
+        else:
+            unchanged[rule_id] = previous_id
+    removed = [rule_id for rule_id in range(1, len(previous_rules) + 1) if rule_id not in unchanged.values()]
+    return {"unchanged": unchanged, "added": added, "removed": removed}
+
+
+class PreviousRun:
+    """A previous run of a prompt, indexed for an incremental re-run."""
+
+    def __init__(self, context: Dict[str, Any], results: List[Dict[str, Any]], path: str):
+        """Initialize the previous run.
+
+        Args:
+            context: Context of the previous run
+            results: Test results of the previous run
+            path: Path to the JSON results of the previous run
+        """
+        self.context = context
+        self.path = path
+        self.name = context.get("name", "")
+        # Failed runs are run again
+        self.results = {result["id"]: result for result in results
+                        if "id" in result and "error" not in result}
+
+    @classmethod
+    def load(cls, results_json_path: str) -> "PreviousRun":
+        """Load a previous run from its JSON results."""
+        context, results = load_results(results_json_path)
+        return cls(context, results, results_json_path)
+
+    def provenance(self, **ids: Any) -> Dict[str, Any]:
+        """Marker of an item reused from this run, with its ids in this run."""
+        return {"run": self.name, **ids}
+
+    def prompt_changed(self, prompt: str) -> bool:
+        """Whether a prompt differs from the prompt of this run."""
+        return hash_string(prompt) != hash_string(self.context.get("prompt", ""))
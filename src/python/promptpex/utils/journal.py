@@ -0,0 +1,99 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RunJournal:
+    """Append-only JSONL journal of a pipeline run, used to resume interrupted runs.
+
+    Each line is one event: the run header (context name and prompt hash),
+    a completed pipeline step with its value, or a completed test result.
+    """
+
+    def __init__(self, path: str):
+        """Initialize the journal.
+
+        Args:
+            path: Path of the JSONL journal file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self, prompt_hash: str) -> Optional[Dict[str, Any]]:
+        """Read the state recorded by a previous run of the same prompt.
+
+        Args:
+            prompt_hash: Hash of the prompt being run; journals of other prompts are ignored
+
+        Returns:
+            Dictionary with the context "name", completed "steps" and "test_results"
+            (keyed by result id), or None if there is nothing to resume
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        state = {"name": None, "steps": {}, "test_results": {}}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves a truncated last line
+                    logger.warning(f"Ignoring malformed journal line {line_number} in {self.path}")
+                    continue
+                if entry.get("type") == "start":
+                    if entry.get("prompt_hash") != prompt_hash:
+                        logger.warning(f"Journal {self.path} belongs to a different prompt, not resuming")
+                        return None
+                    state["name"] = entry.get("name")
+                elif entry.get("type") == "step":
+                    state["steps"][entry["key"]] = entry["value"]
+                elif entry.get("type") == "test_result":
+                    result = entry["value"]
+                    state["test_results"][result["id"]] = result
+
+        return state if state["name"] else None
+
+    def start(self, name: str, prompt_hash: str, append: bool = False):
+        """Open the journal for writing.
+
+        Args:
+            name: Context name of the run
+            prompt_hash: Hash of the prompt being run
+            append: Continue an existing journal instead of starting a new one
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a' if append else 'w', encoding='utf-8')
+        if not append:
+            self._write({"type": "start", "name": name, "prompt_hash": prompt_hash})
+
+    def record_step(self, key: str, value: Any):
+        """Record the value of a completed pipeline step."""
+        self._write({"type": "step", "key": key, "value": value})
+
+    def record_test_result(self, result: Dict[str, Any]):
+        """Record a completed test result."""
+        self._write({"type": "test_result", "value": result})
+
+    def close(self):
+        """Close the journal file."""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _write(self, entry: Dict[str, Any]):
+        """Append one entry and flush it to disk."""
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
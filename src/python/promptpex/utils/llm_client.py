@@ -1,80 +1,535 @@
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional
+import re
+import time
+import asyncio
 import logging
-from openai import AzureOpenAI
-from azure.identity import DefaultAzureCredential
+import threading
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, nullcontext
+from openai import AzureOpenAI, AsyncAzureOpenAI, BadRequestError, UnprocessableEntityError
+
+from .budget import BudgetExceededError, RequestBudget
+from .cache import ResponseCache
+from .concurrency import SharedLimit
+from .credentials import async_token_provider, get_token_provider
+from .metrics import MetricsRecorder
+from .rate_limit import RateLimiter, RetryPolicy, estimate_tokens, get_retry_after, is_rate_limited, RETRYABLE_ERRORS
 
 logger = logging.getLogger(__name__)
 
+# Error messages about the n (number of samples) parameter, e.g. "'n' is not
+# supported", "n must be 1" or "Unsupported parameter: n"
+_N_PARAMETER_MESSAGE = re.compile(r"['\"`]n['\"`]|\bn\s*(?:[<>=]|must\b|should\b|cannot\b|is not\b)|\bparameter:?\s+n\b")
 
-class AzureOpenAIClient:
-    """Client for calling Azure OpenAI API."""
+
+def _rejects_multi_sample(error: Exception) -> bool:
+    """Check whether an API error rejects the n (number of samples) parameter of a request.
     
-    def __init__(self, azure_config: Dict[str, str]):
-        """Initialize the Azure OpenAI client.
+    Other invalid requests (e.g. content filtered prompts) are not about n.
+    """
+    if not isinstance(error, (BadRequestError, UnprocessableEntityError)):
+        return False
+    if getattr(error, "param", None) == "n" or getattr(error, "code", None) == "n":
+        return True
+    return bool(_N_PARAMETER_MESSAGE.search(getattr(error, "message", None) or str(error)))
+
+
+class LLMClient(ABC):
+    """Base class of the LLM clients.
+    
+    Implements response caching, client-side rate limits, retries, concurrency
+    limits and metrics on top of a transport provided by subclasses through
+    ``_complete`` and ``_complete_async`` (plus ``_open_async_transport`` and
+    ``_close_async_transport`` for transports bound to an event loop).
+    Requests are chat completion parameters and responses have the shape of
+    the OpenAI SDK responses.
+    """
+    
+    def __init__(self, azure_config: Dict[str, str],
+                 max_concurrency: int = 8,
+                 model_concurrency: Optional[Dict[str, int]] = None,
+                 cache: Optional[ResponseCache] = None,
+                 max_in_flight: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 metrics: Optional[MetricsRecorder] = None,
+                 budget: Optional[RequestBudget] = None):
+        """Initialize the client.
         
         Args:
-            azure_config: Dictionary with Azure OpenAI configuration
+            azure_config: Dictionary with the deployment configuration; its
+                "azure_deployment" is the default model
+            max_concurrency: Maximum number of in-flight async requests
+            model_concurrency: Optional per-deployment limits on in-flight async requests
+            cache: Optional persistent cache of responses
+            max_in_flight: Optional process-wide limit on in-flight requests, shared
+                by every thread and event loop using this client
+            rate_limiter: Optional per-deployment requests/min and tokens/min limits
+                with adaptive concurrency
+            retry_policy: Retry policy for throttled and transient errors; defaults
+                to RetryPolicy()
+            metrics: Recorder of per-call latency, token usage and retries; a new
+                one is created by default
+            budget: Optional hard limits on the requests and tokens sent; requests
+                beyond them fail with BudgetExceededError
         """
         self.azure_config = azure_config
-        self.client = self._setup_client()
+        self.cache = cache
+        self.request_limit = SharedLimit(max_in_flight) if max_in_flight else nullcontext()
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.metrics = metrics or MetricsRecorder()
+        self.budget = budget
+        self.max_concurrency = max(1, max_concurrency)
+        self.model_concurrency = model_concurrency or {}
+        self._async_state: Dict[asyncio.AbstractEventLoop, Dict[str, Any]] = {}
+        self._async_lock = threading.Lock()
+        # Deployments that rejected multi-sample (n>1) requests
+        self._single_sample_models = set()
     
-    def _setup_client(self) -> AzureOpenAI:
-        """Set up the Azure OpenAI client."""
-        credential = DefaultAzureCredential()  # CodeQL [SM05139] This is non-production testing code which is not deployed.        token = credential.get_token("https://cognitiveservices.azure.com/.default").token
-        base_url = self.azure_config["azure_endpoint"].strip()
-        if not base_url:
-            raise ValueError("Azure OpenAI endpoint URL cannot be empty")
-        if not base_url.startswith(("http://", "https://")):
-            base_url = f"https://{base_url}"
+    @abstractmethod
+    def _complete(self, request: Dict[str, Any]) -> Any:
+        """Send a chat completion request and return the SDK-shaped response."""
+    
+    @abstractmethod
+    async def _complete_async(self, transport: Any, request: Dict[str, Any]) -> Any:
+        """Async counterpart of ``_complete``, using the transport of the current session."""
+    
+    def _open_async_transport(self) -> Any:
+        """Create the transport of an async session, e.g. a connection pool."""
+        return None
+    
+    async def _close_async_transport(self, transport: Any):
+        """Close the transport of an async session."""
+    
+    def _build_request(self, system_prompt: str, user_prompt: str, model: Optional[str],
+                       temperature: float, max_tokens: int, n: int = 1) -> Dict[str, Any]:
+        """Build the chat completion request parameters."""
+        if not model:
+            model = self.azure_config["azure_deployment"]
+        return {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "n": n,
+            "stop": None,
+            "timeout": 30
+        }
+    
+    def _format_response(self, response: Any) -> Dict[str, Any]:
+        """Convert an SDK response into the dictionary shape used by the pipeline."""
+        return {
+            "choices": [
+                {
+                    "message": {
+                        "content": choice.message.content
+                    }
+                }
+                for choice in response.choices
+            ]
+        }
+    
+    def _cache_key(self, request: Dict[str, Any], sample: int) -> Optional[str]:
+        """Compute the response cache key of a request, or None when caching is off."""
+        if self.cache is None:
+            return None
+        messages = request["messages"]
+        return ResponseCache.make_key(request["model"], messages[0]["content"], messages[1]["content"],
+                                      request["temperature"], request["max_tokens"], sample, request["n"])
+    
+    def _multi_sample_supported(self, model: Optional[str]) -> bool:
+        """Whether multi-sample (n>1) requests can be sent to a deployment."""
+        return (model or self.azure_config["azure_deployment"]) not in self._single_sample_models
+    
+    def _multi_sample_rejected(self, error: Exception, request: Dict[str, Any]) -> bool:
+        """Check whether a multi-sample request failed because its deployment does not support n>1.
+        
+        Only errors about the n parameter count (see ``_rejects_multi_sample``); the
+        deployments rejecting it are remembered, so their later requests ask for
+        one sample at a time.
+        """
+        if request["n"] == 1 or not _rejects_multi_sample(error):
+            return False
+        with self._async_lock:
+            self._single_sample_models.add(request["model"])
+        logger.warning(f"{request['model']} rejected a request for {request['n']} samples, "
+                       f"requesting samples one at a time: {error}")
+        return True
+    
+    def _retry_delay(self, error: Exception, attempt: int, limiter) -> Optional[float]:
+        """Compute the delay before retrying a failed request, or None if it should not be retried."""
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= self.retry_policy.max_retries:
+            return None
+        if limiter and is_rate_limited(error):
+            limiter.on_throttle()
+        return self.retry_policy.delay(attempt, get_retry_after(error))
+    
+    def _request_limits(self, request: Dict[str, Any]):
+        """Get the rate limiter of the request deployment and the tokens the request may use."""
+        if self.rate_limiter is None and self.budget is None:
+            return None, 0
+        messages = request["messages"]
+        estimated = (estimate_tokens(messages[0]["content"] + messages[1]["content"]) 
+                     + request["max_tokens"] * request["n"])
+        limiter = self.rate_limiter.for_model(request["model"]) if self.rate_limiter else None
+        return limiter, estimated
+    
+    def _send(self, request: Dict[str, Any]) -> Any:
+        """Send a request, waiting for rate limits and retrying throttled or transient errors."""
+        limiter, estimated = self._request_limits(request)
+        start = time.monotonic()
+        attempt = throttled = 0
+        while True:
+            if self.budget:
+                self.budget.reserve(estimated)
+            if limiter:
+                delay = limiter.reserve(estimated)
+                if delay > 0:
+                    time.sleep(delay)
+                limiter.concurrency.acquire()
+            try:
+                with self.request_limit:
+                    response = self._complete(request)
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                if limiter:
+                    limiter.concurrency.release()
+            
+            usage = getattr(response, "usage", None) if error is None else None
+            if self.budget:
+                # Failed requests are charged nothing, responses without usage their reservation
+                self.budget.settle(estimated, getattr(usage, "total_tokens", None) if error is None else 0)
+            if error is None:
+                if limiter:
+                    limiter.on_success(estimated, getattr(usage, "total_tokens", None))
+                self.metrics.record_request(request["model"], start, time.monotonic(), attempt, 
+                                            throttled, usage)
+                return response
             
-        return AzureOpenAI(
-            api_key=token,
-            api_version=self.azure_config["api_version"],
-            azure_endpoint=base_url
-        )
-    
-    def call_openai(self, system_prompt: str, user_prompt: str, 
-                    model: Optional[str] = None) -> Dict[str, Any]:
+            throttled += is_rate_limited(error)
+            delay = self._retry_delay(error, attempt, limiter)
+            if delay is None:
+                self.metrics.record_request(request["model"], start, time.monotonic(), attempt,
+                                            throttled, error=True)
+                raise error
+            logger.warning(f"Retrying request to {request['model']} in {delay:.1f}s "
+                           f"(attempt {attempt + 1}/{self.retry_policy.max_retries}): {error}")
+            time.sleep(delay)
+            attempt += 1
+    
+    def call_openai(self, system_prompt: str, user_prompt: str,
+                    model: Optional[str] = None, temperature: float = 0.2,
+                    max_tokens: int = 4000, sample: int = 0, n: int = 1) -> Dict[str, Any]:
         """Call the Azure OpenAI API.
         
         Args:
             system_prompt: System prompt to send
             user_prompt: User prompt to send
             model: Model to use, defaults to the one in azure_config
-            
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            sample: Index of the sample when the same request is deliberately
+                repeated (e.g. runs of a test); keeps repeated runs distinct in the cache
+            n: Number of samples (choices) to generate in one request; samples are
+                requested one at a time, as ``sample``, ``sample + 1``, ..., from
+                deployments not supporting it
+        
         Returns:
-            Response from the API
-            
+            Response from the API, with ``n`` choices
+        
         Raises:
             Exception: If there's an error calling the API
         """
+        if n > 1 and not self._multi_sample_supported(model):
+            return self._merge_samples([
+                self.call_openai(system_prompt, user_prompt, model, temperature, max_tokens, sample + i)
+                for i in range(n)
+            ])
+        
         try:
-            if not model:
-                model = self.azure_config["azure_deployment"]
-                
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.2,
-                max_tokens=4000,
-                n=1,
-                stop=None,
-                timeout=30
-            )
+            request = self._build_request(system_prompt, user_prompt, model, temperature, max_tokens, n)
+            cache_key = self._cache_key(request, sample)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.metrics.record_cache_hit(request["model"])
+                    return cached
             
-            return {
-                "choices": [
-                    {
-                        "message": {
-                            "content": response.choices[0].message.content
-                        }
-                    }
-                ]
+            try:
+                response = self._send(request)
+            except Exception as e:
+                if not self._multi_sample_rejected(e, request):
+                    raise
+                return self.call_openai(system_prompt, user_prompt, model, temperature, 
+                                        max_tokens, sample, n)
+            result = self._format_response(response)
+            # Top up answers with fewer choices than requested
+            for i in range(len(result["choices"]), n):
+                result["choices"].extend(self.call_openai(system_prompt, user_prompt, model, temperature,
+                                                          max_tokens, sample + i)["choices"])
+            if cache_key is not None:
+                self.cache.set(cache_key, result)
+            return result
+        
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            logger.error(f"Error calling Azure OpenAI API: {e}")
+            raise
+    
+    @staticmethod
+    def _merge_samples(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge single-sample responses into one response with all their choices."""
+        return {"choices": [choice for result in results for choice in result["choices"]]}
+    
+    @asynccontextmanager
+    async def async_session(self):
+        """Open an async client and concurrency limits bound to the running event loop.
+        
+        The underlying async transport (e.g. a connection pool) and semaphores
+        cannot be shared across event loops, so each loop gets its own state which is
+        closed when the session exits.
+        """
+        loop = asyncio.get_running_loop()
+        state = {
+            "transport": self._open_async_transport(),
+            "semaphore": asyncio.Semaphore(self.max_concurrency),
+            "model_semaphores": {
+                model: asyncio.Semaphore(max(1, limit))
+                for model, limit in self.model_concurrency.items()
             }
-            
+        }
+        with self._async_lock:
+            self._async_state[loop] = state
+        try:
+            yield self
+        finally:
+            with self._async_lock:
+                self._async_state.pop(loop, None)
+            await self._close_async_transport(state["transport"])
+    
+    async def call_openai_async(self, system_prompt: str, user_prompt: str,
+                                model: Optional[str] = None, temperature: float = 0.2,
+                                max_tokens: int = 4000, sample: int = 0, n: int = 1) -> Dict[str, Any]:
+        """Call the Azure OpenAI API without blocking the event loop.
+        
+        Must be awaited inside ``async_session``. The number of in-flight
+        requests is bounded by ``max_concurrency`` overall and by
+        ``model_concurrency`` for each listed deployment.
+        
+        Args:
+            system_prompt: System prompt to send
+            user_prompt: User prompt to send
+            model: Model to use, defaults to the one in azure_config
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+            sample: Index of the sample when the same request is deliberately repeated
+            n: Number of samples (choices) to generate in one request
+        
+        Returns:
+            Response from the API, with ``n`` choices
+        
+        Raises:
+            RuntimeError: If called outside of ``async_session``
+            Exception: If there's an error calling the API
+        """
+        state = self._async_state.get(asyncio.get_running_loop())
+        if state is None:
+            raise RuntimeError("call_openai_async must be used inside async_session()")
+        
+        if n > 1 and not self._multi_sample_supported(model):
+            return self._merge_samples(await asyncio.gather(*[
+                self.call_openai_async(system_prompt, user_prompt, model, temperature, max_tokens, sample + i)
+                for i in range(n)
+            ]))
+        
+        request = self._build_request(system_prompt, user_prompt, model, temperature, max_tokens, n)
+        cache_key = self._cache_key(request, sample)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.metrics.record_cache_hit(request["model"])
+                return cached
+        
+        try:
+            try:
+                response = await self._send_async(state, request)
+            except Exception as e:
+                if not self._multi_sample_rejected(e, request):
+                    raise
+                return await self.call_openai_async(system_prompt, user_prompt, model, temperature,
+                                                    max_tokens, sample, n)
+            result = self._format_response(response)
+            # Top up answers with fewer choices than requested
+            if len(result["choices"]) < n:
+                result = self._merge_samples([result] + await asyncio.gather(*[
+                    self.call_openai_async(system_prompt, user_prompt, model, temperature, max_tokens, sample + i)
+                    for i in range(len(result["choices"]), n)
+                ]))
+            if cache_key is not None:
+                self.cache.set(cache_key, result)
+            return result
+        
+        except BudgetExceededError:
+            raise
         except Exception as e:
             logger.error(f"Error calling Azure OpenAI API: {e}")
-            raise
\ No newline at end of file
+            raise
+    
+    async def _send_async(self, state: Dict[str, Any], request: Dict[str, Any]) -> Any:
+        """Async counterpart of ``_send``, also applying the session concurrency limits."""
+        limiter, estimated = self._request_limits(request)
+        # Wait on the per-model limit first so a saturated deployment does not
+        # hold global slots that other deployments could use.
+        model_semaphore = state["model_semaphores"].get(request["model"]) or nullcontext()
+        start = time.monotonic()
+        attempt = throttled = 0
+        while True:
+            if self.budget:
+                self.budget.reserve(estimated)
+            if limiter:
+                delay = limiter.reserve(estimated)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await limiter.concurrency.acquire_async()
+            try:
+                async with model_semaphore:
+                    async with state["semaphore"]:
+                        async with self.request_limit:
+                            response = await self._complete_async(state["transport"], request)
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                if limiter:
+                    limiter.concurrency.release()
+            
+            usage = getattr(response, "usage", None) if error is None else None
+            if self.budget:
+                # Failed requests are charged nothing, responses without usage their reservation
+                self.budget.settle(estimated, getattr(usage, "total_tokens", None) if error is None else 0)
+            if error is None:
+                if limiter:
+                    limiter.on_success(estimated, getattr(usage, "total_tokens", None))
+                self.metrics.record_request(request["model"], start, time.monotonic(), attempt, 
+                                            throttled, usage)
+                return response
+            
+            throttled += is_rate_limited(error)
+            delay = self._retry_delay(error, attempt, limiter)
+            if delay is None:
+                self.metrics.record_request(request["model"], start, time.monotonic(), attempt,
+                                            throttled, error=True)
+                raise error
+            logger.warning(f"Retrying request to {request['model']} in {delay:.1f}s "
+                           f"(attempt {attempt + 1}/{self.retry_policy.max_retries}): {error}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class AzureOpenAIClient(LLMClient):
+    """Client for calling Azure OpenAI API."""
+    
+    def __init__(self, azure_config: Dict[str, str],
+                 max_concurrency: int = 8,
+                 model_concurrency: Optional[Dict[str, int]] = None,
+                 cache: Optional[ResponseCache] = None,
+                 max_in_flight: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 token_provider: Optional[Callable[[], str]] = None,
+                 metrics: Optional[MetricsRecorder] = None,
+                 budget: Optional[RequestBudget] = None):
+        """Initialize the Azure OpenAI client.
+        
+        Args:
+            azure_config: Dictionary with Azure OpenAI configuration
+            max_concurrency: Maximum number of in-flight async requests
+            model_concurrency: Optional per-deployment limits on in-flight async requests
+            cache: Optional persistent cache of responses
+            max_in_flight: Optional process-wide limit on in-flight requests, shared
+                by every thread and event loop using this client
+            rate_limiter: Optional per-deployment requests/min and tokens/min limits
+                with adaptive concurrency
+            retry_policy: Retry policy for throttled and transient errors; defaults
+                to RetryPolicy()
+            token_provider: Callable returning a bearer token; defaults to the
+                process-wide cached provider backed by DefaultAzureCredential.
+                The async client calls it on a worker thread
+            metrics: Recorder of per-call latency, token usage and retries; a new
+                one is created by default
+            budget: Optional hard limits on the requests and tokens sent
+        """
+        super().__init__(azure_config, max_concurrency=max_concurrency,
+                         model_concurrency=model_concurrency, cache=cache,
+                         max_in_flight=max_in_flight, rate_limiter=rate_limiter,
+                         retry_policy=retry_policy, metrics=metrics, budget=budget)
+        self.token_provider = token_provider or get_token_provider()
+        self._client_kwargs = self._get_client_kwargs()
+        # Token refreshes must not block the event loop of the async client
+        self._async_client_kwargs = {**self._client_kwargs,
+                                     "azure_ad_token_provider": async_token_provider(self.token_provider)}
+        self.client = self._setup_client()
+    
+    def _get_client_kwargs(self) -> Dict[str, Any]:
+        """Resolve the endpoint and credentials shared by the sync and async clients."""
+        base_url = self.azure_config["azure_endpoint"].strip()
+        if not base_url:
+            raise ValueError("Azure OpenAI endpoint URL cannot be empty")
+        if not base_url.startswith(("http://", "https://")):
+            base_url = f"https://{base_url}"
+        
+        return {
+            # Tokens are fetched per request from the cached provider, so long
+            # runs keep working past the lifetime of a single token
+            "azure_ad_token_provider": self.token_provider,
+            "api_version": self.azure_config["api_version"],
+            "azure_endpoint": base_url,
+            # Retries are handled by the client so they respect the rate limiter
+            "max_retries": 0
+        }
+    
+    def _setup_client(self) -> AzureOpenAI:
+        """Set up the Azure OpenAI client."""
+        return AzureOpenAI(**self._client_kwargs)
+    
+    def _complete(self, request: Dict[str, Any]) -> Any:
+        return self.client.chat.completions.create(**request)
+    
+    def _open_async_transport(self) -> AsyncAzureOpenAI:
+        return AsyncAzureOpenAI(**self._async_client_kwargs)
+    
+    async def _close_async_transport(self, transport: AsyncAzureOpenAI):
+        await transport.close()
+    
+    async def _complete_async(self, transport: AsyncAzureOpenAI, request: Dict[str, Any]) -> Any:
+        return await transport.chat.completions.create(**request)
+
+
+class PlanningClient(LLMClient):
+    """Client of dry runs (e.g. ``PythonPromptPex.plan``), refusing to send any request.
+    
+    It provides the default deployment and the budget a plan is checked
+    against, without resolving an endpoint or credentials.
+    """
+    
+    def __init__(self, azure_config: Dict[str, str], budget: Optional[RequestBudget] = None):
+        """Initialize the planning client.
+        
+        Args:
+            azure_config: Dictionary whose "azure_deployment" is the default model
+            budget: Optional limits on the requests and tokens the plan is checked against
+        """
+        super().__init__(azure_config, budget=budget)
+    
+    def _complete(self, request: Dict[str, Any]) -> Any:
+        raise RuntimeError(f"Dry run: no requests are sent (request to {request['model']})")
+    
+    async def _complete_async(self, transport: Any, request: Dict[str, Any]) -> Any:
+        self._complete(request)
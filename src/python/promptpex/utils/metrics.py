@@ -0,0 +1,209 @@
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# Upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Labels attached to the LLM calls made in the current context; worker threads
+# and tasks inherit them when started from a copy of the caller's context
+current_run: contextvars.ContextVar[str] = contextvars.ContextVar("promptpex_run", default="")
+current_step: contextvars.ContextVar[str] = contextvars.ContextVar("promptpex_step", default="other")
+
+
+@contextmanager
+def metric_scope(run: Optional[str] = None, step: Optional[str] = None):
+    """Label the LLM calls made inside the block with a run and/or a pipeline step."""
+    tokens = []
+    if run is not None:
+        tokens.append((current_run, current_run.set(run)))
+    if step is not None:
+        tokens.append((current_step, current_step.set(step)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class CallStats:
+    """Counters and latency histogram of a group of LLM calls."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttled = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+
+    def merge(self, other: "CallStats"):
+        """Add the counters of another group."""
+        for name in ("requests", "errors", "retries", "throttled", "cache_hits",
+                     "prompt_tokens", "completion_tokens", "latency_sum"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.latency_max = max(self.latency_max, other.latency_max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        if other.first_start is not None:
+            self.first_start = other.first_start if self.first_start is None \
+                else min(self.first_start, other.first_start)
+            self.last_end = other.last_end if self.last_end is None \
+                else max(self.last_end, other.last_end)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Export the counters, mean latency and throughput."""
+        span = (self.last_end - self.first_start) if self.first_start is not None else 0
+        cumulative = 0
+        histogram = {}
+        for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], self.buckets):
+            cumulative += count
+            histogram[bound] = cumulative
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "latency_mean": round(self.latency_sum / self.requests, 3) if self.requests else 0,
+            "latency_max": round(self.latency_max, 3),
+            "latency_sum": round(self.latency_sum, 3),
+            "latency_histogram": histogram,
+            "requests_per_second": round(self.requests / span, 3) if span > 0 else None
+        }
+
+
+class MetricsRecorder:
+    """Thread-safe metrics of LLM calls, grouped by run, pipeline step and model.
+
+    The run and step of a call are read from ``metric_scope`` labels of the
+    calling context.
+    """
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str, str], CallStats] = {}
+        self._lock = threading.Lock()
+
+    def _group(self, model: str) -> CallStats:
+        key = (current_run.get(), current_step.get(), model)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = CallStats()
+        return stats
+
+    def record_request(self, model: str, start: float, end: float, retries: int = 0,
+                       throttled: int = 0, usage: Optional[Any] = None, error: bool = False):
+        """Record a request sent to the API.
+
+        Args:
+            model: Deployment the request was sent to
+            start: time.monotonic() when the call started
+            end: time.monotonic() when the call finished, including rate-limit waits and retries
+            retries: Number of retried attempts
+            throttled: Number of 429 responses received
+            usage: ``usage`` of the SDK response, if any
+            error: Whether the call finally failed
+        """
+        latency = end - start
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound),
+                      len(LATENCY_BUCKETS))
+        with self._lock:
+            stats = self._group(model)
+            stats.requests += 1
+            stats.errors += error
+            stats.retries += retries
+            stats.throttled += throttled
+            stats.prompt_tokens += getattr(usage, "prompt_tokens", None) or 0
+            stats.completion_tokens += getattr(usage, "completion_tokens", None) or 0
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            stats.buckets[bucket] += 1
+            stats.first_start = start if stats.first_start is None else min(stats.first_start, start)
+            stats.last_end = end if stats.last_end is None else max(stats.last_end, end)
+
+    def record_cache_hit(self, model: str):
+        """Record a call answered from the response cache."""
+        with self._lock:
+            self._group(model).cache_hits += 1
+
+    def requests(self, run: Optional[str] = None) -> int:
+        """Count the requests sent, optionally only those of a run."""
+        with self._lock:
+            return sum(stats.requests for (stats_run, _, _), stats in self._stats.items()
+                       if run is None or stats_run == run)
+
+    def _select(self, run: Optional[str]) -> List[Tuple[Tuple[str, str, str], CallStats]]:
+        with self._lock:
+            return [(key, stats) for key, stats in self._stats.items() if run is None or key[0] == run]
+
+    def to_dict(self, run: Optional[str] = None) -> Dict[str, Any]:
+        """Export the metrics, aggregated per model and per step.
+
+        Args:
+            run: Only export the calls of this run
+        """
+        totals, models, steps = CallStats(), {}, {}
+        calls = []
+        for (call_run, step, model), stats in self._select(run):
+            totals.merge(stats)
+            models.setdefault(model, CallStats()).merge(stats)
+            steps.setdefault(step, CallStats()).merge(stats)
+            calls.append({"run": call_run, "step": step, "model": model, **stats.to_dict()})
+        return {
+            "totals": totals.to_dict(),
+            "models": {model: stats.to_dict() for model, stats in models.items()},
+            "steps": {step: stats.to_dict() for step, stats in steps.items()},
+            "calls": calls
+        }
+
+    def to_prometheus(self, run: Optional[str] = None) -> str:
+        """Export the metrics in the Prometheus text exposition format.
+
+        Args:
+            run: Only export the calls of this run
+        """
+        counters = [
+            ("promptpex_llm_requests_total", "LLM requests sent", "requests"),
+            ("promptpex_llm_errors_total", "LLM requests that finally failed", "errors"),
+            ("promptpex_llm_retries_total", "Retried LLM request attempts", "retries"),
+            ("promptpex_llm_throttled_total", "Throttled (429) LLM responses", "throttled"),
+            ("promptpex_llm_cache_hits_total", "LLM calls answered from the response cache", "cache_hits"),
+            ("promptpex_llm_prompt_tokens_total", "Prompt tokens used", "prompt_tokens"),
+            ("promptpex_llm_completion_tokens_total", "Completion tokens used", "completion_tokens"),
+        ]
+        selected = self._select(run)
+        lines = []
+        for name, help_text, attribute in counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, stats in selected:
+                lines.append(f"{name}{{{self._labels(key)}}} {getattr(stats, attribute)}")
+
+        name = "promptpex_llm_request_duration_seconds"
+        lines.append(f"# HELP {name} LLM request latency, including rate-limit waits and retries")
+        lines.append(f"# TYPE {name} histogram")
+        for key, stats in selected:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ["+Inf"], stats.buckets):
+                cumulative += count
+                lines.append(f"{name}_bucket{{{labels},le=\"{bound}\"}} {cumulative}")
+            lines.append(f"{name}_sum{{{labels}}} {round(stats.latency_sum, 6)}")
+            lines.append(f"{name}_count{{{labels}}} {stats.requests}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(key: Tuple[str, str, str]) -> str:
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        run, step, model = key
+        return f"run=\"{escape(run)}\",step=\"{escape(step)}\",model=\"{escape(model)}\""
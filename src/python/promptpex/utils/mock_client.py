@@ -0,0 +1,174 @@
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import httpx
+import openai
+
+from .helpers import hash_string
+from .llm_client import LLMClient
+from .rate_limit import estimate_tokens
+
+_MOCK_URL = "https://mock.invalid/chat/completions"
+
+
+class MockLLMClient(LLMClient):
+    """Deterministic offline stand-in for the Azure OpenAI client.
+
+    Answers each PromptPex prompt with well-formed content (rules, CSV tests,
+    OK/ERR decisions, ...) derived from a hash of the request, so runs are
+    reproducible and need no network. Latency, transient errors and 429
+    throttling can be injected to exercise the retry and concurrency code.
+    """
+
+    def __init__(self, azure_config: Optional[Dict[str, str]] = None,
+                 num_rules: int = 5,
+                 latency: float = 0.0,
+                 latency_jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 throttle_rate: float = 0.0,
+                 retry_after: float = 0.01,
+                 violation_rate: float = 0.1,
+                 output_words: int = 40,
+                 max_samples: Optional[int] = None,
+                 seed: int = 0,
+                 **kwargs):
+        """Initialize the mock client.
+
+        Args:
+            azure_config: Deployment configuration; defaults to a "mock" deployment
+            num_rules: Number of output rules extracted from every prompt
+            latency: Mean simulated latency of a request in seconds
+            latency_jitter: Maximum random deviation from the mean latency in seconds
+            error_rate: Probability of a request failing with a 500 error
+            throttle_rate: Probability of a request failing with a 429 error
+            retry_after: Retry-After delay in seconds sent with 429 errors
+            violation_rate: Probability of a compliance or validity check answering ERR
+            output_words: Number of words of the simulated outputs of the prompt under test
+            max_samples: Largest ``n`` accepted; requests for more samples fail with a
+                400 error, like deployments not supporting multi-sample requests
+            seed: Seed of the random latency and error injection
+            **kwargs: LLMClient options (max_concurrency, cache, rate_limiter, ...)
+        """
+        super().__init__(azure_config or {"azure_deployment": "mock"}, **kwargs)
+        self.num_rules = num_rules
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.violation_rate = violation_rate
+        self.output_words = output_words
+        self.max_samples = max_samples
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _complete(self, request: Dict[str, Any]) -> Any:
+        delay, error = self._draw(request)
+        if delay > 0:
+            time.sleep(delay)
+        if error:
+            raise error
+        return self._respond(request)
+
+    async def _complete_async(self, transport: Any, request: Dict[str, Any]) -> Any:
+        delay, error = self._draw(request)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if error:
+            raise error
+        return self._respond(request)
+
+    def _draw(self, request: Dict[str, Any]):
+        """Draw the latency and the injected error, if any, of a request."""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-1, 1) * self.latency_jitter)
+            roll = self._random.random()
+        if self.max_samples is not None and request.get("n", 1) > self.max_samples:
+            response = httpx.Response(400, request=httpx.Request("POST", _MOCK_URL))
+            return 0.0, openai.BadRequestError("Mock deployment does not support n > "
+                                               f"{self.max_samples}", response=response, body=None)
+        if roll < self.throttle_rate:
+            response = httpx.Response(429, headers={"retry-after": str(self.retry_after)},
+                                      request=httpx.Request("POST", _MOCK_URL))
+            return delay, openai.RateLimitError("Mock rate limit exceeded", response=response, body=None)
+        if roll < self.throttle_rate + self.error_rate:
+            response = httpx.Response(500, request=httpx.Request("POST", _MOCK_URL))
+            return delay, openai.InternalServerError("Mock server error", response=response, body=None)
+        return delay, None
+
+    def _respond(self, request: Dict[str, Any]) -> Any:
+        """Build an SDK-shaped response to a request."""
+        system = request["messages"][0]["content"]
+        user = request["messages"][1]["content"]
+        contents = [self._answer(system, user, request["model"], index)
+                    for index in range(request.get("n", 1))]
+        prompt_tokens = estimate_tokens(system + user)
+        completion_tokens = sum(estimate_tokens(content) for content in contents)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")
+                     for content in contents],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens)
+        )
+
+    def _decision(self, *parts: str) -> str:
+        """Deterministic OK/ERR decision for a checked item."""
+        value = int(hash_string("\n".join(parts), 8), 16) / 0xFFFFFFFF
+        return "ERR" if value < self.violation_rate else "OK"
+
+    def _answer(self, system: str, user: str, model: str, index: int = 0) -> str:
+        """Answer a request like the model would for the matching PromptPex prompt.
+
+        ``index`` is the sample (choice) of a multi-sample request; samples of the
+        prompt under test differ, the other answers are the same for every sample.
+        """
+        if "<CHATBOT_OUTPUTS>" in user or user.startswith("Inputs:"):
+            items = json.loads(user[user.index("["):user.rindex("]") + 1])
+            return json.dumps([
+                {"id": item["id"], "reasoning": "Mock evaluation.",
+                 "decision": self._decision(item.get("output", item.get("input", "")))}
+                for item in items
+            ], indent=2)
+        if "<CHATBOT_OUTPUT>" in user:
+            return f"Mock evaluation.\n{self._decision(user)}"
+        if "if it is a valid input" in system:
+            return f"Mock validity check.\n{self._decision(user)}"
+        if "is grounded in the provided description" in system:
+            return "OK"
+        if "extract the intent of the chatbot" in system:
+            return "The chatbot answers the user's request following its instructions."
+        if "guide the creation of valid inputs" in system:
+            return "\n".join(f"The input must satisfy constraint {i}." for i in range(1, 4))
+        if "rules and constrains for output validation" in system:
+            return "\n".join(f"The output must satisfy rule {i} of the prompt." for i in range(1, self.num_rules + 1))
+        if "contradicts the given rules semantically" in system:
+            rules = re.search(r"<RULES>(.*)</RULES>", user, re.S)
+            lines = [line for line in (rules.group(1) if rules else user).split("\n") if line.strip()]
+            return "\n".join(f"The output must not follow: {line.strip()}" for line in lines)
+        if "You are tasked with developing multiple test cases" in system:
+            count = re.search(r"create (\d+)", system)
+            count = int(count.group(1)) if count else 3
+            key = hash_string(system + user)
+            if "given its functional and input specification" in system:
+                # Grouped requests number their rules "1. ...", "2. ..."
+                num_rules = len(re.findall(r"^\d+\. ", user, re.M)) or 1
+                rows = ["ruleid,testid,expectedoutput,reasoning,testinput"]
+                for rule in range(1, num_rules + 1):
+                    prefix = f"{rule}-" if num_rules > 1 else ""
+                    rows += [f"{rule},{i},\"Expected output {i}\",\"Checks the rule\","
+                             f"\"Mock test input {key}-{prefix}{i}\"" for i in range(1, count + 1)]
+                return "\n".join(rows)
+            return "\n===\n".join(f"Mock baseline input {key}-{i}" for i in range(1, count + 1))
+
+        # Output of the prompt under test
+        salt = f"#{index}" if index else ""
+        words = [f"{model}-{hash_string(user + str(i) + salt)}" for i in range(self.output_words)]
+        return " ".join(words)
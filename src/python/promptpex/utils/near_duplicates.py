@@ -0,0 +1,143 @@
+import operator
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Signature value of a bin no shingle fell into, before densification
+_EMPTY = (1 << 32) - 1
+
+
+def shingle_hashes(text: str, size: int = 5) -> Set[int]:
+    """CRC32 hashes of the character ``size``-grams of a text, ignoring case and whitespace runs."""
+    data = " ".join(text.lower().split()).encode("utf-8")
+    if len(data) <= size:
+        return {zlib.crc32(data)}
+    return {zlib.crc32(data[i:i + size]) for i in range(len(data) - size + 1)}
+
+
+def minhash_signature(hashes: Iterable[int], num_perm: int = 128) -> array:
+    """MinHash signature of a set of 32-bit hashes, by one permutation hashing.
+
+    Each hash falls into one of ``num_perm`` bins (its value modulo
+    ``num_perm``) and the signature keeps the minimum of every bin, so a set
+    is hashed in a single pass instead of once per permutation. Empty bins
+    borrow the minimum of the next non-empty bin, shifted by their distance,
+    as in densified one permutation hashing. The share of equal positions of
+    two signatures estimates the Jaccard similarity of their sets.
+    """
+    bins = [_EMPTY] * num_perm
+    for value in hashes:
+        index = value % num_perm
+        if value < bins[index]:
+            bins[index] = value
+    filled = [index for index, value in enumerate(bins) if value != _EMPTY]
+    if filled and len(filled) < num_perm:
+        following = filled[0] + num_perm
+        for index in range(num_perm - 1, -1, -1):
+            if bins[index] != _EMPTY:
+                following = index
+            else:
+                source = following % num_perm
+                bins[index] = bins[source] + ((following - index) << 32)
+    return array("Q", bins)
+
+
+def signature_similarity(first: array, second: array) -> float:
+    """Estimated Jaccard similarity of the sets of two signatures."""
+    return sum(map(operator.eq, first, second)) / len(first)
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Choose the (bands, rows) split of the signatures for a similarity threshold.
+
+    Pairs become candidates when all the rows of one of their bands match,
+    which happens with probability 1/2 around (1/bands)^(1/rows). The split
+    putting that point closest below the threshold is chosen, so that pairs
+    above the threshold are rarely missed.
+    """
+    best = (1, num_perm)
+    best_point = 0.0
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        point = (1 / bands) ** (1 / rows)
+        if best_point < point <= threshold:
+            best, best_point = (bands, rows), point
+    return best
+
+
+class MinHashLSH:
+    """Locality-sensitive hashing index of MinHash signatures."""
+
+    def __init__(self, threshold: float, num_perm: int = 128):
+        """Initialize the index.
+
+        Args:
+            threshold: Estimated Jaccard similarity from which signatures are similar
+            num_perm: Length of the signatures
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[int, array] = {}
+
+    def _keys(self, signature: array) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: int, signature: array):
+        """Index a signature under a key."""
+        self._signatures[key] = signature
+        for band, band_key in self._keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def most_similar(self, signature: array) -> Optional[Tuple[int, float]]:
+        """Find the indexed signature most similar to a signature, above the threshold.
+
+        Returns:
+            Tuple of its key and estimated similarity, or None if there is none
+        """
+        candidates = set()
+        for band, band_key in self._keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+        best = None
+        for key in sorted(candidates):
+            similarity = signature_similarity(signature, self._signatures[key])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+
+def find_near_duplicates(texts: List[str], threshold: float = 0.8, shingle_size: int = 5,
+                         num_perm: int = 128,
+                         protected: Optional[Set[int]] = None) -> Dict[int, Tuple[int, float]]:
+    """Find the texts that are near-duplicates of an earlier text.
+
+    Texts are clustered greedily in order: a text whose estimated Jaccard
+    similarity (over character shingles) to a kept text reaches the threshold
+    is a duplicate of the most similar one, otherwise it is kept and
+    represents its cluster. Protected texts are always kept.
+
+    Args:
+        texts: Texts to compare
+        threshold: Estimated Jaccard similarity from which a text is a duplicate
+        shingle_size: Number of characters of the shingles
+        num_perm: Length of the MinHash signatures
+        protected: Indices of the texts that must be kept
+
+    Returns:
+        Index of the kept text and estimated similarity, keyed by the index of each duplicate
+    """
+    protected = protected or set()
+    index = MinHashLSH(threshold, num_perm)
+    duplicates = {}
+    for position, text in enumerate(texts):
+        signature = minhash_signature(shingle_hashes(text, shingle_size), num_perm)
+        match = index.most_similar(signature) if position not in protected else None
+        if match is None:
+            index.add(position, signature)
+        else:
+            duplicates[position] = (match[0], round(match[1], 3))
+    return duplicates
@@ -0,0 +1,226 @@
+import re
+import csv
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Columns of the CSV test cases requested by generate_tests.prompty, in order
+TEST_CSV_COLUMNS = ("ruleid", "testid", "expectedoutput", "reasoning", "testinput")
+
+_FENCE_PATTERN = re.compile(r"^[ \t]*```[^\n]*\n(.*?)^[ \t]*```[ \t]*$", re.M | re.S)
+
+_NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def strip_code_fences(content: str) -> str:
+    """Return the content of the Markdown code blocks of an answer, or the answer itself if it has none."""
+    blocks = _FENCE_PATTERN.findall(content)
+    if blocks:
+        return "\n".join(blocks)
+    # An answer cut off inside its code block has an opening fence only
+    if content.lstrip().startswith("```"):
+        return content.lstrip().split("\n", 1)[-1]
+    return content
+
+
+def parse_rule_id(value: Any) -> Optional[int]:
+    """Read a rule number such as "2", "2.0", "rule 2" or "R2"; None if there is none."""
+    match = _NUMBER_PATTERN.search(str(value or ""))
+    return int(match.group(0)) if match else None
+
+
+def _normalize_column(name: Any) -> str:
+    return str(name).strip().strip("\"'").strip().lower().replace(" ", "").replace("_", "")
+
+
+class ParseStats:
+    """Thread-safe yield counters of parsed LLM answers.
+
+    The yield is the share of the rows found in the answers that could be
+    turned into tests; answers without a single test are counted separately
+    since their generation call is wasted.
+    """
+
+    def __init__(self):
+        self.responses = 0
+        self.empty_responses = 0
+        self.jsonl_responses = 0
+        self.rows = 0
+        self.recovered_rows = 0
+        self.dropped_rows = 0
+        self._lock = threading.Lock()
+
+    def add(self, result: "ParseResult"):
+        """Account for the parse result of one answer."""
+        with self._lock:
+            self.responses += 1
+            self.empty_responses += not result.rows
+            self.jsonl_responses += result.kind == "jsonl"
+            self.rows += len(result.rows)
+            self.recovered_rows += result.recovered
+            self.dropped_rows += result.dropped
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Export the counters and the parse yield in percent."""
+        with self._lock:
+            found = self.rows + self.dropped_rows
+            return {
+                "responses": self.responses,
+                "empty_responses": self.empty_responses,
+                "jsonl_responses": self.jsonl_responses,
+                "rows": self.rows,
+                "recovered_rows": self.recovered_rows,
+                "dropped_rows": self.dropped_rows,
+                "yield_percentage": round(self.rows / found * 100, 1) if found else 0
+            }
+
+
+class ParseResult:
+    """Rows parsed from an answer, with the number of repaired and dropped rows."""
+
+    def __init__(self, rows: List[Dict[str, str]], kind: str, recovered: int = 0, dropped: int = 0):
+        self.rows = rows
+        self.kind = kind
+        self.recovered = recovered
+        self.dropped = dropped
+
+
+def parse_test_cases(content: str, columns: Tuple[str, ...] = TEST_CSV_COLUMNS,
+                     required: str = "testinput") -> ParseResult:
+    """Parse the test cases generated by an LLM, recovering as many rows as possible.
+
+    The answer may be wrapped in code fences and surrounded by prose. CSV is
+    expected, with or without its header (spaces around commas and the case of
+    the column names do not matter); JSON lines or a JSON array of objects are
+    accepted as well. Rows with unquoted commas in their last column are
+    repaired, a quote left open only spoils its own line, and rows that still
+    do not fit the columns are dropped.
+
+    Args:
+        content: Answer of the model
+        columns: Expected columns when the CSV has no header
+        required: Column that must not be empty for a row to be kept
+
+    Returns:
+        The parsed rows, keyed by normalized column name
+    """
+    text = strip_code_fences(content or "").strip()
+    if not text:
+        return ParseResult([], "none")
+
+    result = _parse_json_rows(text, required)
+    if result is not None:
+        return result
+    return _parse_csv_rows(text, columns, required)
+
+
+def _parse_json_rows(text: str, required: str) -> Optional[ParseResult]:
+    """Parse JSON lines or a JSON array of objects; None if the text is not JSON."""
+    if text.startswith("["):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError:
+            items = None
+        if isinstance(items, list):
+            lines = [json.dumps(item) for item in items]
+        else:
+            lines = text.split("\n")
+    else:
+        lines = text.split("\n")
+
+    candidates = [line.strip().rstrip(",") for line in lines if line.strip().startswith("{")]
+    if not candidates or len(candidates) * 2 < sum(1 for line in lines if line.strip()):
+        return None
+
+    rows, dropped = [], 0
+    for line in candidates:
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            dropped += 1
+            continue
+        if not isinstance(item, dict):
+            dropped += 1
+            continue
+        row = {_normalize_column(key): "" if value is None else str(value) for key, value in item.items()}
+        if row.get(required, "").strip():
+            rows.append(row)
+        else:
+            dropped += 1
+    return ParseResult(rows, "jsonl", dropped=dropped)
+
+
+def _split_records(lines: List[str]) -> List[str]:
+    """Group lines into CSV records, allowing quoted values spanning several lines.
+
+    A record ends once it holds an even number of quotes (escaped quotes ""
+    keep the count even).
+
+    A quote that is never closed would swallow every following line; those
+    lines are split again with the first one kept as a record of its own.
+    """
+    quotes = [line.count('"') % 2 for line in lines]
+    records = []
+    start = 0
+    while start < len(lines):
+        end, odd = start, quotes[start]
+        while odd and end + 1 < len(lines):
+            end += 1
+            odd ^= quotes[end]
+        if odd:
+            records.append(lines[start])
+            start += 1
+        else:
+            records.append("\n".join(lines[start:end + 1]))
+            start = end + 1
+    return records
+
+
+def _read_fields(record: str) -> List[str]:
+    try:
+        fields = next(csv.reader([record], skipinitialspace=True, strict=False), [])
+    except csv.Error:
+        fields = record.split(",")
+    return [field.strip() for field in fields]
+
+
+def _parse_csv_rows(text: str, columns: Tuple[str, ...], required: str) -> ParseResult:
+    records = [record for record in _split_records(text.split("\n")) if record.strip()]
+
+    # The header is the first record naming the required column; lines before it are prose
+    header, start = None, 0
+    for index, record in enumerate(records):
+        names = [_normalize_column(field) for field in _read_fields(record)]
+        if required in names:
+            header, start = names, index + 1
+            break
+    if header is None:
+        header = list(columns)
+
+    rows, recovered, dropped = [], 0, 0
+    for record in records[start:]:
+        fields = _read_fields(record)
+        if len(fields) <= 1:
+            # Stray prose line
+            continue
+        if [_normalize_column(field) for field in fields] == header:
+            continue
+        if len(fields) > len(header):
+            # Unquoted commas, most often in the last column (the test input)
+            fields = fields[:len(header) - 1] + [", ".join(fields[len(header) - 1:])]
+            recovered += 1
+        elif len(fields) < len(header):
+            dropped += 1
+            continue
+        row = dict(zip(header, fields))
+        if row.get(required, "").strip():
+            rows.append(row)
+        else:
+            dropped += 1
+
+    if dropped or recovered:
+        logger.debug(f"Parsed {len(rows)} rows ({recovered} repaired, {dropped} dropped)")
+    return ParseResult(rows, "csv", recovered=recovered, dropped=dropped)
@@ -0,0 +1,123 @@
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from .rate_limit import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:  # Optional; token counts fall back to estimate_tokens
+    tiktoken = None
+
+# Encoding of the models without a known tokenizer (e.g. Azure deployment names)
+DEFAULT_ENCODING = "o200k_base"
+
+# Assumed sizes in tokens of the texts a plan cannot know before the run
+ESTIMATED_TOKENS = {
+    "rule": 40,              # an output rule or an input constraint
+    "test_input": 80,        # a generated test input
+    "test": 150,             # a generated CSV test (expected output, reasoning and input)
+    "output": 400,           # an output of the prompt under test
+    "evaluation": 100,       # reasoning and OK/ERR decision of an evaluation
+}
+
+# Rules assumed by default when planning, before any are extracted
+DEFAULT_PLAN_RULES = 10
+
+# Pipeline steps of a plan, in order, as labelled in the LLM call metrics
+PLAN_STEPS = ("intent", "input_spec", "rules", "inverse_rules", "rule_evaluations", "tests",
+              "baseline_tests", "test_validity", "test_results", "test_compliance")
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: Optional[str]):
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(DEFAULT_ENCODING)
+    except KeyError:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def tokenizer_name(model: Optional[str] = None) -> str:
+    """Name of the tokenizer used by ``count_tokens``."""
+    if tiktoken is None:
+        return "estimate (4 characters per token)"
+    return f"tiktoken {_get_encoding(model).name}"
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count the tokens of a text with the model's tokenizer.
+
+    Uses tiktoken when it is installed, and the rough estimate of the rate
+    limiter (about 4 characters per token) otherwise.
+    """
+    if tiktoken is None:
+        return estimate_tokens(text)
+    return len(_get_encoding(model).encode(text, disallowed_special=()))
+
+
+def placeholder_text(tokens: int) -> str:
+    """Stand-in text of about ``tokens`` tokens for content the plan cannot know."""
+    return " ".join(["word"] * max(1, tokens))
+
+
+class StepPlan:
+    """Requests and tokens planned for a pipeline step."""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, requests: int = 1):
+        """Plan ``requests`` identical requests."""
+        self.requests += requests
+        self.prompt_tokens += prompt_tokens * requests
+        self.completion_tokens += completion_tokens * requests
+
+    def to_dict(self) -> Dict[str, int]:
+        """Export the counters, with the total number of tokens."""
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens
+        }
+
+
+def plan_totals(steps: Dict[str, Dict[str, int]]) -> Dict[str, int]:
+    """Sum the requests and tokens of the planned steps."""
+    keys = ("requests", "prompt_tokens", "completion_tokens", "total_tokens")
+    return {key: sum(step[key] for step in steps.values()) for key in keys}
+
+
+def _format_plan_row(name: str, step: Dict[str, int]) -> str:
+    return (f"{name:<18} {step['requests']:>9} {step['prompt_tokens']:>11} "
+            f"{step['completion_tokens']:>11} {step['total_tokens']:>11}")
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Format a run plan as a text table, with its assumptions and budget check."""
+    header = f"{'step':<18} {'requests':>9} {'prompt tok':>11} {'compl. tok':>11} {'total tok':>11}"
+    lines = [f"Plan for {plan['prompt_file']} (tokenizer: {plan['tokenizer']})", header, "-" * len(header)]
+    lines += [_format_plan_row(name, step) for name, step in plan["steps"].items()]
+    lines += ["-" * len(header), _format_plan_row("total", plan["total"])]
+
+    assumptions = plan["assumptions"]
+    lines.append("")
+    lines.append("Assumes " + ", ".join(f"{value} {name.replace('_', ' ')}" for name, value in assumptions.items())
+                 + "; cached responses are not deducted.")
+    if tiktoken is None:
+        lines.append("Warning: tiktoken is not installed, token counts are rough estimates "
+                     "of 4 characters per token (pip install tiktoken).")
+
+    budget = plan.get("budget")
+    if budget:
+        limits = ", ".join(f"{budget[key]} {key[len('max_'):]}" for key in ("max_requests", "max_tokens")
+                           if budget.get(key) is not None)
+        if budget["fits"]:
+            lines.append(f"Fits in the budget of {limits}.")
+        else:
+            runs = budget["runs_per_test"]
+            lines.append(f"Exceeds the budget of {limits}: the test runs would be reduced to "
+                         f"{budget['tests']} of {budget['planned_tests']} tests, run {runs} "
+                         f"time{'s' if runs > 1 else ''} each.")
+    return "\n".join(lines)
@@ -0,0 +1,259 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: throttling, timeouts, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens of a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Check whether an error is a 429 throttling response."""
+    return isinstance(error, openai.RateLimitError)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the server-requested delay in seconds from the headers of an API error."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter, honouring server Retry-After hints."""
+    
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """Initialize the policy.
+        
+        Args:
+            max_retries: Maximum number of retries after the first attempt
+            base_delay: Delay in seconds before the first retry
+            max_delay: Upper bound of the backoff delay in seconds
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Compute the delay before retrying.
+        
+        Args:
+            attempt: Number of the failed attempt, starting at 0
+            retry_after: Delay requested by the server, if any
+        
+        Returns:
+            Seconds to wait before the next attempt
+        """
+        if retry_after is not None:
+            # Small jitter so throttled callers do not all come back at once
+            return retry_after + random.uniform(0, self.base_delay)
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate.
+    
+    Callers reserve capacity up front and wait the returned delay, so the
+    bucket can be shared by threads and coroutines alike.
+    """
+    
+    def __init__(self, per_minute: float):
+        """Initialize a full bucket.
+        
+        Args:
+            per_minute: Capacity added per minute, also the bucket size
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self, amount: float) -> float:
+        """Take capacity from the bucket.
+        
+        Args:
+            amount: Capacity to take
+        
+        Returns:
+            Seconds to wait before the reserved capacity is actually available
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def refund(self, amount: float):
+        """Give back capacity that was reserved but not used."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit adapted AIMD-style: additive increase, multiplicative decrease."""
+    
+    def __init__(self, maximum: int, minimum: int = 1):
+        """Initialize the limit at its maximum.
+        
+        Args:
+            maximum: Upper bound of concurrent requests
+            minimum: Lower bound of concurrent requests
+        """
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(self.maximum)
+        self.active = 0
+        self._condition = threading.Condition()
+    
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free."""
+        with self._condition:
+            if self.active < int(self.limit):
+                self.active += 1
+                return True
+            return False
+    
+    def acquire(self):
+        """Take a slot, blocking the current thread until one is free."""
+        with self._condition:
+            while self.active >= int(self.limit):
+                self._condition.wait()
+            self.active += 1
+    
+    async def acquire_async(self):
+        """Take a slot without blocking the event loop."""
+        while not self.try_acquire():
+            await asyncio.sleep(0.05)
+    
+    def release(self):
+        """Give a slot back."""
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+    
+    def on_success(self):
+        """Grow the limit by about one slot per limit-many successful requests."""
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+    
+    def on_throttle(self):
+        """Halve the limit after a throttling response."""
+        with self._condition:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class DeploymentLimiter:
+    """Request, token and concurrency limits of one deployment."""
+    
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 max_concurrency: int = 64):
+        """Initialize the limiter.
+        
+        Args:
+            requests_per_minute: Request quota, or None for unlimited
+            tokens_per_minute: Token quota, or None for unlimited
+            max_concurrency: Upper bound of the adaptive concurrency limit
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+    
+    def reserve(self, estimated_tokens: int) -> float:
+        """Reserve quota for one request and return the seconds to wait before sending it."""
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(estimated_tokens))
+        return delay
+    
+    def on_success(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """Return over-reserved tokens and let the concurrency limit grow."""
+        if self.tokens and used_tokens is not None and used_tokens < estimated_tokens:
+            self.tokens.refund(estimated_tokens - used_tokens)
+        self.concurrency.on_success()
+    
+    def on_throttle(self):
+        """Shrink the concurrency limit after a 429."""
+        self.concurrency.on_throttle()
+        logger.info(f"Throttled, concurrency limit lowered to {int(self.concurrency.limit)}")
+
+
+class RateLimiter:
+    """Client-side rate limits, tracked separately for each deployment."""
+    
+    def __init__(self, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 deployment_limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+                 max_concurrency: int = 64):
+        """Initialize the limiter.
+        
+        Args:
+            requests_per_minute: Default request quota of a deployment
+            tokens_per_minute: Default token quota of a deployment
+            deployment_limits: Per-deployment (requests/min, tokens/min) overriding the defaults
+            max_concurrency: Upper bound of the adaptive concurrency of each deployment
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.deployment_limits = deployment_limits or {}
+        self.max_concurrency = max_concurrency
+        self._limiters: Dict[str, DeploymentLimiter] = {}
+        self._lock = threading.Lock()
+    
+    def for_model(self, model: str) -> DeploymentLimiter:
+        """Get the limiter of a deployment, creating it on first use."""
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                rpm, tpm = self.deployment_limits.get(model, (None, None))
+                limiter = DeploymentLimiter(rpm or self.requests_per_minute,
+                                            tpm or self.tokens_per_minute,
+                                            self.max_concurrency)
+                self._limiters[model] = limiter
+            return limiter
@@ -0,0 +1,372 @@
+import json
+from html import escape
+from typing import Any, Dict, Iterable, TextIO
+
+# Characters of the test inputs and outputs embedded in the report; the full
+# texts are in test_results.csv and the results JSON
+RESULT_EXCERPT_LENGTH = 500
+
+# Columns of the rows of the embedded results data
+RESULT_COLUMNS = ("id", "rule", "inverse", "model", "input", "output", "compliance")
+
+_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>PromptPEX Report</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 0; padding: 20px; }
+        h1, h2, h3, h4 { color: #333; margin-top: 30px; }
+        .container { max-width: 1200px; margin: 0 auto; }
+        .card { background: #fff; border-radius: 8px; padding: 20px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        .stats { display: flex; flex-wrap: wrap; gap: 20px; }
+        .stat-card { background: #f9f9f9; border-radius: 8px; padding: 15px; flex: 1; min-width: 200px; }
+        .progress-bar { height: 10px; background: #e0e0e0; border-radius: 5px; overflow: hidden; margin-top: 5px; }
+        .progress { height: 100%; background: #4CAF50; }
+        table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+        th, td { border: 1px solid #ddd; padding: 12px; text-align: left; }
+        th { background-color: #f2f2f2; }
+        tr:nth-child(even) { background-color: #f9f9f9; }
+        td.text { white-space: pre-wrap; word-break: break-word; max-width: 400px; }
+        pre { background: #f5f5f5; padding: 15px; border-radius: 5px; overflow: auto; }
+        .tab { overflow: hidden; border: 1px solid #ccc; background-color: #f1f1f1; }
+        .tab button { background-color: inherit; float: left; border: none; outline: none; cursor: pointer; padding: 14px 16px; }
+        .tab button:hover { background-color: #ddd; }
+        .tab button.active { background-color: #ccc; }
+        .tabcontent { display: none; padding: 6px 12px; border: 1px solid #ccc; border-top: none; }
+        .show { display: block; }
+        .filters { display: flex; flex-wrap: wrap; gap: 10px; align-items: center; margin: 10px 0; }
+        .pager { display: flex; gap: 10px; align-items: center; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>PromptPEX Test Results</h1>
+"""
+
+_RESULTS_TAB = """
+            <div id="Results" class="tabcontent">
+                <h3>Test Results</h3>
+                <div class="filters">
+                    <label>Model <select id="filter-model" onchange="applyFilters()"><option value="">All</option></select></label>
+                    <label>Rule <select id="filter-rule" onchange="applyFilters()"><option value="">All</option></select></label>
+                    <label>Compliance <select id="filter-compliance" onchange="applyFilters()">
+                        <option value="">All</option>
+                        <option value="ok">Compliant</option>
+                        <option value="err">Non-compliant</option>
+                        <option value="error">Error</option>
+                        <option value="-">Not graded</option>
+                    </select></label>
+                    <label>Search <input id="filter-text" type="search" oninput="applyFilters()"></label>
+                </div>
+                <div class="pager">
+                    <button onclick="showPage(page - 1)">Previous</button>
+                    <span id="page-info">Loading results...</span>
+                    <button onclick="showPage(page + 1)">Next</button>
+                </div>
+                <table>
+                    <thead>
+                        <tr>
+                            <th>Rule ID</th>
+                            <th>Inverse</th>
+                            <th>Model</th>
+                            <th>Input (excerpt)</th>
+                            <th>Output (excerpt)</th>
+                            <th>Compliance</th>
+                        </tr>
+                    </thead>
+                    <tbody id="results-body"></tbody>
+                </table>
+            </div>
+        </div>
+    </div>
+
+"""
+
+_SCRIPT = """
+    <script>
+    var PAGE_SIZE = 50;
+    var COLUMNS = %s;
+    var results = null, filtered = [], page = 0;
+
+    function openTab(evt, tabName) {
+        var i, tabcontent, tablinks;
+        tabcontent = document.getElementsByClassName("tabcontent");
+        for (i = 0; i < tabcontent.length; i++) {
+            tabcontent[i].style.display = "none";
+        }
+        tablinks = document.getElementsByClassName("tablinks");
+        for (i = 0; i < tablinks.length; i++) {
+            tablinks[i].className = tablinks[i].className.replace(" active", "");
+        }
+        document.getElementById(tabName).style.display = "block";
+        evt.currentTarget.className += " active";
+        if (tabName === "Results") {
+            loadResults();
+        }
+    }
+
+    // The results are only parsed when their tab is first opened
+    function loadResults() {
+        if (results !== null) {
+            return;
+        }
+        results = JSON.parse(document.getElementById("results-data").textContent);
+        var M = COLUMNS.indexOf("model");
+        addOptions("filter-model", function (row) { return row[M]; });
+        addOptions("filter-rule", ruleKey);
+        applyFilters();
+    }
+
+    // Rule N and inverse rule N are different rules
+    function ruleKey(row) {
+        var rule = String(row[COLUMNS.indexOf("rule")]);
+        return row[COLUMNS.indexOf("inverse")] === "Yes" ? rule + " (inverse)" : rule;
+    }
+
+    function addOptions(selectId, key) {
+        var seen = {}, values = [];
+        for (var i = 0; i < results.length; i++) {
+            var value = String(key(results[i]));
+            if (!seen[value]) {
+                seen[value] = true;
+                values.push(value);
+            }
+        }
+        values.sort(function (a, b) { return a.localeCompare(b, undefined, { numeric: true }); });
+        var select = document.getElementById(selectId);
+        values.forEach(function (value) {
+            var option = document.createElement("option");
+            option.value = option.textContent = value;
+            select.appendChild(option);
+        });
+    }
+
+    function applyFilters() {
+        if (results === null) {
+            return;
+        }
+        var model = document.getElementById("filter-model").value;
+        var rule = document.getElementById("filter-rule").value;
+        var compliance = document.getElementById("filter-compliance").value;
+        var text = document.getElementById("filter-text").value.toLowerCase();
+        var M = COLUMNS.indexOf("model"), C = COLUMNS.indexOf("compliance");
+        var I = COLUMNS.indexOf("input"), O = COLUMNS.indexOf("output");
+        filtered = results.filter(function (row) {
+            return (!model || row[M] === model)
+                && (!rule || ruleKey(row) === rule)
+                && (!compliance || row[C] === compliance)
+                && (!text || row[I].toLowerCase().indexOf(text) >= 0 || row[O].toLowerCase().indexOf(text) >= 0);
+        });
+        showPage(0);
+    }
+
+    function showPage(index) {
+        if (results === null) {
+            return;
+        }
+        var pages = Math.max(1, Math.ceil(filtered.length / PAGE_SIZE));
+        page = Math.min(Math.max(index, 0), pages - 1);
+        var body = document.getElementById("results-body");
+        body.textContent = "";
+        var start = page * PAGE_SIZE, rows = filtered.slice(start, start + PAGE_SIZE);
+        rows.forEach(function (row) {
+            var tr = document.createElement("tr");
+            ["rule", "inverse", "model", "input", "output", "compliance"].forEach(function (name) {
+                var td = document.createElement("td");
+                var value = row[COLUMNS.indexOf(name)];
+                if (name === "compliance") {
+                    value = value === "ok" ? "\\u2713" : value === "err" ? "\\u2717" : value;
+                }
+                if (name === "input" || name === "output") {
+                    td.className = "text";
+                }
+                td.textContent = value;
+                tr.appendChild(td);
+            });
+            body.appendChild(tr);
+        });
+        document.getElementById("page-info").textContent = filtered.length
+            ? "Results " + (start + 1) + "-" + (start + rows.length) + " of " + filtered.length
+              + " (page " + (page + 1) + " of " + pages + ", " + results.length + " results in total)"
+            : "No results match the filters (" + results.length + " results in total)";
+    }
+    </script>
+</body>
+</html>
+"""
+
+
+def _percentage(ok: int, total: int) -> float:
+    return round((ok / total * 100) if total else 0, 1)
+
+
+def _excerpt(text: Any, length: int) -> str:
+    text = "" if text is None else str(text)
+    return text if len(text) <= length else text[:length] + "..."
+
+
+def _script_json(value: Any) -> str:
+    """Serialize a value as compact JSON that cannot end the script element embedding it."""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).replace("<", "\\u003c")
+
+
+def _result_row(result: Dict[str, Any]) -> list:
+    if "error" in result:
+        compliance = "error"
+    else:
+        compliance = result.get("compliance") or "-"
+    rule = result.get("ruleid")
+    return [
+        result.get("id", ""),
+        "baseline" if rule in (None, "") else rule,
+        "Yes" if result.get("inverse", False) else "No",
+        result.get("model", ""),
+        _excerpt(result.get("input"), RESULT_EXCERPT_LENGTH),
+        _excerpt(result.get("output"), RESULT_EXCERPT_LENGTH),
+        compliance
+    ]
+
+
+def _write_stat_card(f: TextIO, title: str, line: str, percentage: float, label: str, note: str = ""):
+    f.write(f"""
+                <div class="stat-card">
+                    <h3>{escape(title)}</h3>
+                    <p>{escape(line)}</p>
+                    <div class="progress-bar">
+                        <div class="progress" style="width: {percentage}%;"></div>
+                    </div>
+                    <small>{percentage}% {escape(label)}</small>{note}
+                </div>
+""")
+
+
+def _write_summary(f: TextIO, context: Dict[str, Any]):
+    summary = context["summary"]
+    dedup = context.get("test_dedup") or {}
+    dedup_note = (f"<br><small>{dedup['saved_calls']} requests saved by deduplicating "
+                  f"{dedup['test_inputs'] - dedup['unique_inputs']} repeated inputs</small>"
+                  if dedup.get("saved_calls") else "")
+    test_filter = context.get("test_filter") or {}
+    filter_note = (f"<br><small>{len(test_filter['dropped'])} near-duplicate tests dropped before running</small>"
+                   if test_filter.get("dropped") else "")
+
+    f.write("""
+        <div class="card">
+            <h2>Summary</h2>
+            <div class="stats">
+""")
+    _write_stat_card(f, "Rules", f"{summary['total_rules']} total rules ({summary['grounded_rules']} grounded)",
+                     summary['grounded_percentage'], "grounded")
+    _write_stat_card(f, "Tests", f"{summary['total_tests']} total tests ({summary['valid_tests']} valid)",
+                     summary['valid_percentage'], "valid", filter_note)
+    _write_stat_card(f, "Test Results", f"{summary['test_results']} test runs ({summary['compliant_tests']} compliant)",
+                     summary['compliant_percentage'], "compliant", dedup_note)
+    f.write("""            </div>
+        </div>
+
+        <div class="card">
+            <h2>Model Results</h2>
+            <table>
+                <tr>
+                    <th>Model</th>
+                    <th>Compliant</th>
+                    <th>Total</th>
+                    <th>Compliance Rate</th>
+                </tr>
+""")
+    for model, stats in summary.get("model_results", {}).items():
+        f.write(f"""                <tr>
+                    <td>{escape(str(model))}</td>
+                    <td>{stats['ok']}</td>
+                    <td>{stats['total']}</td>
+                    <td>{_percentage(stats['ok'], stats['total'])}%</td>
+                </tr>
+""")
+    f.write("""            </table>
+        </div>
+""")
+
+
+def _write_table(f: TextIO, title: str, headers: Iterable[str], rows: Iterable[Iterable[Any]]):
+    f.write(f"""
+                <h3>{escape(title)}</h3>
+                <table>
+                    <tr>{"".join(f"<th>{escape(header)}</th>" for header in headers)}</tr>
+""")
+    for row in rows:
+        f.write(f"""                    <tr>{"".join(f"<td>{escape(str(cell))}</td>" for cell in row)}</tr>
+""")
+    f.write("""                </table>
+""")
+
+
+def _write_rules_and_tests(f: TextIO, context: Dict[str, Any]):
+    grounded = {evaluation.get("ruleid"): evaluation.get("grounded")
+                for evaluation in context.get("rule_evaluations", [])}
+    f.write("""
+        <div class="card">
+            <div class="tab">
+                <button class="tablinks active" onclick="openTab(event, 'Rules')">Rules</button>
+                <button class="tablinks" onclick="openTab(event, 'Tests')">Tests</button>
+                <button class="tablinks" onclick="openTab(event, 'Results')">Results</button>
+            </div>
+
+            <div id="Rules" class="tabcontent show">
+""")
+    _write_table(f, "Output Rules", ("#", "Rule", "Grounded"), (
+        (i, rule, "Unknown" if i not in grounded else "Yes" if grounded[i] == "ok" else "No")
+        for i, rule in enumerate(context.get("rules", []), 1)
+    ))
+    _write_table(f, "Inverse Rules", ("#", "Inverse Rule"),
+                 enumerate(context.get("inverse_rules", []), 1))
+    f.write("""            </div>
+
+            <div id="Tests" class="tabcontent">
+""")
+    _write_table(f, "Rule-Based Tests", ("Rule ID", "Inverse", "Test Input", "Expected Output"), (
+        (test.get("ruleid", ""), "Yes" if test.get("inverse", False) else "No",
+         _excerpt(test.get("testinput", ""), 100), _excerpt(test.get("expectedoutput", ""), 100))
+        for test in context.get("tests", [])
+    ))
+    _write_table(f, "Baseline Tests", ("#", "Test Input"), (
+        (i, _excerpt(test.get("testinput", ""), 150))
+        for i, test in enumerate(context.get("baseline_tests", []), 1)
+    ))
+    f.write("""            </div>
+""")
+
+
+def write_html_report(context: Dict[str, Any], test_results: Iterable[Dict[str, Any]],
+                      output_path: str) -> int:
+    """Write the HTML report of a run, section by section.
+
+    Test results are consumed one at a time and embedded as compact JSON
+    rows, parsed by the browser only when the Results tab is opened and shown
+    50 per page with filters by model, rule (inverse rules apart), compliance and text. Memory use
+    does not depend on the number of results.
+
+    Args:
+        context: Pipeline context with its summary
+        test_results: Test results, e.g. read back from a result sink
+        output_path: Path of the report
+
+    Returns:
+        Number of test results in the report
+    """
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(_HEAD)
+        _write_summary(f, context)
+        _write_rules_and_tests(f, context)
+        f.write(_RESULTS_TAB)
+
+        f.write('    <script type="application/json" id="results-data">[')
+        for result in test_results:
+            f.write(("," if count else "") + "\n" + _script_json(_result_row(result)))
+            count += 1
+        f.write("\n]</script>\n")
+
+        f.write(_SCRIPT % _script_json(list(RESULT_COLUMNS)))
+    return count
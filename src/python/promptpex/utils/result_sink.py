@@ -0,0 +1,86 @@
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+TEST_RESULTS_CSV_HEADER = "id,ruleid,rule,inverse,model,input,output,compliance\n"
+
+
+def _escape_csv_field(value: str) -> str:
+    return value.replace(",", "\\,").replace("\n", "\\n").replace("\"", "\"\"")
+
+
+def format_test_result_row(result: Dict[str, Any]) -> str:
+    """Format a test result as a line of test_results.csv."""
+    result_id = result.get("id", "")
+    ruleid = result.get("ruleid", "")
+    rule = _escape_csv_field(result.get("rule", ""))
+    inverse = "TRUE" if result.get("inverse", False) else "FALSE"
+    model = result.get("model", "")
+    input_text = _escape_csv_field(result.get("input", ""))
+    output_text = _escape_csv_field(result.get("output", ""))
+    compliance = result.get("compliance", "")
+    return f"{result_id},{ruleid},\"{rule}\",{inverse},{model},\"{input_text}\",\"{output_text}\",{compliance}\n"
+
+
+class ResultSink:
+    """Stream test results to JSONL and CSV files as they complete.
+
+    Results are written out instead of being kept in memory, so memory use
+    does not grow with the size of the test matrix. The JSONL file can be
+    read back lazily, one result at a time.
+    """
+
+    def __init__(self, directory: str, name: str = "test_results"):
+        """Initialize the sink.
+
+        Args:
+            directory: Directory receiving ``<name>.jsonl`` and ``<name>.csv``
+            name: Base name of the files
+        """
+        self.jsonl_path = os.path.join(directory, f"{name}.jsonl")
+        self.csv_path = os.path.join(directory, f"{name}.csv")
+        self.count = 0
+        self._lock = threading.Lock()
+        self._jsonl = None
+        self._csv = None
+
+    def open(self):
+        """Create the files, replacing those of a previous run."""
+        os.makedirs(os.path.dirname(self.jsonl_path) or ".", exist_ok=True)
+        self._jsonl = open(self.jsonl_path, 'w', encoding='utf-8')
+        self._csv = open(self.csv_path, 'w', encoding='utf-8')
+        self._csv.write(TEST_RESULTS_CSV_HEADER)
+        self.count = 0
+
+    def write(self, result: Dict[str, Any]):
+        """Append a test result to both files."""
+        line = json.dumps(result, ensure_ascii=False)
+        row = format_test_result_row(result)
+        with self._lock:
+            if self._jsonl is None:
+                raise RuntimeError("Result sink is not open")
+            self._jsonl.write(line + "\n")
+            self._csv.write(row)
+            self.count += 1
+
+    def close(self):
+        """Flush and close the files."""
+        with self._lock:
+            for f in (self._jsonl, self._csv):
+                if f:
+                    f.close()
+            self._jsonl = self._csv = None
+        logger.info(f"Streamed {self.count} test results to {self.jsonl_path}")
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Read the written results back, one at a time."""
+        if not os.path.exists(self.jsonl_path):
+            return
+        with open(self.jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,113 @@
+import time
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import metric_scope
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStep:
+    """A pipeline step that computes one context key from other context keys."""
+    
+    def __init__(self, key: str, label: str, inputs: List[str],
+                 func: Callable[[Dict[str, Any]], Any]):
+        """Initialize the step.
+        
+        Args:
+            key: Context key the step writes its result to
+            label: Log message printed when the step starts
+            inputs: Context keys the step reads
+            func: Function computing the result from the context
+        """
+        self.key = key
+        self.label = label
+        self.inputs = inputs
+        self.func = func
+
+
+class StepScheduler:
+    """Run pipeline steps as a dependency graph, concurrently where possible."""
+    
+    def __init__(self, steps: List[PipelineStep], max_workers: int = 1,
+                 on_complete: Optional[Callable[[str, Any], None]] = None):
+        """Initialize the scheduler.
+        
+        Args:
+            steps: Steps in a valid sequential order
+            max_workers: Maximum number of steps running at once; 1 runs the
+                steps sequentially in the given order
+            on_complete: Optional callback receiving the key and value of each
+                completed step
+        """
+        self.steps = steps
+        self.max_workers = max(1, max_workers)
+        self.on_complete = on_complete
+    
+    def run(self, context: Dict[str, Any]) -> Dict[str, float]:
+        """Run all steps, storing each result in the context.
+        
+        Inputs that no step produces are expected to already be in the context.
+        
+        Args:
+            context: Pipeline context, updated in place
+        
+        Returns:
+            Wall-clock seconds spent in each step, keyed by step key
+        
+        Raises:
+            ValueError: If the steps have missing or cyclic dependencies
+        """
+        timings: Dict[str, float] = {}
+        produced = {step.key for step in self.steps}
+        done = {key for step in self.steps for key in step.inputs if key not in produced}
+        pending = list(self.steps)
+        
+        if self.max_workers == 1:
+            for step in pending:
+                missing = [key for key in step.inputs if key not in done]
+                if missing:
+                    raise ValueError(f"Step '{step.key}' runs before its inputs: {missing}")
+                context[step.key], timings[step.key] = self._run_step(step, context)
+                self._complete(step, context)
+                done.add(step.key)
+            return timings
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while pending or running:
+                for step in [s for s in pending if all(key in done for key in s.inputs)]:
+                    if len(running) >= self.max_workers:
+                        break
+                    pending.remove(step)
+                    # Steps inherit the caller's context, e.g. its metric labels
+                    running[executor.submit(contextvars.copy_context().run, 
+                                            self._run_step, step, context)] = step
+                if not running:
+                    raise ValueError(f"Unsatisfiable step dependencies: {[s.key for s in pending]}")
+                
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    context[step.key], timings[step.key] = future.result()
+                    self._complete(step, context)
+                    done.add(step.key)
+        
+        return timings
+    
+    def _complete(self, step: PipelineStep, context: Dict[str, Any]):
+        """Notify the completion callback of a finished step."""
+        if self.on_complete:
+            self.on_complete(step.key, context[step.key])
+    
+    def _run_step(self, step: PipelineStep, context: Dict[str, Any]):
+        """Run a single step and measure its duration."""
+        logger.info(step.label)
+        start = time.perf_counter()
+        with metric_scope(step=step.key):
+            result = step.func(context)
+        elapsed = round(time.perf_counter() - start, 3)
+        logger.info(f"Finished '{step.key}' in {elapsed}s")
+        return result, elapsed
@@ -0,0 +1,32 @@
+from math import sqrt
+from statistics import NormalDist
+from typing import Tuple
+
+
+def wilson_interval(successes: int, trials: int, confidence: float) -> Tuple[float, float]:
+    """Wilson score interval of a success rate at the given confidence (e.g. 0.95)."""
+    if trials <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rate = successes / trials
+    center = (rate + z * z / (2 * trials)) / (1 + z * z / trials)
+    margin = z * sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials)) / (1 + z * z / trials)
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def outcome_stable(successes: int, trials: int, confidence: float) -> bool:
+    """Whether the majority outcome of repeated trials is established at the given confidence.
+
+    It is once the Wilson interval of the success rate lies entirely above
+    or below 1/2; trials split close to evenly never are.
+    """
+    low, high = wilson_interval(successes, trials, confidence)
+    return trials > 0 and (low > 0.5 or high < 0.5)
+
+
+def min_stable_runs(confidence: float, max_runs: int) -> int:
+    """Fewest trials after which unanimous outcomes are stable, at most ``max_runs``."""
+    for trials in range(1, max_runs + 1):
+        if outcome_stable(trials, trials, confidence):
+            return trials
+    return max_runs
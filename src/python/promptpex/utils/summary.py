@@ -0,0 +1,137 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def _percentage(count: int, total: int) -> float:
+    return round((count / total * 100) if total else 0, 1)
+
+
+class SummaryAggregator:
+    """Online aggregation of the run summary.
+
+    Counters are updated as pipeline steps and test results complete, so the
+    summary is available at any time without rescanning the results.
+    """
+
+    def __init__(self, model_order: Optional[List[str]] = None):
+        """Initialize empty counters.
+
+        Args:
+            model_order: Models in the order they are tested; per-model results are
+                reported in this order, whatever order the results arrive in
+        """
+        self.model_order = list(model_order or [])
+        self.total_rules = 0
+        self.inverse_rules = 0
+        self.grounded_rules = 0
+        self.rule_tests = 0
+        self.baseline_tests = 0
+        self.validity_checks = 0
+        self.valid_tests = 0
+        self.test_results = 0
+        self.rule_test_results = 0
+        self.compliant_tests = 0
+        self.model_results: Dict[str, Dict[str, int]] = {}
+        self.rule_results: Dict[Any, Dict[str, int]] = {}
+        self.run_results: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_context(cls, context: Dict[str, Any], test_results: Optional[Iterable[Dict[str, Any]]] = None,
+                     model_order: Optional[List[str]] = None) -> "SummaryAggregator":
+        """Aggregate a completed pipeline context.
+
+        Args:
+            context: Pipeline context
+            test_results: Test results, if not those of the context (e.g. streamed ones)
+            model_order: Models in the order they are tested
+        """
+        aggregator = cls(model_order)
+        for key in ("rules", "inverse_rules", "rule_evaluations", "tests",
+                    "baseline_tests", "test_validity"):
+            aggregator.add_step(key, context.get(key, []))
+        for result in context.get("test_results", []) if test_results is None else test_results:
+            aggregator.add_test_result(result)
+        return aggregator
+
+    def add_step(self, key: str, value: Any):
+        """Account for the value of a completed pipeline step.
+
+        Steps that do not contribute to the summary are ignored; test results are
+        added one by one with ``add_test_result``.
+        """
+        with self._lock:
+            if key == "rules":
+                self.total_rules = len(value)
+            elif key == "inverse_rules":
+                self.inverse_rules = len(value)
+            elif key == "rule_evaluations":
+                self.grounded_rules = sum(1 for r in value if r.get("grounded") == "ok")
+            elif key == "tests":
+                self.rule_tests = len(value)
+            elif key == "baseline_tests":
+                self.baseline_tests = len(value)
+            elif key == "test_validity":
+                self.validity_checks = len(value)
+                self.valid_tests = sum(1 for t in value if t.get("validity") == "ok")
+
+    def add_test_result(self, result: Dict[str, Any]):
+        """Account for one completed test result."""
+        with self._lock:
+            self.test_results += 1
+            model_stats = self.model_results.setdefault(result.get("model", "unknown"),
+                                                        {"total": 0, "ok": 0})
+            if "compliance" not in result:
+                return
+
+            ok = result.get("compliance") == "ok"
+            rule_stats = self.rule_results.setdefault(result.get("ruleid"), {"total": 0, "ok": 0})
+            run_stats = self.run_results.setdefault(self._run_index(result), {"total": 0, "ok": 0})
+            self.rule_test_results += 1
+            self.compliant_tests += ok
+            for stats in (model_stats, rule_stats, run_stats):
+                stats["total"] += 1
+                stats["ok"] += ok
+
+    def summary(self) -> Dict[str, Any]:
+        """Build the summary dictionary of the results aggregated so far."""
+        with self._lock:
+            return {
+                "total_rules": self.total_rules,
+                "inverse_rules": self.inverse_rules,
+                "grounded_rules": self.grounded_rules,
+                "grounded_percentage": _percentage(self.grounded_rules, self.total_rules),
+
+                "total_tests": self.rule_tests + self.baseline_tests,
+                "rule_tests": self.rule_tests,
+                "baseline_tests": self.baseline_tests,
+                "valid_tests": self.valid_tests,
+                "valid_percentage": _percentage(self.valid_tests, self.validity_checks),
+
+                "test_results": self.test_results,
+                "compliant_tests": self.compliant_tests,
+                "compliant_percentage": _percentage(self.compliant_tests, self.rule_test_results),
+
+                "model_results": {model: dict(self.model_results[model])
+                                  for model in self._ordered_models()}
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Build a progress snapshot: the summary plus per-rule and per-run compliance."""
+        snapshot = self.summary()
+        with self._lock:
+            snapshot["rule_results"] = {ruleid: dict(stats) for ruleid, stats in self.rule_results.items()}
+            snapshot["run_results"] = {run: dict(stats) for run, stats in sorted(self.run_results.items())}
+        return snapshot
+
+    def _ordered_models(self) -> List[str]:
+        known = [model for model in self.model_order if model in self.model_results]
+        return known + [model for model in self.model_results if model not in known]
+
+    @staticmethod
+    def _run_index(result: Dict[str, Any]) -> int:
+        """Read the run index from a result id (ruleid-hash-model-run)."""
+        try:
+            return int(str(result.get("id", "")).rsplit("-", 1)[-1])
+        except ValueError:
+            return 0
@@ -0,0 +1,183 @@
+import os
+import re
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+from .file_utils import parse_prompty_file, get_prompt_dir, read_prompt_file
+
+logger = logging.getLogger(__name__)
+
+# {{name}} or {{ name }}; expressions such as {{num_rules * num}} are left as is
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([A-Za-z_]\w*)\s*\}\}")
+
+# Frontmatter model parameters passed on to LLMClient.call_openai
+CALL_PARAMETERS = ("temperature", "max_tokens")
+
+_shared_registries: Dict[str, "TemplateRegistry"] = {}
+_shared_lock = threading.Lock()
+
+
+class Template:
+    """Prompt text with its ``{{name}}`` placeholders compiled once.
+
+    Rendering joins the literal chunks and the values in a single pass, so
+    values are never searched for placeholders themselves and the text is
+    not copied once per placeholder.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._chunks: List[str] = []
+        self._names: List[str] = []
+        self._raw: List[str] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self._chunks.append(text[position:match.start()])
+            self._names.append(match.group(1))
+            self._raw.append(match.group(0))
+            position = match.end()
+        self._chunks.append(text[position:])
+
+    @property
+    def placeholders(self) -> List[str]:
+        """Names of the placeholders, in order of first use."""
+        return list(dict.fromkeys(self._names))
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """Fill in the placeholders; placeholders without a value are kept as they are."""
+        if not self._names:
+            return self.text
+        parts = [self._chunks[0]]
+        for name, raw, chunk in zip(self._names, self._raw, self._chunks[1:]):
+            value = values.get(name)
+            parts.append(raw if value is None else str(value))
+            parts.append(chunk)
+        return "".join(parts)
+
+
+class PromptTemplate:
+    """A parsed .prompty file: frontmatter, and compiled system and user prompts."""
+
+    def __init__(self, name: str, content: str):
+        """Parse a .prompty file.
+
+        Args:
+            name: Name of the template (path relative to the prompts directory,
+                without extension)
+            content: Content of the file
+        """
+        self.name = name
+        self.frontmatter = parse_prompty_frontmatter(content)
+        system_prompt, user_prompt = parse_prompty_file(content)
+        self.system = Template(system_prompt)
+        self.user = Template(user_prompt)
+
+        parameters = (self.frontmatter.get("model") or {}).get("parameters") or {}
+        self.parameters = {key: parameters[key] for key in CALL_PARAMETERS if key in parameters}
+
+    def render(self, values: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+        """Render the system and user prompts.
+
+        Returns:
+            Tuple of (system_prompt, user_prompt)
+        """
+        values = values or {}
+        return self.system.render(values), self.user.render(values)
+
+
+def parse_prompty_frontmatter(content: str) -> Dict[str, Any]:
+    """Parse the YAML frontmatter of a .prompty file, or return {} if it has none."""
+    parts = content.split("---", 2)
+    if len(parts) < 3 or parts[0].strip():
+        return {}
+    try:
+        frontmatter = yaml.safe_load(parts[1])
+    except yaml.YAMLError as e:
+        logger.warning(f"Ignoring invalid prompty frontmatter: {e}")
+        return {}
+    return frontmatter if isinstance(frontmatter, dict) else {}
+
+
+class TemplateRegistry:
+    """Thread-safe cache of the parsed and compiled prompt templates of a directory.
+
+    Each template is read from disk and compiled once; ``load_all`` loads them
+    all up front, so that a missing or unreadable template fails at startup.
+    """
+
+    def __init__(self, prompt_dir: Optional[str] = None):
+        """Initialize the registry.
+
+        Args:
+            prompt_dir: Directory of the .prompty files; defaults to src/prompts
+        """
+        self.prompt_dir = prompt_dir or get_prompt_dir()
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> PromptTemplate:
+        """Get a template by name, e.g. "evals/eval_test_result".
+
+        Raises:
+            FileNotFoundError: If the template doesn't exist
+        """
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+                if template is None:
+                    path = os.path.join(self.prompt_dir, *name.split("/")) + ".prompty"
+                    template = PromptTemplate(name, read_prompt_file(path))
+                    self._templates[name] = template
+        return template
+
+    def load_all(self, required: Iterable[str] = ()) -> List[str]:
+        """Load every template of the directory, e.g. to fail fast on a broken one.
+
+        Args:
+            required: Names of templates that must exist
+
+        Returns:
+            Names of the loaded templates
+
+        Raises:
+            FileNotFoundError: If a required template doesn't exist
+        """
+        names = []
+        for root, _, files in os.walk(self.prompt_dir):
+            for file_name in sorted(files):
+                if file_name.endswith(".prompty"):
+                    relative = os.path.relpath(os.path.join(root, file_name[:-len(".prompty")]),
+                                               self.prompt_dir)
+                    names.append(relative.replace(os.sep, "/"))
+        for name in dict.fromkeys(names + list(required)):
+            self.get(name)
+        return names
+
+
+def get_template_registry(prompt_dir: Optional[str] = None,
+                          required: Iterable[str] = ()) -> TemplateRegistry:
+    """Get the process-wide template registry of a directory (default: src/prompts).
+
+    All the templates of the directory are loaded when its registry is created.
+
+    Args:
+        prompt_dir: Directory of the .prompty files
+        required: Names of templates that must exist
+
+    Raises:
+        FileNotFoundError: If a required template doesn't exist
+    """
+    prompt_dir = os.path.abspath(prompt_dir or get_prompt_dir())
+    with _shared_lock:
+        registry = _shared_registries.get(prompt_dir)
+        if registry is None:
+            registry = TemplateRegistry(prompt_dir)
+            registry.load_all(required)
+            _shared_registries[prompt_dir] = registry
+    for name in required:
+        registry.get(name)
+    return registry
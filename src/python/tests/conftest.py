@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the promptpex package importable when pytest runs from another directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import itertools
+
+import pytest
+
+from promptpex.utils import cache as cache_module
+from promptpex.utils.cache import ResponseCache
+
+REQUEST = ("gpt-4o", "system", "user", 0.0, 1000)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake wall clock advancing one second per reading."""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(ticks)))
+
+
+def test_key_is_deterministic():
+    assert ResponseCache.make_key(*REQUEST) == ResponseCache.make_key(*REQUEST)
+
+
+@pytest.mark.parametrize("position,value", [(0, "other"), (1, "other"), (2, "other"), (3, 0.5), (4, 10)])
+def test_key_depends_on_every_request_field(position, value):
+    changed = list(REQUEST)
+    changed[position] = value
+    assert ResponseCache.make_key(*changed) != ResponseCache.make_key(*REQUEST)
+
+
+def test_key_depends_on_sample_and_count():
+    key = ResponseCache.make_key(*REQUEST)
+    assert ResponseCache.make_key(*REQUEST, sample=0, n=1) == key
+    assert ResponseCache.make_key(*REQUEST, sample=1) != key
+    assert ResponseCache.make_key(*REQUEST, n=3) != key
+
+
+def test_get_and_set_count_hits_and_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get("missing") is None
+    cache.set("key", {"content": "answer"})
+    assert cache.get("key") == {"content": "answer"}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_entries_are_missed_and_pruned(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path), max_age_seconds=60)
+    cache.set("key", {"content": "answer"})
+    assert cache.get("key") is not None
+
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, "time", lambda: now + 120)
+    assert cache.get("key") is None
+    cache.prune()
+    count = cache._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    assert count == 0
+
+
+def test_least_recently_used_entries_are_evicted_above_the_size_limit(tmp_path, clock):
+    value = {"content": "x" * 80}
+    size = len('{"content": "' + "x" * 80 + '"}')
+    cache = ResponseCache(str(tmp_path), max_size_bytes=3 * size, prune_interval=1)
+    for key in ("a", "b", "c"):
+        cache.set(key, value)
+    assert cache.get("a") is not None
+
+    cache.set("d", value)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
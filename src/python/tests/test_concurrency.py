@@ -0,0 +1,33 @@
+import asyncio
+
+from promptpex.utils.concurrency import SharedLimit, map_ordered
+
+
+def test_map_ordered_keeps_the_input_order():
+    assert map_ordered(lambda x: x * x, range(10), max_workers=4) == [x * x for x in range(10)]
+
+
+def test_cancelled_waiters_give_their_permit_back():
+    limit = SharedLimit(2)
+
+    async def hold(event):
+        async with limit:
+            await event.wait()
+
+    async def scenario():
+        release = asyncio.Event()
+        holders = [asyncio.create_task(hold(release)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        waiters = [asyncio.create_task(hold(asyncio.Event())) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        release.set()
+        await asyncio.gather(*holders)
+        # Let the waiting threads hand their permits back
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    acquired = [limit._semaphore.acquire(blocking=False) for _ in range(3)]
+    assert acquired == [True, True, False]
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from promptpex.utils.credentials import CachedTokenProvider, async_token_provider
+
+
+class FakeCredential:
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.calls = []
+
+    def get_token(self, scope):
+        self.calls.append(threading.get_ident())
+        return SimpleNamespace(token=f"token-{len(self.calls)}", expires_on=time.time() + self.lifetime)
+
+
+def test_tokens_are_cached_until_close_to_expiry():
+    credential = FakeCredential()
+    provider = CachedTokenProvider(credential, refresh_margin=300)
+    assert provider() == provider() == "token-1"
+
+    credential.lifetime = 100
+    provider._token = None
+    assert provider() == "token-2"
+    assert provider() == "token-3"
+
+
+def test_async_refresh_runs_off_the_event_loop():
+    credential = FakeCredential()
+    provider = async_token_provider(CachedTokenProvider(credential))
+
+    async def scenario():
+        return threading.get_ident(), await provider(), await provider()
+
+    loop_thread, first, second = asyncio.run(scenario())
+    assert first == second == "token-1"
+    assert credential.calls and loop_thread not in credential.calls
+
+
+def test_plain_providers_are_called_off_the_event_loop():
+    callers = []
+
+    def provider():
+        callers.append(threading.get_ident())
+        return "token"
+
+    async def scenario():
+        return threading.get_ident(), await async_token_provider(provider)()
+
+    loop_thread, token = asyncio.run(scenario())
+    assert token == "token"
+    assert callers and loop_thread not in callers
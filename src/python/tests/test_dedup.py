@@ -0,0 +1,51 @@
+import pytest
+
+from promptpex.core import PythonPromptPex
+from promptpex.utils.metrics import MetricsRecorder
+from promptpex.utils.mock_client import MockLLMClient
+
+CONFIG = {"azure_endpoint": "https://mock", "azure_deployment": "mock", "api_version": "v"}
+MODELS = ["a", "b"]
+
+
+def _pipeline(max_concurrency, **options):
+    client = MockLLMClient(CONFIG, max_concurrency=max_concurrency, metrics=MetricsRecorder())
+    return PythonPromptPex(azure_config=CONFIG, llm_client=client, models_to_test=MODELS,
+                           max_concurrency=max_concurrency, runs_per_test=8, **options)
+
+
+def _tests(count):
+    # The inputs only differ by whitespace, so they are run once
+    return [{"ruleid": index, "rule": f"Rule {index}", "inverse": False,
+             "testinput": "Same" + " " * index + "input"} for index in range(1, count + 1)]
+
+
+def _output_requests(pipeline):
+    models = pipeline.llm_client.metrics.to_dict()["models"]
+    return sum(models[model]["requests"] for model in MODELS if model in models)
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+@pytest.mark.parametrize("multi_sample,requests_per_pair", [(True, 1), (False, 8)])
+def test_saved_calls_count_avoided_requests(max_concurrency, multi_sample, requests_per_pair):
+    pipeline = _pipeline(max_concurrency, multi_sample=multi_sample)
+    results = pipeline._run_tests("Say hi", _tests(4))
+
+    assert len(results) == 4 * len(MODELS) * 8
+    assert _output_requests(pipeline) == len(MODELS) * requests_per_pair
+    assert pipeline._dedup_stats["saved_calls"] == 3 * len(MODELS) * requests_per_pair
+    assert pipeline._put_outputs == {}
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+@pytest.mark.parametrize("multi_sample", [True, False])
+def test_requests_are_released_when_runs_stop_early(max_concurrency, multi_sample):
+    pipeline = _pipeline(max_concurrency, multi_sample=multi_sample, early_stop_confidence=0.95)
+    # Tests with odd rule ids stop after the first round, the others run to the end
+    pipeline._outcome_stable = lambda test, outcomes: test["ruleid"] % 2 == 1
+    results = pipeline._run_tests("Say hi", _tests(4))
+
+    first_round = len(pipeline._run_rounds()[0])
+    assert len(results) == 2 * len(MODELS) * (first_round + 8)
+    assert pipeline._put_outputs == {}
+    assert pipeline._open_pairs == {}
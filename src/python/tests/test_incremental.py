@@ -0,0 +1,31 @@
+import json
+
+from promptpex.utils.incremental import PreviousRun, diff_rules, load_results
+
+
+def test_diff_rules_matches_rules_by_content():
+    diff = diff_rules(["a", "b", "c"], ["b", "x", "a", "a"])
+    assert diff == {"unchanged": {1: 2, 3: 1}, "added": [2, 4], "removed": [3]}
+
+
+def test_diff_rules_of_identical_lists():
+    assert diff_rules(["a", "b"], ["a", "b"]) == {"unchanged": {1: 1, 2: 2}, "added": [], "removed": []}
+
+
+def test_diff_rules_from_nothing():
+    assert diff_rules([], ["a"]) == {"unchanged": {}, "added": [1], "removed": []}
+
+
+def test_previous_run_skips_failed_results(tmp_path):
+    path = tmp_path / "results.json"
+    results = [{"id": "t1", "output": "ok"}, {"id": "t2", "error": "timeout"}, {"output": "no id"}]
+    path.write_text(json.dumps({"name": "demo", "prompt": "Say hi", "test_results": results}))
+
+    context, loaded = load_results(str(path))
+    assert loaded == results
+
+    previous = PreviousRun.load(str(path))
+    assert list(previous.results) == ["t1"]
+    assert previous.provenance(testid=3) == {"run": "demo", "testid": 3}
+    assert not previous.prompt_changed("Say hi")
+    assert previous.prompt_changed("Say hello")
@@ -0,0 +1,51 @@
+from promptpex.utils.near_duplicates import (
+    MinHashLSH, find_near_duplicates, lsh_bands, minhash_signature, shingle_hashes, signature_similarity
+)
+
+TEXT = "Translate the following sentence into French: the weather is nice today."
+
+
+def test_shingles_ignore_case_and_whitespace():
+    assert shingle_hashes(TEXT.upper()) == shingle_hashes("  ".join(TEXT.split()))
+
+
+def test_signature_similarity():
+    signature = minhash_signature(shingle_hashes(TEXT))
+    assert len(signature) == 128
+    assert signature_similarity(signature, signature) == 1.0
+    other = minhash_signature(shingle_hashes("Summarize this article about volcanoes in two lines."))
+    assert signature_similarity(signature, other) < 0.2
+
+
+def test_lsh_bands_put_the_threshold_above_the_candidate_point():
+    assert lsh_bands(0.8, 128) == (16, 8)
+    bands, rows = lsh_bands(0.5, 128)
+    assert bands * rows == 128
+    assert (1 / bands) ** (1 / rows) <= 0.5
+
+
+def test_index_finds_the_most_similar_signature():
+    index = MinHashLSH(0.8)
+    index.add(0, minhash_signature(shingle_hashes("a completely different request")))
+    index.add(1, minhash_signature(shingle_hashes(TEXT)))
+    match = index.most_similar(minhash_signature(shingle_hashes(TEXT + "!")))
+    assert match is not None and match[0] == 1
+    assert index.most_similar(minhash_signature(shingle_hashes("nothing alike here"))) is None
+
+
+def test_near_duplicates_point_to_the_first_kept_text():
+    texts = [TEXT, "Write a haiku about autumn leaves falling.", TEXT.lower(), TEXT + " Thanks"]
+    duplicates = find_near_duplicates(texts)
+    assert set(duplicates) == {2, 3}
+    assert duplicates[2] == (0, 1.0)
+    assert duplicates[3][0] == 0
+
+
+def test_protected_texts_are_kept():
+    assert find_near_duplicates([TEXT, TEXT], protected={1}) == {}
+
+
+def test_threshold_controls_duplicates():
+    texts = [TEXT, TEXT.replace("French", "German")]
+    assert find_near_duplicates(texts, threshold=0.5)
+    assert not find_near_duplicates(texts, threshold=0.99)
@@ -0,0 +1,77 @@
+from promptpex.utils.parsers import ParseStats, parse_rule_id, parse_test_cases
+
+HEADER = "ruleid,testid,expectedoutput,reasoning,testinput"
+
+
+def test_csv_with_header_in_code_fence_after_prose():
+    result = parse_test_cases(f"Here are the tests:\n```csv\n{HEADER}\n1,1,ok,because,hello\n```\nDone.")
+    assert result.kind == "csv"
+    assert result.rows == [{"ruleid": "1", "testid": "1", "expectedoutput": "ok",
+                            "reasoning": "because", "testinput": "hello"}]
+
+
+def test_csv_without_header_uses_the_default_columns():
+    result = parse_test_cases("1,1,ok,because,hello")
+    assert result.rows[0]["testinput"] == "hello"
+
+
+def test_unquoted_commas_in_the_last_column_are_repaired():
+    result = parse_test_cases(f"{HEADER}\n1,1,ok,because,hello, world")
+    assert result.rows[0]["testinput"] == "hello, world"
+    assert result.recovered == 1
+
+
+def test_unclosed_quote_only_spoils_its_own_line():
+    content = f'{HEADER}\n1,1,ok,r,first\n2,2,"open,quote,r,second\n3,3,ok,r,third'
+    result = parse_test_cases(content)
+    assert [row["testinput"] for row in result.rows] == ["first", "third"]
+    assert result.dropped == 1
+
+
+def test_multiline_quoted_values_are_kept():
+    result = parse_test_cases(f'{HEADER}\n1,1,ok,r,"line one\nline two"')
+    assert result.rows[0]["testinput"] == "line one\nline two"
+
+
+def test_short_rows_and_rows_without_input_are_dropped():
+    result = parse_test_cases(f"{HEADER}\n1,1,ok\n2,2,ok,r,\n3,3,ok,r,kept")
+    assert [row["ruleid"] for row in result.rows] == ["3"]
+    assert result.dropped == 2
+
+
+def test_jsonl_skips_malformed_lines():
+    content = ('{"ruleid": 1, "testinput": "a"}\n'
+               '{"ruleid": 2, "testinput": \n'
+               '{"ruleid": 3, "testinput": ""}\n'
+               '{"Rule ID": 4, "Test_Input": "b"}')
+    result = parse_test_cases(content)
+    assert result.kind == "jsonl"
+    assert result.rows == [{"ruleid": "1", "testinput": "a"}, {"ruleid": "4", "testinput": "b"}]
+    assert result.dropped == 2
+
+
+def test_json_array_is_accepted():
+    result = parse_test_cases('```json\n[{"testinput": "a"}, {"testinput": "b"}]\n```')
+    assert [row["testinput"] for row in result.rows] == ["a", "b"]
+
+
+def test_empty_answer():
+    result = parse_test_cases("")
+    assert result.rows == []
+    assert result.kind == "none"
+
+
+def test_parse_rule_id():
+    assert [parse_rule_id(value) for value in ("2", "2.0", "rule 2", "R2", "", None)] == [2, 2, 2, 2, None, None]
+
+
+def test_stats_yield():
+    stats = ParseStats()
+    stats.add(parse_test_cases(f"{HEADER}\n1,1,ok,r,kept\n2,2,short"))
+    stats.add(parse_test_cases(""))
+    counts = stats.to_dict()
+    assert counts["responses"] == 2
+    assert counts["empty_responses"] == 1
+    assert counts["rows"] == 1
+    assert counts["dropped_rows"] == 1
+    assert counts["yield_percentage"] == 50.0
@@ -0,0 +1,24 @@
+from promptpex.utils import planner
+from promptpex.utils.planner import StepPlan, count_tokens, format_plan, plan_totals, tokenizer_name
+
+
+def _plan():
+    steps = {"intent": StepPlan(), "tests": StepPlan()}
+    steps["intent"].add(100, 50, 1)
+    steps["tests"].add(200, 300, 4)
+    steps = {name: step.to_dict() for name, step in steps.items()}
+    return {"prompt_file": "demo.prompty", "tokenizer": tokenizer_name(),
+            "steps": steps, "total": plan_totals(steps), "assumptions": {"rules": 10}}
+
+
+def test_count_tokens_falls_back_to_the_estimate(monkeypatch):
+    monkeypatch.setattr(planner, "tiktoken", None)
+    assert count_tokens("x" * 40) == 11
+    assert tokenizer_name().startswith("estimate")
+
+
+def test_plan_warns_about_estimated_token_counts(monkeypatch):
+    monkeypatch.setattr(planner, "tiktoken", None)
+    text = format_plan(_plan())
+    assert "Warning: tiktoken is not installed" in text
+    assert "demo.prompty" in text
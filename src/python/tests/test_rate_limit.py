@@ -0,0 +1,67 @@
+import pytest
+
+from promptpex.utils.rate_limit import AdaptiveConcurrency, RetryPolicy, TokenBucket
+
+
+def test_token_bucket_delays_once_empty():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0.0
+    # One token per second: a deficit of 30 tokens takes about 30 seconds
+    assert bucket.reserve(30) == pytest.approx(30, abs=0.5)
+
+
+def test_token_bucket_refund_restores_capacity():
+    bucket = TokenBucket(per_minute=60)
+    bucket.reserve(60)
+    bucket.refund(60)
+    assert bucket.reserve(30) == 0.0
+
+
+def test_token_bucket_refund_does_not_overflow():
+    bucket = TokenBucket(per_minute=60)
+    bucket.refund(1000)
+    assert bucket.tokens == bucket.capacity
+
+
+def test_concurrency_halves_on_throttle_down_to_the_minimum():
+    limit = AdaptiveConcurrency(maximum=8, minimum=2)
+    limits = []
+    for _ in range(4):
+        limit.on_throttle()
+        limits.append(limit.limit)
+    assert limits == [4, 2, 2, 2]
+
+
+def test_concurrency_grows_back_additively():
+    limit = AdaptiveConcurrency(maximum=8)
+    limit.on_throttle()
+    for _ in range(4):
+        limit.on_success()
+    assert 4 < limit.limit < 6
+    for _ in range(100):
+        limit.on_success()
+    assert limit.limit == 8
+
+
+def test_concurrency_slots_follow_the_limit():
+    limit = AdaptiveConcurrency(maximum=2)
+    assert limit.try_acquire()
+    assert limit.try_acquire()
+    assert not limit.try_acquire()
+
+    limit.release()
+    limit.on_throttle()
+    assert not limit.try_acquire()
+    limit.release()
+    assert limit.try_acquire()
+
+
+def test_retry_delay_backs_off_exponentially():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    for attempt, backoff in [(0, 1), (2, 4), (5, 10)]:
+        assert backoff / 2 <= policy.delay(attempt) <= backoff
+
+
+def test_retry_delay_honours_retry_after():
+    policy = RetryPolicy(base_delay=1.0)
+    assert 7 <= policy.delay(0, retry_after=7) <= 8
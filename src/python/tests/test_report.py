@@ -0,0 +1,34 @@
+import json
+import re
+
+from promptpex.utils.report import RESULT_COLUMNS, _result_row, write_html_report
+
+RESULTS = [
+    {"id": "r1", "ruleid": 1, "inverse": False, "model": "m", "input": "a", "output": "b", "compliance": "ok"},
+    {"id": "r2", "ruleid": 1, "inverse": True, "model": "m", "input": "c", "output": "d", "compliance": "err"},
+    {"id": "r3", "ruleid": None, "baseline": True, "model": "m", "input": "e", "error": "timeout"},
+]
+
+
+def _row(result):
+    return dict(zip(RESULT_COLUMNS, _result_row(result)))
+
+
+def test_rows_tell_rules_and_inverse_rules_apart():
+    rows = [_row(result) for result in RESULTS]
+    assert [(row["rule"], row["inverse"]) for row in rows] == [(1, "No"), (1, "Yes"), ("baseline", "No")]
+    assert [row["compliance"] for row in rows] == ["ok", "err", "error"]
+
+
+def test_report_embeds_every_result(tmp_path):
+    path = tmp_path / "report.html"
+    summary = {"total_rules": 1, "grounded_rules": 1, "grounded_percentage": 100.0,
+               "total_tests": 3, "valid_tests": 3, "valid_percentage": 100.0,
+               "test_results": 3, "compliant_tests": 1, "compliant_percentage": 33.3}
+    context = {"name": "demo", "summary": summary, "rules": ["rule"], "inverse_rules": ["not rule"]}
+    assert write_html_report(context, iter(RESULTS), str(path)) == 3
+
+    html = path.read_text(encoding="utf-8")
+    data = re.search(r'<script type="application/json" id="results-data">(.*?)</script>', html, re.S)
+    assert [row[RESULT_COLUMNS.index("id")] for row in json.loads(data.group(1))] == ["r1", "r2", "r3"]
+    assert "<th>Inverse</th>" in html
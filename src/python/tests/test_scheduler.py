@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from promptpex.utils.scheduler import PipelineStep, StepScheduler
+
+
+def _diamond(order):
+    lock = threading.Lock()
+
+    def step(key, value):
+        def func(context):
+            with lock:
+                order.append(key)
+            return value(context)
+        return func
+
+    return [
+        PipelineStep("a", "a", ["seed"], step("a", lambda c: c["seed"] + 1)),
+        PipelineStep("b", "b", ["a"], step("b", lambda c: c["a"] * 2)),
+        PipelineStep("c", "c", ["a"], step("c", lambda c: c["a"] * 3)),
+        PipelineStep("d", "d", ["b", "c"], step("d", lambda c: c["b"] + c["c"])),
+    ]
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_steps_run_after_their_inputs(max_workers):
+    order = []
+    context = {"seed": 1}
+    timings = StepScheduler(_diamond(order), max_workers=max_workers).run(context)
+
+    assert context["d"] == 2 * 2 + 2 * 3
+    assert set(timings) == {"a", "b", "c", "d"}
+    assert order[0] == "a"
+    assert order[-1] == "d"
+
+
+def test_sequential_run_keeps_the_given_order():
+    order = []
+    StepScheduler(_diamond(order), max_workers=1).run({"seed": 0})
+    assert order == ["a", "b", "c", "d"]
+
+
+def test_completion_callback_sees_every_step():
+    completed = {}
+    StepScheduler(_diamond([]), max_workers=2,
+                  on_complete=lambda key, value: completed.update({key: value})).run({"seed": 0})
+    assert completed == {"a": 1, "b": 2, "c": 3, "d": 5}
+
+
+def test_sequential_step_before_its_inputs_is_rejected():
+    steps = [
+        PipelineStep("b", "b", ["a"], lambda c: c["a"]),
+        PipelineStep("a", "a", [], lambda c: 1),
+    ]
+    with pytest.raises(ValueError):
+        StepScheduler(steps, max_workers=1).run({})
+
+
+def test_cyclic_dependencies_are_rejected():
+    steps = [
+        PipelineStep("a", "a", ["b"], lambda c: 1),
+        PipelineStep("b", "b", ["a"], lambda c: 2),
+    ]
+    with pytest.raises(ValueError):
+        StepScheduler(steps, max_workers=2).run({})
@@ -0,0 +1,36 @@
+import pytest
+
+from promptpex.utils.stopping import min_stable_runs, outcome_stable, wilson_interval
+
+
+def test_wilson_interval_without_trials_is_uninformative():
+    assert wilson_interval(0, 0, 0.95) == (0.0, 1.0)
+
+
+def test_wilson_interval_contains_the_observed_rate():
+    low, high = wilson_interval(7, 10, 0.95)
+    assert low < 0.7 < high
+    assert (low, high) == pytest.approx((0.3968, 0.8922), abs=1e-4)
+
+
+def test_wilson_interval_narrows_with_more_trials():
+    low, high = wilson_interval(70, 100, 0.95)
+    assert high - low < 0.8922 - 0.3968
+
+
+def test_unanimous_outcomes_become_stable():
+    assert not outcome_stable(3, 3, 0.95)
+    assert outcome_stable(4, 4, 0.95)
+    assert outcome_stable(0, 4, 0.95)
+
+
+def test_split_outcomes_are_not_stable():
+    assert not outcome_stable(3, 5, 0.95)
+    assert not outcome_stable(50, 100, 0.95)
+    assert not outcome_stable(0, 0, 0.95)
+
+
+def test_min_stable_runs():
+    assert min_stable_runs(0.95, 10) == 4
+    assert min_stable_runs(0.99, 10) > 4
+    assert min_stable_runs(0.99, 3) == 3